@@ -1,5 +1,8 @@
-from openai import OpenAI
 import re
+from src.llm.client_pool import get_client_pool
+from src.llm.llm_handler import estimate_tokens
+from src.llm.scheduler import get_scheduler
+from src.llm.usage import completion_tokens
 
 class PatientAgent:
     def __init__(self, patient_id, model_config, mode=1):
@@ -21,13 +24,14 @@ class PatientAgent:
         self.total_prompt_tokens = 0  # 提示词token统计
         self.total_completion_tokens = 0  # 回复token统计
         
-        # 初始化OpenAI客户端
-        self.client = OpenAI(
-            api_key=model_config['api_key'],
-            base_url=model_config['base_url']
-        )
+        # 使用进程级共享的异步客户端
+        self.pool = get_client_pool()
+        self.client = self.pool.get_client(model_config)
         self.model = model_config['model']
         self.parameters = model_config.get('parameters', {})
+        # 模拟病人的请求优先级低于真实问诊
+        self.scheduler = get_scheduler(model_config.get('scheduler'))
+        self.priority = model_config.get('priority', 'synthetic')
         
     def clear_current_item_history(self):
         """清空当前条目的对话历史"""
@@ -62,12 +66,19 @@ class PatientAgent:
                     "content": msg["content"]
                 })
             
-            # 调用API生成回答
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                **self.parameters
-            )
+            # 调用API生成回答，预估 token 数参与 TPM 限流，完成后按实际用量更新窗口
+            estimated = sum(estimate_tokens(m['content']) for m in messages)
+            estimated += self.parameters.get('max_tokens', 500) // 2
+            completion = await self.pool.run(self.scheduler.call(
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    **self.parameters
+                ),
+                priority=self.priority,
+                estimated_tokens=estimated,
+                tokens_of=completion_tokens
+            ))
             
             # 更新token统计
             usage = completion.usage
@@ -9,18 +9,35 @@ import io
 import numpy as np
 import traceback
 import wave
+import queue
+import threading
+import itertools
+import time
+from concurrent.futures import CancelledError
 
 # 添加项目根目录到 Python 路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from flask import Flask, render_template, request, session, redirect, url_for, jsonify
-from flask_socketio import emit
+from flask_socketio import emit, join_room, leave_room
+from eventlet import tpool
 import asyncio
 from core.assessment_framework import AssessmentFramework
+from src.core.batch_rescore import BatchRescorer
 from utils.globals import socketio, init_socketio
 from utils.prompt_parser import PromptParser
-from speech.speech_recognition import SpeechRecognition
+from src.utils.debug_feed import LLMDebugFeed, DEBUG_ROOM
+from src.llm.client_pool import get_client_pool
+from src.llm.usage import global_usage
+from src.llm.scheduler import get_scheduler, LLMUnavailableError
+from src.llm.hedging import get_hedge_tracker
+from speech.streaming_asr import StreamingASR
+from speech.asr_queue import ASRQueue
+from speech.asr_profiles import ASR_PROFILES
+from speech.asr_loader import BackgroundRecognizer
+from speech.audio_io import decode_audio_payload
 from speech.text_to_speech import TextToSpeech
+from speech.sentence_splitter import SentenceSplitter
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 
@@ -28,14 +45,90 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'hamd2024_secure_key_!@#$%^&*()'
 init_socketio(app)
 
+# 管理员专用的 LLM 消息调试频道（需要管理员主动订阅）
+debug_feed = LLMDebugFeed(socketio)
+
 # 初始化语音合成器和语音识别器
-tts = TextToSpeech()
-speech_recognizer = SpeechRecognition()
+tts_config = {
+    # 合成过的语音按 (音色, 文本哈希, 格式) 缓存在内存和磁盘中
+    'cache_dir': os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tts_cache"),
+    'cache_items': 256,
+    # 边合成边以 speech_chunk 事件发送音频分片；False 时合成完整段落后一次发送
+    'stream': True,
+    # 合成在常驻的后台事件循环中执行，不占用 eventlet 主循环；最多同时合成 max_concurrency 条
+    'runtime': {'max_concurrency': 4}
+}
+tts = TextToSpeech(tts_config)
+tts_stream_ids = itertools.count(1)
+
+# 语音识别配置
+# 排队过长时降级使用的轻量配置档（例如 CPU 节点上的 'small-int8'），为空时不降级
+asr_fallback_profile = os.environ.get('ASR_FALLBACK_PROFILE') or None
+asr_config = {
+    # 'process'：在独立进程中加载模型，Web 进程不导入 torch；'inprocess'：在本进程加载模型
+    'backend': os.environ.get('ASR_BACKEND', 'process'),
+    'worker': {
+        'processes': 1,            # 识别进程数，每个进程各加载一份模型
+        'heartbeat_timeout': 30.0, # 心跳超时后重启识别进程（秒）
+        'request_timeout': 120.0   # 单次识别超时后重启识别进程（秒）
+    },
+    'model': {
+        # 配置档见 speech/asr_profiles.py：large、large-f32、large-int8、medium-int8、small-int8
+        'profile': os.environ.get('ASR_PROFILE', 'large'),
+        'fallback_profile': asr_fallback_profile,
+        'preload_fallback': True,  # 启动时预先加载降级模型
+        'cpu_threads': None,       # CPU 推理线程数，为空时使用配置档的设置
+        'num_workers': 2           # 允许同时解码的线程数，应不小于 queue.workers
+    },
+    'queue': {
+        'fallback_profile': asr_fallback_profile,
+        'fallback_depth': 6,       # 待识别条数达到该值时改用轻量配置档
+        'recover_depth': 2,        # 降到该值以下时恢复
+        'workers': 2,              # 批处理线程数
+        'max_batch_size': 8,       # 每批最多合并的语音条数
+        'max_wait': 0.05           # 凑批的最长等待时间（秒）
+    },
+    'streaming': {
+        'enabled': True,           # 录音过程中持续上传 PCM 并推送中间识别结果
+        'partial_interval': 0.8,   # 中间结果的最小间隔（秒）
+        'holdback': 1.5,           # 末尾暂不确认的音频时长（秒）
+        'workers': 2               # 流式解码线程数
+    },
+    'vad': {
+        'enabled': True,           # 识别前裁掉首尾静音、跳过没有语音的录音
+        'silero': True,            # 能量裁剪后用 Silero VAD 精修边界（需要 onnxruntime）
+        'end_silence': 1.0         # 流式录音中说话后静音超过该时长，通知客户端停止录音（秒）
+    }
+}
+recognizer_options = {**asr_config['model'], 'vad': asr_config['vad']}
+if asr_config['backend'] == 'process':
+    from speech.asr_worker import ASRWorkerPool
+    speech_recognizer = ASRWorkerPool(asr_config['worker'], recognizer_options)
+else:
+    # 在后台线程中加载并预热模型，不阻塞 Web 服务启动
+    speech_recognizer = BackgroundRecognizer('speech.speech_recognition:SpeechRecognition', recognizer_options)
+asr_queue = ASRQueue(speech_recognizer, asr_config['queue'])
+streaming_asr = StreamingASR(speech_recognizer, asr_config['streaming'], asr_config['vad'])
 
 # 配置访问密码
 ACCESS_CODE = "hamd2024"  # 普通用户密码
 ADMIN_CODE = "hamd2024_admin"  # 管理员密码
 
+# 服务启动时间，用于健康检查
+started_at = datetime.now()
+
+def asr_not_ready(sid):
+    """语音识别模型尚未就绪时提示客户端，返回 True 表示应丢弃本次音频"""
+    if speech_recognizer.is_ready():
+        return False
+    socketio.emit('asr_not_ready', room=sid)
+    socketio.emit('message', {
+        'type': 'message',
+        'role': 'system',
+        'content': "语音识别模型正在加载，请稍候几秒再说话，或先使用文字输入。"
+    }, room=sid)
+    return True
+
 def check_auth():
     """检查用户是否已认证"""
     return session.get('authenticated', False)
@@ -47,12 +140,39 @@ def check_admin():
 # 配置模型参数
 model_config = {
     'api_key': os.getenv("DASHSCOPE_API_KEY"),
-    'base_url': "https://dashscope.aliyuncs.com/compatible-mode/v1",
+    # 设置 LLM_BASE_URL 可以切换到本地模拟服务（src/tests/mock_llm_server.py）
+    'base_url': os.getenv("LLM_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
     'model': 'qwen-max',
     'parameters': {
         'temperature': 0.7,      # 温度参数，控制输出的随机性，范围 0-1
         'top_p': 0.6,           # 控制输出的多样性，范围 0-1
         'max_tokens': 1500,     # 最大输出 token 数
+    },
+    'timeout': 60,              # 单次调用超时（秒）
+    'stream': True,             # 流式生成回复，边生成边推送给前端
+    'structured_output': False, # 使用 submit_score / reply 工具调用决定评分或追问，减少二次调用
+    'prompt_cache': 'implicit', # 上下文缓存模式：implicit 自动前缀缓存，explicit 显式标记缓存位置
+    'history': {
+        'token_budget': 1500,          # 每次调用中条目对话历史的 token 预算，超出后较早的对话压缩为摘要
+        'keep_turns': 2,               # 始终原样保留的最近对话轮数
+        'summary_model': 'qwen-turbo'  # 生成摘要使用的低成本模型
+    },
+    'pool': {
+        'max_connections': 100,          # 进程内共享连接池的最大连接数
+        'max_keepalive_connections': 20  # 保持 keep-alive 的空闲连接数
+    },
+    'priority': 'live',         # 请求优先级：live 真实问诊，synthetic 模拟病人，batch 批量重评
+    'turn_deadline': 45,        # 每轮问诊（含排队、重试和二次调用）的截止时间（秒）
+    'scheduler': {
+        'max_concurrency': 16,        # 进程内同时进行的 LLM 请求上限
+        'live_reserved': 4,           # 为真实问诊预留的并发名额
+        'tokens_per_minute': None,    # 账号的每分钟 token 上限，None 表示不限制
+        'max_retries': 4              # 429 / 5xx 的最大重试次数
+    },
+    'hedge': {
+        'enabled': False,   # 首个 token 超过最近延迟的 p95 仍未到达时，再发一个对冲请求
+        'percentile': 95,
+        'fallback': None    # 对冲目标，如 {'base_url': ..., 'model': 'qwen-plus'}；None 表示向同一接口重发
     }
 }
 
@@ -60,21 +180,74 @@ model_config = {
 root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 prompt_file_path = os.path.join(root_dir, "newprompt.txt")
 
+# 评估完成时的提示语（启动时预先合成语音）
+COMPLETION_MESSAGE = '评估已完成，感谢您的参与！您现在可以点击右上角的"PHQ-9自评"按钮进行自评。'
+
 # 用户评估框架字典
 user_frameworks = {}
 
+# 上次预合成问题语音时提示词文件的修改时间
+tts_prompt_mtime = {'value': None}
+
+def presynthesize_questions():
+    """提示词文件有变化时，在后台线程中预先合成全部问题和完成提示的语音"""
+    try:
+        mtime = os.path.getmtime(prompt_file_path)
+    except OSError:
+        return
+    if tts_prompt_mtime['value'] == mtime:
+        return
+    tts_prompt_mtime['value'] = mtime
+    
+    def run():
+        parser = PromptParser(prompt_file_path)
+        parser.parse_file()
+        texts = [PromptParser.get_question(prompt) for prompt in parser.prompts.values()]
+        texts.append(COMPLETION_MESSAGE)
+        synthesized, cached = tts.presynthesize(texts)
+        print(f"问题语音预合成完成：新合成 {synthesized} 条，已缓存 {cached} 条")
+    
+    # edge-tts 合成是阻塞调用，放在独立线程中，不占用 eventlet 主循环
+    threading.Thread(target=run, name='tts-presynthesize', daemon=True).start()
+
+# 当前的批量重评任务（同一时间只运行一个）
+rescore_job = {'rescorer': None, 'report': None, 'error': None}
+
+def wait_for_future(future, interval=0.01, events=None, on_event=None):
+    """在 eventlet 协程中等待跨线程的 Future，等待期间让出控制权
+
+    如果提供了 events 队列，等待期间会把队列中的事件依次交给 on_event 处理，
+    保证跨线程产生的事件在 eventlet 协程中发送。
+    """
+    while True:
+        done = future.done()
+        if events is not None:
+            while True:
+                try:
+                    event = events.get_nowait()
+                except queue.Empty:
+                    break
+                on_event(event)
+        if done:
+            break
+        socketio.sleep(interval)
+    return future.result()
+
 def get_framework(sid):
     """获取或创建用户的评估框架"""
     if sid not in user_frameworks:
+        # 提示词文件更新后重新预合成问题语音
+        presynthesize_questions()
         framework = AssessmentFramework(prompt_file_path, model_config)
         framework.initialize_items_from_prompts()
+        framework.llm_handler.debug_hook = lambda item_id, messages: debug_feed.publish(sid, item_id, messages)
         user_frameworks[sid] = framework
     return user_frameworks[sid]
 
 @app.route('/')
 def index():
     """显示主页面"""
-    return render_template('index.html')
+    return render_template('index.html', streaming_asr=asr_config['streaming']['enabled'])
 
 @app.route('/phq9')
 def phq9():
@@ -152,6 +325,9 @@ def handle_connect():
 def handle_disconnect():
     """清理用户的评估框架"""
     sid = request.sid
+    debug_feed.unsubscribe(sid)
+    streaming_asr.discard(sid)
+    speech_jobs.discard(sid)
     if sid in user_frameworks:
         # 保存最终结果
         framework = user_frameworks[sid]
@@ -159,22 +335,241 @@ def handle_disconnect():
             framework.save_assessment_result()
         del user_frameworks[sid]
 
+@socketio.on('subscribe_llm_debug')
+def handle_subscribe_llm_debug():
+    """管理员订阅 LLM 消息调试频道"""
+    if not check_admin():
+        return False
+    join_room(DEBUG_ROOM)
+    debug_feed.subscribe(request.sid)
+    return True
+
+@socketio.on('unsubscribe_llm_debug')
+def handle_unsubscribe_llm_debug():
+    leave_room(DEBUG_ROOM)
+    debug_feed.unsubscribe(request.sid)
+
 @socketio.on('message', namespace='/')
 def handle_system_message(data):
     """处理系统消息，生成语音"""
     if data.get('content'):
         generate_speech(data['content'], request.sid)
 
+class SpeechJobs:
+    """按会话跟踪语音合成任务
+
+    同一会话中相同文本的朗读请求，在已有任务未结束或刚请求过（coalesce_window 秒内）时合并为一次；
+    患者开始说话或发送新输入时，取消该会话所有未完成的合成任务。
+    """
+    
+    def __init__(self, coalesce_window=2.0):
+        self.coalesce_window = coalesce_window
+        self.pipelines = {}   # sid -> 未结束的 SpeechPipeline 列表
+        self.recent = {}      # sid -> {文本: 请求时间}
+        self.counters = {'requests': 0, 'coalesced': 0, 'cancelled': 0, 'saved': 0}
+        self._lock = threading.Lock()
+    
+    def claim(self, sid, text):
+        """登记一次整段文本的朗读请求，与未结束或刚请求过的相同文本重复时返回 False"""
+        now = time.monotonic()
+        with self._lock:
+            self.counters['requests'] += 1
+            recent = self.recent.setdefault(sid, {})
+            for key in [key for key, at in recent.items() if now - at > self.coalesce_window]:
+                del recent[key]
+            pending = any(text in pipeline.texts for pipeline in self.pipelines.get(sid, []))
+            if pending or text in recent:
+                self.counters['coalesced'] += 1
+                self.counters['saved'] += 1
+                return False
+            recent[text] = now
+            return True
+    
+    def add(self, sid, pipeline):
+        with self._lock:
+            self.pipelines.setdefault(sid, []).append(pipeline)
+    
+    def remove(self, sid, pipeline):
+        with self._lock:
+            pipelines = self.pipelines.get(sid, [])
+            if pipeline in pipelines:
+                pipelines.remove(pipeline)
+            if not pipelines:
+                self.pipelines.pop(sid, None)
+    
+    def cancel(self, sid):
+        """取消会话中所有未完成的语音（患者插话或有新输入时调用）"""
+        with self._lock:
+            pipelines = list(self.pipelines.get(sid, []))
+            self.recent.pop(sid, None)
+        for pipeline in pipelines:
+            pipeline.cancel()
+    
+    def discard(self, sid):
+        self.cancel(sid)
+        with self._lock:
+            self.pipelines.pop(sid, None)
+    
+    def count(self, cancelled=0, saved=0):
+        with self._lock:
+            self.counters['cancelled'] += cancelled
+            self.counters['saved'] += saved
+    
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                'active_sessions': len(self.pipelines),
+                'active_streams': sum(len(pipelines) for pipelines in self.pipelines.values())
+            }
+
+speech_jobs = SpeechJobs()
+
+class SpeechPipeline:
+    """把若干段文本依次合成，作为同一段流式语音（speech_chunk / speech_end）发送给客户端
+
+    feed() 接收 LLM 回复的增量文本，每凑成一句就提交合成；say() 直接提交整段文本。
+    各句在合成运行时中并发合成，音频分片严格按句子顺序发送，
+    这样第一句播放时后面的句子还在生成和合成。
+    """
+    
+    def __init__(self, sid):
+        self.sid = sid
+        self.stream_id = next(tts_stream_ids)
+        self.splitter = SentenceSplitter()
+        self.jobs = queue.Queue()
+        self.pending = []   # 尚未发送完的合成任务
+        self.text = ''      # 本段已接收的文本
+        self.texts = set()  # 已提交合成的文本，用于合并重复请求
+        self.sent = 0
+        self.failed = False
+        self.closed = False
+        speech_jobs.add(sid, self)
+        socketio.start_background_task(self._run)
+    
+    def say(self, text):
+        if self.closed:
+            return
+        self.texts.add(text)
+        job = {'chunks': queue.Queue(), 'cancelled': False}
+        job['future'] = tts.synthesize(text, on_chunk=job['chunks'].put)
+        self.pending.append(job)
+        self.jobs.put(job)
+    
+    def feed(self, delta):
+        if self.closed:
+            return
+        self.text += delta
+        for sentence in self.splitter.feed(delta):
+            self.say(sentence)
+    
+    def reset(self):
+        """LLM 撤回了已展示的回复：取消还没播放的句子，已发出的语音让前端停止"""
+        self.text = ''
+        self.splitter.reset()
+        self._cancel_pending()
+        if self.sent:
+            socketio.emit('stop_speech', room=self.sid)
+            # 之后的句子作为新的一段语音发送
+            self.stream_id = next(tts_stream_ids)
+            self.sent = 0
+    
+    def finish(self, final_text=None):
+        """回复结束：补上流式阶段没有收到的部分，合成最后半句"""
+        if self.closed:
+            return
+        if final_text and final_text.startswith(self.text):
+            self.feed(final_text[len(self.text):])
+        rest = self.splitter.flush()
+        if rest:
+            self.say(rest)
+        self.close()
+    
+    def cancel(self):
+        """取消还没播放完的句子并结束本段语音（前端已通过 stop_speech 停止播放）"""
+        self.splitter.reset()
+        self._cancel_pending()
+        self.close()
+    
+    def _cancel_pending(self):
+        saved = 0
+        for job in self.pending:
+            job['cancelled'] = True
+            # 缓存命中或已经合成完的任务无法取消，只是不再发送
+            if job['future'].cancel():
+                saved += 1
+        speech_jobs.count(cancelled=len(self.pending), saved=saved)
+        self.pending = []
+        self.texts = set()
+    
+    def close(self):
+        """不再接收文本（未成句的部分丢弃），已提交的句子播放完后结束本段语音"""
+        if not self.closed:
+            self.closed = True
+            self.jobs.put(None)
+    
+    def _run(self):
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                socketio.sleep(0.02)
+                continue
+            if job is None:
+                break
+            try:
+                wait_for_future(
+                    job['future'],
+                    interval=0.02,
+                    events=job['chunks'],
+                    on_event=lambda data, job=job: self._emit_chunk(job, data)
+                )
+            except (Exception, CancelledError) as e:
+                if not job['cancelled']:
+                    print(f"流式语音合成错误: {str(e)}")
+                    self.failed = True
+            if job in self.pending:
+                self.pending.remove(job)
+        speech_jobs.remove(self.sid, self)
+        
+        if self.sent:
+            # 有句子合成失败时仍然结束本段，前端播放已收到的音频
+            socketio.emit('speech_end', {'stream_id': self.stream_id, 'chunks': self.sent}, room=self.sid)
+        elif self.failed:
+            socketio.emit('tts_error', {
+                'message': '语音合成暂时不可用，请阅读文本内容'
+            }, room=self.sid)
+    
+    def _emit_chunk(self, job, data):
+        if job['cancelled']:
+            return
+        socketio.emit('speech_chunk', {
+            'stream_id': self.stream_id,
+            'seq': self.sent,
+            'mime': tts.mime_type,
+            'audio': data
+        }, room=self.sid)
+        self.sent += 1
+
 def generate_speech(text, sid):
     """生成语音并发送到客户端"""
     try:
+        # 同一段文本可能从多处触发朗读（例如旧版前端回传的 message），只合成一次
+        if not speech_jobs.claim(sid, text):
+            print(f"合并重复的语音请求: {text[:30]}...")
+            return
         print(f"开始生成语音: {text[:30]}...")
         
         # 使用后台任务生成语音
         def generate_audio():
+            if tts_config['stream']:
+                pipeline = SpeechPipeline(sid)
+                pipeline.say(text)
+                pipeline.finish()
+                return
             try:
                 # 生成语音
-                audio_data = tts.speak(text)
+                audio_data = base64.b64encode(wait_for_future(tts.synthesize(text), interval=0.02)).decode('utf-8')
                 if audio_data:
                     print(f"语音生成成功，数据长度: {len(audio_data)}")
                     # 发送给客户端
@@ -224,16 +619,66 @@ def handle_message(data):
         # 获取当前条目的历史对话
         history = framework.conversation_history[current_item.item_id][:-1]
         
+        # 流式模式下，回复增量先放入队列，再由 eventlet 协程推送给前端
+        deltas = queue.Queue()
+        
+        def on_delta(text, reset=False):
+            deltas.put({'role': 'assistant', 'delta': text, 'reset': reset})
+        
+        # 新的回答到达，之前没播放完的语音不再需要
+        speech_jobs.cancel(sid)
+        
+        # 流式回复时按句切分，边生成边合成语音
+        speech = SpeechPipeline(sid) if model_config.get('stream') and tts_config['stream'] else None
+            
+        def emit_delta(data):
+            socketio.emit('message_delta', data, room=sid)
+            if speech:
+                if data['reset']:
+                    speech.reset()
+                else:
+                    speech.feed(data['delta'])
+        
         async def process():
             # 将问题作为参数传递给 process_response
-            result = await framework.process_response(user_response, history, question)
+            result = await framework.process_response(
+                user_response, history, question,
+                on_delta=on_delta if model_config.get('stream') else None
+            )
             return result
             
         def async_process():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(process())
-            loop.close()
+            try:
+                process_and_reply()
+            finally:
+                # 没有朗读回复时（评分、出错）结束本段语音
+                if speech:
+                    speech.close()
+        
+        def process_and_reply():
+            # 在共享的 LLM 事件循环上执行，不阻塞 eventlet 主循环
+            try:
+                result = wait_for_future(
+                    get_client_pool().submit(process()),
+                    events=deltas,
+                    on_event=emit_delta
+                )
+            except Exception as e:
+                print(f"评估调用失败: {str(e)}")
+                # 撤回本次回答，患者可以重新作答
+                entries = framework.conversation_history[current_item.item_id]
+                if entries and entries[-1] == {'user': user_response}:
+                    entries.pop()
+                if isinstance(e, LLMUnavailableError):
+                    content = "系统暂时繁忙，请稍后重新回答刚才的问题。"
+                else:
+                    content = "处理回答时出现问题，请稍后重新回答刚才的问题。"
+                socketio.emit('message', {
+                    'type': 'message',
+                    'role': 'system',
+                    'content': content
+                }, room=sid)
+                return
             
             if result['type'] == 'score':
                 if not framework.save_progress():
@@ -264,7 +709,7 @@ def handle_message(data):
                     print("所有条目评估完成")
                     framework.save_assessment_result()
                     
-                    completion_message = '评估已完成，感谢您的参与！您现在可以点击右上角的"PHQ-9自评"按钮进行自评。'
+                    completion_message = COMPLETION_MESSAGE
                     
                     # 发送完成消息，将触发语音生成
                     message_data = {
@@ -291,8 +736,11 @@ def handle_message(data):
                     }
                     socketio.emit('message', message_data, room=sid)
                     
-                    # 单独触发语音生成，确保助手消息被朗读
-                    generate_speech(response, sid)
+                    # 单独触发语音生成，确保助手消息被朗读（流式时只需合成最后半句）
+                    if speech:
+                        speech.finish(response)
+                    else:
+                        generate_speech(response, sid)
         
         socketio.start_background_task(async_process)
         
@@ -584,6 +1032,164 @@ def get_all_patients():
         print(f"获取患者列表时出错: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/get_llm_usage')
+def get_llm_usage():
+    """获取进程内按条目统计的 LLM token 用量、上下文缓存命中率和调度状态"""
+    if not check_auth() or not check_admin():
+        return jsonify({'error': '未授权访问'}), 401
+    return jsonify({
+        **global_usage.summary(),
+        'scheduler': get_scheduler(model_config.get('scheduler')).stats(),
+        'hedge': get_hedge_tracker(model_config.get('hedge')).stats()
+    })
+
+@app.route('/healthz')
+def healthz():
+    """存活检查：进程能响应请求即返回 200"""
+    return jsonify({'status': 'ok', 'uptime': round((datetime.now() - started_at).total_seconds(), 1)})
+
+@app.route('/readyz')
+def readyz():
+    """就绪检查：语音识别、语音合成和 LLM 全部就绪时返回 200，否则返回 503"""
+    components = {
+        'asr': {'ready': speech_recognizer.is_ready(), 'backend': asr_config['backend']},
+        # edge-tts 为在线服务，无需在本地加载模型，只检查合成运行时是否在运行
+        'tts': {'ready': tts.runtime.is_running()},
+        'llm': {
+            'ready': bool(model_config['api_key']) and get_client_pool().is_running(),
+            'base_url': model_config['base_url']
+        }
+    }
+    if not model_config['api_key']:
+        components['llm']['error'] = '未配置 DASHSCOPE_API_KEY'
+    ready = all(component['ready'] for component in components.values())
+    return jsonify({'ready': ready, 'components': components}), 200 if ready else 503
+
+@app.route('/get_asr_stats')
+def get_asr_stats():
+    """获取语音识别队列的深度、批大小分布、实时率和静音裁剪统计"""
+    if not check_auth() or not check_admin():
+        return jsonify({'error': '未授权访问'}), 401
+    return jsonify({
+        'backend': asr_config['backend'],
+        'queue': asr_queue.stats(),
+        'streaming_sessions': len(streaming_asr.sessions),
+        'vad': speech_recognizer.vad_stats(),
+        'streaming_vad': streaming_asr.stats(),
+        'workers': speech_recognizer.health()
+    })
+
+@app.route('/get_tts_stats')
+def get_tts_stats():
+    """获取语音合成缓存命中率、排队等待、合成耗时和合并/取消的任务数"""
+    if not check_auth() or not check_admin():
+        return jsonify({'error': '未授权访问'}), 401
+    return jsonify({**tts.stats(), 'jobs': speech_jobs.stats()})
+
+@app.route('/asr_profile', methods=['GET', 'POST'])
+def asr_profile():
+    """查看或切换语音识别配置档（POST: {profile, fallback_profile}）"""
+    if not check_auth() or not check_admin():
+        return jsonify({'error': '未授权访问'}), 401
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        try:
+            asr_queue.set_profile(data.get('profile') or None, data.get('fallback_profile') or None)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        print(f"语音识别配置档已切换: {data}")
+    return jsonify({
+        'profiles': ASR_PROFILES,
+        'loaded': asr_config['model']['profile'],
+        'profile': asr_queue.config['profile'],
+        'fallback_profile': asr_queue.config['fallback_profile'],
+        'degraded': asr_queue.degraded
+    })
+
+@app.route('/get_assessment_usage')
+def get_assessment_usage():
+    """获取指定患者评估的 LLM 用量（进行中的评估优先，其次为最新的评估结果）"""
+    if not check_auth() or not check_admin():
+        return jsonify({'error': '未授权访问'}), 401
+    try:
+        patient_id = request.args.get('patient_id')
+        if not patient_id:
+            return jsonify({'error': '缺少患者ID'}), 400
+            
+        # 进行中的评估：会话中的实时统计
+        for framework in list(user_frameworks.values()):
+            if framework.patient_info and framework.patient_info.get('id') == patient_id:
+                return jsonify({'status': 'in_progress', **framework.llm_handler.usage.summary()})
+        
+        progress_file = os.path.join(root_dir, "progress", f"progress_{patient_id}.json")
+        if os.path.exists(progress_file):
+            with open(progress_file, 'r', encoding='utf-8') as f:
+                progress_data = json.load(f)
+            return jsonify({'status': 'in_progress', **progress_data.get('llm_usage', {})})
+        
+        results_dir = os.path.join(root_dir, "assessment_results")
+        if os.path.exists(results_dir):
+            result_files = [f for f in os.listdir(results_dir) if f.startswith(f'hamd_{patient_id}_')]
+            if result_files:
+                latest_file = max(result_files, key=lambda x: os.path.getctime(os.path.join(results_dir, x)))
+                with open(os.path.join(results_dir, latest_file), 'r', encoding='utf-8') as f:
+                    result_data = json.load(f)
+                return jsonify({'status': 'completed', 'file': latest_file, **result_data.get('llm_usage', {})})
+        
+        return jsonify({'error': '未找到评估记录'}), 404
+        
+    except Exception as e:
+        print(f"获取评估用量时出错: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/start_rescore', methods=['POST'])
+def start_rescore():
+    """启动批量重评任务：用当前提示词和模型重评 assessment_results 中的全部记录"""
+    if not check_auth() or not check_admin():
+        return jsonify({'error': '未授权访问'}), 401
+    rescorer = rescore_job['rescorer']
+    if rescorer and rescorer.progress['status'] == 'running':
+        return jsonify({'error': '已有重评任务正在运行'}), 409
+    
+    options = request.get_json(silent=True) or {}
+    rescorer = BatchRescorer(
+        prompt_file_path,
+        {**model_config, 'model': options.get('model', model_config['model'])},
+        os.path.join(root_dir, "assessment_results"),
+        os.path.join(root_dir, options.get('checkpoint', 'rescore_checkpoint.jsonl')),
+        concurrency=int(options.get('concurrency', 4)),
+        use_batch_api=bool(options.get('batch_api', False))
+    )
+    rescore_job.update(rescorer=rescorer, report=None, error=None)
+    
+    def run_job():
+        try:
+            rescore_job['report'] = wait_for_future(
+                get_client_pool().submit(rescorer.run(price=options.get('price'))),
+                interval=1
+            )
+        except Exception as e:
+            print(f"批量重评失败: {str(e)}")
+            rescore_job['error'] = str(e)
+            rescorer.progress['status'] = 'failed'
+    
+    socketio.start_background_task(run_job)
+    return jsonify({'status': 'started'})
+
+@app.route('/get_rescore_status')
+def get_rescore_status():
+    """获取批量重评任务的进度和报告"""
+    if not check_auth() or not check_admin():
+        return jsonify({'error': '未授权访问'}), 401
+    rescorer = rescore_job['rescorer']
+    if rescorer is None:
+        return jsonify({'status': 'idle'})
+    return jsonify({
+        **rescorer.progress,
+        'report': rescore_job['report'],
+        'error': rescore_job['error']
+    })
+
 @app.route('/get_patient_info')
 def get_patient_info():
     """获取指定患者的信息"""
@@ -666,31 +1272,113 @@ def delete_assessment():
 
 @socketio.on('audio_data')
 def handle_audio_data(data):
-    """处理音频数据"""
-    try:
-        # 通知客户端停止语音播放
-        socketio.emit('stop_speech', room=request.sid)
-        
-        # 处理语音识别，使用全局变量
-        text = speech_recognizer.process_audio(data)
-        
+    """处理音频数据（二进制 PCM16 / Opus，或旧版前端的 base64 WAV）"""
+    if asr_not_ready(request.sid):
+        return
+    
+    # 通知客户端停止语音播放，并取消还没播放的语音合成
+    socketio.emit('stop_speech', room=request.sid)
+    speech_jobs.cancel(request.sid)
+    
+    sid = request.sid
+    
+    def emit_transcription():
+        try:
+            # Opus/WebM 解码（PyAV）比较耗时，放到 eventlet 的真实线程池中执行，不阻塞其他会话
+            audio = tpool.execute(decode_audio_payload, data)
+            # 识别交给批量识别队列
+            future = asr_queue.submit(audio)
+        except Exception as e:
+            print(f"音频处理错误: {str(e)}")
+            print(traceback.format_exc())
+            socketio.emit('message', {
+                'type': 'message',
+                'role': 'system',
+                'content': f"音频处理错误：{str(e)}"
+            }, room=sid)
+            return
+        try:
+            text = wait_for_future(future, interval=0.02)
+        except Exception as e:
+            print(f"语音识别错误: {str(e)}")
+            socketio.emit('message', {
+                'type': 'message',
+                'role': 'system',
+                'content': f"音频处理错误：{str(e)}"
+            }, room=sid)
+            return
         if text:
             print(f"语音识别结果: {text}")
             socketio.emit('transcription', {
                 'text': text
-            })
+            }, room=sid)
         else:
             print("语音识别未返回结果")
-    except Exception as e:
-        print(f"音频处理错误: {str(e)}")
-        print(traceback.format_exc())
-        emit('message', {
-            'type': 'message',
-            'role': 'system',
-            'content': f"音频处理错误：{str(e)}"
-        })
+    
+    socketio.start_background_task(emit_transcription)
+
+@socketio.on('audio_stream_start')
+def handle_audio_stream_start(data=None):
+    """流式识别：开始录音"""
+    if asr_not_ready(request.sid):
+        return
+    socketio.emit('stop_speech', room=request.sid)
+    speech_jobs.cancel(request.sid)
+    streaming_asr.start(request.sid, (data or {}).get('sample_rate'))
+
+@socketio.on('audio_chunk')
+def handle_audio_chunk(data):
+    """流式识别：接收一块 16 kHz 单声道 int16 PCM，需要时在后台解码并推送中间结果"""
+    sid = request.sid
+    future = streaming_asr.feed(sid, data['audio'])
+    if streaming_asr.end_of_speech(sid):
+        # 说话结束，通知客户端自动停止录音
+        socketio.emit('end_of_speech', room=sid)
+    if future is None:
+        return
+    
+    def emit_partial():
+        try:
+            text = wait_for_future(future, interval=0.02)
+        except Exception as e:
+            print(f"流式识别中间结果出错: {str(e)}")
+            return
+        if text:
+            socketio.emit('transcription_partial', {'text': text}, room=sid)
+    
+    socketio.start_background_task(emit_partial)
+
+@socketio.on('audio_stream_end')
+def handle_audio_stream_end(data=None):
+    """流式识别：录音结束，解码剩余音频并发送最终结果"""
+    sid = request.sid
+    future = streaming_asr.finish(sid)
+    if future is None:
+        return
+    
+    def emit_final():
+        try:
+            text = wait_for_future(future, interval=0.02)
+        except Exception as e:
+            print(f"流式识别出错: {str(e)}")
+            print(traceback.format_exc())
+            socketio.emit('message', {
+                'type': 'message',
+                'role': 'system',
+                'content': f"音频处理错误：{str(e)}"
+            }, room=sid)
+            return
+        if text:
+            print(f"语音识别结果: {text}")
+            socketio.emit('transcription', {'text': text, 'final': True}, room=sid)
+        else:
+            print("语音识别未返回结果")
+    
+    socketio.start_background_task(emit_final)
 
 if __name__ == '__main__':
+    # 后台预合成全部问题的语音，首个问题不必等待合成
+    presynthesize_questions()
     try:
         # 使用 127.0.0.1 替代 localhost 或 0.0.0.0
         socketio.run(app, host='127.0.0.1', port=5000, debug=True)
@@ -18,6 +18,7 @@ class AssessmentFramework:
         self.scores = {}  # 存储评分，使用hamd1-hamd24格式
         self.score_history = {}  # 评分历史
         self.conversation_history = {}  # 存储每个条目的对话历史
+        self.history_summaries = {}  # 每个条目较早对话的摘要 {'summary': 摘要, 'covered': 已并入摘要的记录数}
         self.patient_info = {}  # 存储患者基本信息
         self.insight_item = None  # 存储自知力评估项目
         self.is_minor = False  # 是否为未成年人标志
@@ -64,6 +65,8 @@ class AssessmentFramework:
         # 清空现有项目
         self.items = []
         self.conversation_history = {}
+        self.history_summaries = {}
+        self.llm_handler.usage.load(None)  # 清空本次评估的 LLM 用量统计
         
         for label, prompt in self.prompt_parser.prompts.items():
             # 如果是未成年人且是性欲评估项目，跳过
@@ -92,15 +95,27 @@ class AssessmentFramework:
     def add_item(self, item):
         self.items.append(item)
         
-    async def process_response(self, user_response, history=None, question=None):
+    async def process_response(self, user_response, history=None, question=None, on_delta=None):
         try:
             current_item = self.items[self.current_item_index]
             
+            # 对话历史超出 token 预算时，把较早的对话压缩为摘要
+            history, summary_state = await self.llm_handler.compact_history(
+                history,
+                self.history_summaries.get(current_item.item_id),
+                current_item.item_id
+            )
+            if summary_state:
+                self.history_summaries[current_item.item_id] = summary_state
+            
             result = await self.llm_handler.evaluate_response(
                 current_item.prompt, 
                 user_response,
                 history,
-                question
+                question,
+                on_delta=on_delta,
+                item_id=current_item.item_id,
+                summary=summary_state['summary'] if summary_state else None
             )
             
             # 记录用户的输入和LLM的响应
@@ -222,7 +237,9 @@ class AssessmentFramework:
                 "scores": self.scores,
                 "total_score": total_score,
                 "score_history": self.score_history,
-                "conversation_history": self.conversation_history
+                "conversation_history": self.conversation_history,
+                "history_summaries": self.history_summaries,
+                "llm_usage": self.llm_handler.usage.summary()  # 各条目的 token 用量、耗时、重试和追问次数
             }
             
             # 保存结果
@@ -266,6 +283,8 @@ class AssessmentFramework:
                 'scores': self.scores,
                 'score_history': self.score_history,
                 'conversation_history': self.conversation_history,
+                'history_summaries': self.history_summaries,
+                'llm_usage': self.llm_handler.usage.summary(),
                 'last_update': datetime.now().isoformat()  # 添加最后更新时间
             }
             
@@ -314,10 +333,12 @@ class AssessmentFramework:
             self.current_item_index = progress_data['current_item_index']
             self.scores = progress_data['scores']
             self.score_history = progress_data['score_history']
-            self.conversation_history = progress_data['conversation_history']
             
-            # 重新初始化评估项目
+            # 重新初始化评估项目（会清空对话历史，因此之后再恢复对话历史和摘要）
             self.initialize_items_from_prompts()
+            self.conversation_history.update(progress_data['conversation_history'])
+            self.history_summaries = progress_data.get('history_summaries', {})
+            self.llm_handler.usage.load(progress_data.get('llm_usage'))
             
             print(f"已恢复进度，当前题目: {self.current_item_index + 1}")
             return True
@@ -0,0 +1,380 @@
+import os
+import sys
+import re
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+
+# 添加项目根目录到Python路径（支持直接运行本文件）
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from src.llm.llm_handler import LLMHandler
+from src.llm.score_parser import parse_scores
+from src.utils.prompt_parser import PromptParser
+
+# 批量任务的终止状态
+BATCH_FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+class BatchRescorer:
+    """用当前提示词和模型重新评估已归档的访谈记录
+
+    逐条目重放 assessment_results 中保存的对话：以条目最后一次患者回答为当前输入、
+    之前的对话为历史，调用 LLMHandler 重新评分。每完成一个条目就追加写入检查点，
+    中断后重新运行会跳过已完成的条目。可以选择使用 OpenAI 兼容的 Batch API 一次性提交。
+    """
+
+    def __init__(self, prompt_file_path, model_config, results_dir, checkpoint_path,
+                 concurrency=8, use_batch_api=False, poll_interval=30):
+        self.prompt_parser = PromptParser(prompt_file_path)
+        self.prompt_parser.parse_file(sort_by_number=False)
+        # 批量重评始终使用最低优先级，让位于真实问诊（覆盖调用方配置中的 'live'）；
+        # 排队时间较长，放宽单轮截止时间
+        self.model_config = {
+            **model_config,
+            'priority': 'batch',
+            'turn_deadline': 600,
+            'stream': False
+        }
+        self.llm_handler = LLMHandler(self.model_config)
+        self.results_dir = results_dir
+        self.checkpoint_path = checkpoint_path
+        self.concurrency = concurrency
+        self.use_batch_api = use_batch_api
+        self.poll_interval = poll_interval
+        self.progress = {'total': 0, 'done': 0, 'failed': 0, 'status': 'idle'}
+
+    def collect_tasks(self, files=None):
+        """从归档结果中收集需要重评的条目"""
+        if files is None:
+            files = sorted(f for f in os.listdir(self.results_dir)
+                           if f.startswith('hamd_') and f.endswith('.json'))
+        tasks = []
+        for filename in files:
+            try:
+                with open(os.path.join(self.results_dir, filename), 'r', encoding='utf-8') as f:
+                    result_data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"读取评估结果失败 {filename}: {str(e)}")
+                continue
+
+            patient_id = result_data.get('patient_info', {}).get('id', '')
+            for item_id, entries in result_data.get('conversation_history', {}).items():
+                prompt = self.prompt_parser.get_prompt(item_id)
+                if prompt is None:
+                    print(f"当前提示词中没有条目 {item_id}，跳过 {filename}")
+                    continue
+                task = self._build_task(filename, patient_id, item_id, prompt, entries, result_data.get('scores', {}))
+                if task:
+                    tasks.append(task)
+        return tasks
+
+    @staticmethod
+    def _build_task(filename, patient_id, item_id, prompt, entries, old_scores):
+        """以条目最后一次患者回答为当前输入构建重评任务"""
+        dialogue = [entry for entry in entries if entry.get('role') in ('patient', 'assistant')]
+        last_patient = max((i for i, entry in enumerate(dialogue) if entry['role'] == 'patient'), default=None)
+        if last_patient is None:
+            return None
+
+        # 原评分：优先取该条目中评分类型的模型输出，否则按提示词中的 hamd 标签查找
+        old = {}
+        for entry in dialogue:
+            if entry.get('type') == 'score':
+                old.update(parse_scores(entry['content']) or {})
+        if not old:
+            match = re.search(r'hamd\d+', prompt)
+            if match and match.group() in old_scores:
+                old = {match.group(): old_scores[match.group()]}
+
+        return {
+            'key': f"{filename}::{item_id}",
+            'file': filename,
+            'patient_id': patient_id,
+            'item_id': item_id,
+            'prompt': prompt,
+            'question': PromptParser.get_question(prompt),
+            'history': dialogue[:last_patient],
+            'user_response': dialogue[last_patient]['content'],
+            'old': old
+        }
+
+    def load_checkpoint(self):
+        """读取检查点，返回 (已完成的结果 {key: 记录}, 未完成的批量任务记录列表)"""
+        done = {}
+        batches = []
+        if not os.path.exists(self.checkpoint_path):
+            return done, batches
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 中断时可能留下半行
+                if 'batch_id' in record:
+                    batches.append(record)
+                else:
+                    done[record['key']] = record
+        pending_batches = [b for b in batches if any(key not in done for key in b['keys'])]
+        return done, pending_batches
+
+    def _append_checkpoint(self, record):
+        with open(self.checkpoint_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _make_record(self, task, new_scores, reply=None):
+        return {
+            'key': task['key'],
+            'file': task['file'],
+            'patient_id': task['patient_id'],
+            'item_id': task['item_id'],
+            'old': task['old'],
+            'new': new_scores,
+            'reply': reply,
+            'timestamp': datetime.now().isoformat()
+        }
+
+    async def run(self, files=None, price=None):
+        """执行重评，返回报告（price 见 build_report）"""
+        started = time.perf_counter()
+        tasks = self.collect_tasks(files)
+        done, pending_batches = self.load_checkpoint()
+        pending = [task for task in tasks if task['key'] not in done]
+        self.progress.update(total=len(tasks), done=len(tasks) - len(pending), failed=0, status='running')
+        print(f"共 {len(tasks)} 个条目，检查点中已完成 {len(tasks) - len(pending)} 个")
+
+        if self.use_batch_api:
+            await self._run_batch_api(pending, pending_batches, done)
+        else:
+            await self._run_concurrent(pending, done)
+
+        self.progress['status'] = 'finished'
+        return self.build_report(tasks, done, time.perf_counter() - started, price)
+
+    async def _run_concurrent(self, tasks, done):
+        """逐条目调用 LLMHandler，最多同时进行 concurrency 个"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def rescore(task):
+            async with semaphore:
+                try:
+                    history, summary_state = await self.llm_handler.compact_history(
+                        task['history'], None, task['item_id']
+                    )
+                    result = await self.llm_handler.evaluate_response(
+                        task['prompt'], task['user_response'], history, task['question'],
+                        item_id=task['item_id'],
+                        summary=summary_state['summary'] if summary_state else None
+                    )
+                except Exception as e:
+                    print(f"重评失败 {task['key']}: {str(e)}")
+                    self.progress['failed'] += 1
+                    return
+                if result['type'] == 'score':
+                    record = self._make_record(task, result['data'])
+                else:
+                    record = self._make_record(task, None, result['data'])
+                done[task['key']] = record
+                self._append_checkpoint(record)
+                self.progress['done'] += 1
+
+        await asyncio.gather(*(rescore(task) for task in tasks))
+
+    async def _run_batch_api(self, tasks, pending_batches, done):
+        """通过 Batch API 提交：上传请求文件，轮询任务状态，下载并解析结果"""
+        client = self.llm_handler.client
+        by_key = {task['key']: task for task in tasks}
+
+        # 检查点中记录过的未完成批量任务继续等待，其覆盖的条目不再重复提交
+        batch_ids = [batch['batch_id'] for batch in pending_batches]
+        submitted = {key for batch in pending_batches for key in batch['keys']}
+        for batch_id in batch_ids:
+            print(f"继续等待未完成的批量任务: {batch_id}")
+
+        new_tasks = [task for task in tasks if task['key'] not in submitted]
+        if new_tasks:
+            lines = []
+            for task in new_tasks:
+                messages = self.llm_handler.build_messages(
+                    task['prompt'], task['user_response'], task['history'], task['question']
+                )
+                lines.append(json.dumps({
+                    'custom_id': task['key'],
+                    'method': 'POST',
+                    'url': '/v1/chat/completions',
+                    'body': {
+                        'model': self.llm_handler.model,
+                        'messages': messages,
+                        **self.llm_handler.parameters
+                    }
+                }, ensure_ascii=False))
+            input_file = await self.llm_handler.pool.run(client.files.create(
+                file=('rescore.jsonl', '\n'.join(lines).encode('utf-8')),
+                purpose='batch'
+            ))
+            batch = await self.llm_handler.pool.run(client.batches.create(
+                input_file_id=input_file.id,
+                endpoint='/v1/chat/completions',
+                completion_window='24h'
+            ))
+            print(f"已提交批量任务 {batch.id}，共 {len(new_tasks)} 个条目")
+            self._append_checkpoint({'batch_id': batch.id, 'keys': [task['key'] for task in new_tasks]})
+            batch_ids.append(batch.id)
+
+        for batch_id in batch_ids:
+            while True:
+                batch = await self.llm_handler.pool.run(client.batches.retrieve(batch_id))
+                if batch.status in BATCH_FINAL_STATUSES:
+                    break
+                print(f"批量任务 {batch_id} 状态: {batch.status}")
+                await asyncio.sleep(self.poll_interval)
+
+            if batch.status != 'completed' or not batch.output_file_id:
+                print(f"批量任务 {batch_id} 未成功完成: {batch.status}")
+                self.progress['failed'] += 1
+                continue
+
+            content = await self.llm_handler.pool.run(client.files.content(batch.output_file_id))
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                output = json.loads(line)
+                task = by_key.get(output.get('custom_id'))
+                body = (output.get('response') or {}).get('body') or {}
+                if task is None or not body.get('choices'):
+                    if task is not None:
+                        print(f"重评失败 {task['key']}: {output.get('error')}")
+                        self.progress['failed'] += 1
+                    continue
+                usage = body.get('usage') or {}
+                self.llm_handler.usage.record(task['item_id'], {
+                    'prompt_tokens': usage.get('prompt_tokens', 0),
+                    'cached_tokens': (usage.get('prompt_tokens_details') or {}).get('cached_tokens', 0),
+                    'completion_tokens': usage.get('completion_tokens', 0)
+                })
+                text = body['choices'][0]['message'].get('content') or ''
+                scores = parse_scores(text)
+                record = self._make_record(task, scores, None if scores else text)
+                done[task['key']] = record
+                self._append_checkpoint(record)
+                self.progress['done'] += 1
+
+    def build_report(self, tasks, done, runtime, price=None):
+        """生成新旧评分对照和总耗时、token 用量
+
+        price: 可选 {'input': 每千输入token价格, 'cached': 每千缓存token价格, 'output': 每千输出token价格}
+        """
+        rows = []
+        for task in tasks:
+            record = done.get(task['key'])
+            if record is None:
+                continue
+            labels = sorted(set(record['old']) | set(record['new'] or {}), key=lambda x: int(x[4:]) if x[4:].isdigit() else 0)
+            for label in labels or ['-']:
+                old = record['old'].get(label)
+                new = (record['new'] or {}).get(label)
+                rows.append({
+                    'patient_id': record['patient_id'],
+                    'item_id': record['item_id'],
+                    'label': label,
+                    'old': old,
+                    'new': new,
+                    'diff': new - old if isinstance(old, (int, float)) and isinstance(new, (int, float)) else None
+                })
+
+        usage = self.llm_handler.usage.summary()['total']
+        report = {
+            'rows': rows,
+            'items': len(done),
+            'changed': sum(1 for row in rows if row['diff']),
+            'unscored': sum(1 for row in rows if row['new'] is None),
+            'runtime': round(runtime, 2),
+            'usage': usage
+        }
+        if price:
+            cached = usage['cached_tokens']
+            report['cost'] = round(
+                (usage['prompt_tokens'] - cached) / 1000 * price.get('input', 0)
+                + cached / 1000 * price.get('cached', price.get('input', 0))
+                + usage['completion_tokens'] / 1000 * price.get('output', 0), 4
+            )
+        return report
+
+
+def format_report(report):
+    """把报告格式化为文本表格"""
+    lines = [f"{'患者':<12} {'条目':<12} {'标签':<8} {'原评分':>6} {'新评分':>6} {'差值':>6}"]
+    for row in report['rows']:
+        lines.append(
+            f"{row['patient_id']:<12} {row['item_id']:<12} {row['label']:<8} "
+            f"{_fmt(row['old']):>6} {_fmt(row['new']):>6} {_fmt(row['diff']):>6}"
+        )
+    usage = report['usage']
+    lines.append('')
+    lines.append(f"条目数: {report['items']}，评分变化: {report['changed']}，未给出评分: {report['unscored']}")
+    lines.append(f"总耗时: {report['runtime']} 秒")
+    lines.append(
+        f"token: 输入 {usage['prompt_tokens']}（缓存 {usage['cached_tokens']}），输出 {usage['completion_tokens']}"
+        + (f"，费用约 {report['cost']} 元" if 'cost' in report else '')
+    )
+    return '\n'.join(lines)
+
+
+def _fmt(value):
+    return '-' if value is None else str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用当前提示词和模型批量重评 assessment_results 中的访谈记录")
+    parser.add_argument('--results-dir', default=os.path.join(project_root, 'assessment_results'))
+    parser.add_argument('--prompt-file', default=os.path.join(project_root, 'newprompt.txt'))
+    parser.add_argument('--checkpoint', default=os.path.join(project_root, 'rescore_checkpoint.jsonl'))
+    parser.add_argument('--files', nargs='*', help='只重评指定的结果文件')
+    parser.add_argument('--model', default='qwen-max')
+    parser.add_argument('--base-url', default="https://dashscope.aliyuncs.com/compatible-mode/v1")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--batch-api', action='store_true', help='使用 Batch API 提交（成本更低，但需要等待）')
+    parser.add_argument('--price-input', type=float, help='每千输入 token 价格（元）')
+    parser.add_argument('--price-cached', type=float, help='每千缓存命中 token 价格（元）')
+    parser.add_argument('--price-output', type=float, help='每千输出 token 价格（元）')
+    parser.add_argument('--output', help='把报告保存为 JSON 文件')
+    args = parser.parse_args()
+
+    model_config = {
+        'api_key': os.getenv("DASHSCOPE_API_KEY"),
+        'base_url': args.base_url,
+        'model': args.model,
+        'parameters': {
+            'temperature': 0.7,
+            'top_p': 0.6,
+            'max_tokens': 1500,
+        }
+    }
+    price = None
+    if args.price_input is not None or args.price_output is not None:
+        price = {'input': args.price_input or 0, 'output': args.price_output or 0}
+        if args.price_cached is not None:
+            price['cached'] = args.price_cached
+
+    rescorer = BatchRescorer(
+        args.prompt_file, model_config, args.results_dir, args.checkpoint,
+        concurrency=args.concurrency, use_batch_api=args.batch_api
+    )
+    report = asyncio.run(rescorer.run(args.files, price))
+
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
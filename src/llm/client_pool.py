@@ -0,0 +1,112 @@
+import asyncio
+import os
+import threading
+
+import httpx
+from openai import AsyncOpenAI
+
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+# 连接池默认参数，可通过 model_config['pool'] 覆盖
+DEFAULT_POOL_CONFIG = {
+    'max_connections': 100,           # 最大并发连接数
+    'max_keepalive_connections': 20,  # 保持 keep-alive 的空闲连接数
+    'keepalive_expiry': 30.0,         # 空闲连接保留时间（秒）
+    'connect_timeout': 5.0,           # 建立连接超时（秒）
+    'timeout': 60.0,                  # 单次调用默认超时（秒）
+}
+
+
+class LLMClientPool:
+    """进程级共享的异步 LLM 客户端池
+
+    所有会话共用一个后台事件循环线程，并按 (base_url, api_key) 复用 AsyncOpenAI 客户端，
+    避免每个会话各自建立连接和 TLS 握手。
+    """
+    _instance = None
+    _lock = threading.Lock()
+    _initialized = False
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(LLMClientPool, cls).__new__(cls)
+            return cls._instance
+
+    def __init__(self):
+        with self.__class__._lock:
+            if self.__class__._initialized:
+                return
+
+            self._clients = {}
+            self._clients_lock = threading.Lock()
+
+            # 后台事件循环线程，所有 LLM 请求都在这里执行
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self._run_loop,
+                name="llm-client-pool",
+                daemon=True
+            )
+            self._thread.start()
+
+            self.__class__._initialized = True
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def get_client(self, model_config):
+        """获取（或创建）与配置对应的共享客户端"""
+        api_key = model_config.get('api_key', os.getenv("DASHSCOPE_API_KEY"))
+        base_url = model_config.get('base_url', DEFAULT_BASE_URL)
+        key = (base_url, api_key)
+
+        with self._clients_lock:
+            client = self._clients.get(key)
+            if client is None:
+                pool_config = {**DEFAULT_POOL_CONFIG, **model_config.get('pool', {})}
+                http_client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=pool_config['max_connections'],
+                        max_keepalive_connections=pool_config['max_keepalive_connections'],
+                        keepalive_expiry=pool_config['keepalive_expiry']
+                    ),
+                    timeout=httpx.Timeout(
+                        pool_config['timeout'],
+                        connect=pool_config['connect_timeout']
+                    )
+                )
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=http_client,
+                    max_retries=0  # 重试由调度器统一负责，避免 SDK 和调度器叠加重试
+                )
+                self._clients[key] = client
+                print(f"已创建共享LLM客户端: {base_url}")
+            return client
+
+    def is_running(self):
+        """后台事件循环线程是否在运行"""
+        return self._thread.is_alive() and self.loop.is_running()
+
+    def submit(self, coro):
+        """将协程提交到共享事件循环，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def run(self, coro):
+        """在共享事件循环中执行协程，可以在任意事件循环中 await"""
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self.loop:
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+
+def get_client_pool():
+    """获取进程级共享的客户端池"""
+    return LLMClientPool()
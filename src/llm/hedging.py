@@ -0,0 +1,127 @@
+import asyncio
+import threading
+from collections import deque
+
+# 对冲请求默认配置，可通过 model_config['hedge'] 覆盖
+DEFAULT_HEDGE_CONFIG = {
+    'enabled': False,
+    'percentile': 95,        # 以最近首 token 延迟的该百分位数作为对冲等待时间
+    'initial_delay': 2.0,    # 样本不足时使用的等待时间（秒）
+    'min_delay': 0.3,        # 等待时间下限（秒）
+    'max_delay': 5.0,        # 等待时间上限（秒）
+    'min_samples': 20,       # 开始使用百分位数前需要的样本数
+    'window': 200,           # 保留的最近样本数
+    'fallback': None,        # 备用目标，如 {'base_url': ..., 'api_key': ..., 'model': ...}；None 表示向同一目标重发
+}
+
+
+class HedgeTracker:
+    """记录首 token 延迟样本，计算对冲等待时间，并统计对冲触发和获胜次数"""
+
+    def __init__(self, config=None):
+        self.config = {**DEFAULT_HEDGE_CONFIG, **(config or {})}
+        self._samples = deque(maxlen=self.config['window'])
+        self._lock = threading.Lock()
+        self.counters = {
+            'requests': 0,
+            'fired': 0,   # 触发对冲的次数
+            'won': 0,     # 对冲请求先返回的次数
+        }
+
+    def delay(self):
+        """当前的对冲等待时间（秒）"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.config['min_samples']:
+            value = self.config['initial_delay']
+        else:
+            index = min(len(samples) - 1, int(len(samples) * self.config['percentile'] / 100))
+            value = samples[index]
+        return min(max(value, self.config['min_delay']), self.config['max_delay'])
+
+    def record(self, ttft, fired, won):
+        """记录一次请求：首 token 延迟、是否触发对冲、对冲是否获胜"""
+        with self._lock:
+            if ttft is not None:
+                self._samples.append(ttft)
+            self.counters['requests'] += 1
+            self.counters['fired'] += int(fired)
+            self.counters['won'] += int(won)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            samples = len(self._samples)
+        requests = counters['requests']
+        return {
+            **counters,
+            'samples': samples,
+            'delay': round(self.delay(), 3),
+            'fire_rate': round(counters['fired'] / requests, 4) if requests else 0.0,
+            'win_rate': round(counters['won'] / counters['fired'], 4) if counters['fired'] else 0.0,
+        }
+
+
+async def hedge_race(primary, secondary, delay, discard=None):
+    """先发起主请求，delay 秒内未完成则发起对冲请求，返回先成功的结果
+
+    Args:
+        primary / secondary: 无参协程函数
+        delay: 发起对冲前的等待时间（秒）
+        discard: 可选协程函数，用于释放已经完成但落选的结果（例如关闭流）
+
+    Returns:
+        tuple: (结果, 是否触发对冲, 对冲请求是否获胜)
+
+    两个请求都失败时抛出主请求的异常。
+    """
+    first = asyncio.ensure_future(primary())
+    try:
+        done, _ = await asyncio.wait({first}, timeout=delay)
+    except asyncio.CancelledError:
+        first.cancel()
+        raise
+    if done:
+        return first.result(), False, False
+
+    second = asyncio.ensure_future(secondary())
+    tasks = [first, second]
+    pending = set(tasks)
+    winner = None
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                if task in done and not task.cancelled() and task.exception() is None:
+                    winner = task
+                    break
+    finally:
+        # 取消落选的请求；已经完成的落选结果交给 discard 释放
+        for task in tasks:
+            if task is winner:
+                continue
+            if not task.done():
+                task.cancel()
+            elif discard and not task.cancelled() and task.exception() is None:
+                try:
+                    await discard(task.result())
+                except Exception as e:
+                    print(f"释放落选请求时出错: {str(e)}")
+
+    if winner is None:
+        # 两个请求都失败，抛出主请求的异常
+        raise first.exception()
+    return winner.result(), True, winner is second
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_hedge_tracker(config=None):
+    """获取进程级对冲统计，第一次调用时按传入的配置创建"""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = HedgeTracker(config)
+        return _tracker
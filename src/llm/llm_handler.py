@@ -1,74 +1,437 @@
-import os
-from openai import OpenAI
+import asyncio
 import json
-import dashscope
-from src.utils.globals import socketio
+from functools import lru_cache
+from src.llm.client_pool import get_client_pool
+from src.llm.scheduler import get_scheduler, turn_deadline
+from src.llm.hedging import DEFAULT_HEDGE_CONFIG, get_hedge_tracker, hedge_race
+from src.llm.score_parser import ScoreExtractor, is_valid_score, parse_scores
+from src.llm.usage import UsageStats, completion_tokens, global_usage, usage_counts
+
+# 对话历史压缩的默认配置，可通过 model_config['history'] 覆盖
+DEFAULT_HISTORY_CONFIG = {
+    'token_budget': None,          # 每次调用中对话历史的 token 预算，None 表示不压缩
+    'keep_turns': 2,               # 始终原样保留的最近对话轮数（一问一答为一轮）
+    'summary_model': 'qwen-turbo', # 生成摘要使用的低成本模型
+    'summary_max_tokens': 300,     # 摘要最大输出 token 数
+    'summary_timeout': 8.0,        # 摘要调用（含排队和重试）的时间预算（秒），超时则本轮不压缩
+}
+
+SUMMARY_PROMPT = (
+    "你是精神科问诊记录助手。请把医生与患者的对话压缩为简洁的摘要，"
+    "保留与当前评估条目相关的症状表现、频率、持续时间、严重程度以及患者的关键原话。"
+    "如果提供了已有摘要，请把新对话合并进去。不要给出评分，不超过200字。"
+)
+
+# 结构化输出模式下提供给模型的工具：评分与追问二选一，在一次调用中完成决策
+SCORING_TOOLS = [
+    {
+        'type': 'function',
+        'function': {
+            'name': 'submit_score',
+            'description': '根据现有对话已经能够判断当前条目的评分时调用，直接提交评分。不要向患者透露分数。',
+            'parameters': {
+                'type': 'object',
+                'properties': {
+                    'hamd_label': {'type': 'string', 'description': '条目标签，例如 hamd1'},
+                    'score': {'type': 'integer', 'description': '该条目的评分'}
+                },
+                'required': ['hamd_label', 'score']
+            }
+        }
+    },
+    {
+        'type': 'function',
+        'function': {
+            'name': 'reply',
+            'description': '还不能判断评分时调用，向患者继续追问或回应。回复中不要提及任何分数。',
+            'parameters': {
+                'type': 'object',
+                'properties': {
+                    'text': {'type': 'string', 'description': '对患者说的话'}
+                },
+                'required': ['text']
+            }
+        }
+    }
+]
 
 class LLMHandler:
+    # 响应中出现这些内容时，说明模型在讨论分数，不能直接展示给患者
+    SCORE_KEYWORDS = ['0分', '1分', '2分', '3分', '4分','得分', '评分', '评为', '评级']
+
     def __init__(self, model_config):
-        self.client = OpenAI(
-            api_key=model_config.get('api_key', os.getenv("DASHSCOPE_API_KEY")),
-            base_url=model_config.get('base_url', "https://dashscope.aliyuncs.com/compatible-mode/v1")
-        )
+        # 所有会话共享同一个异步客户端和连接池
+        self.pool = get_client_pool()
+        self.client = self.pool.get_client(model_config)
         self.model = model_config.get('model', 'qwen-plus')
         self.parameters = model_config.get('parameters', {})
-        
-    async def evaluate_response(self, prompt, user_response, conversation_history=None, question=None):
+        self.timeout = model_config.get('timeout')  # 单次调用超时（秒），None 时使用连接池默认值
+        # 结构化输出模式：通过 submit_score / reply 工具一次性决定评分还是追问，
+        # 模型未调用工具时回退到文本JSON和关键词检查
+        self.structured_output = model_config.get('structured_output', False)
+        # 上下文缓存：'implicit' 依赖服务端自动前缀缓存；'explicit' 额外标记静态前缀的缓存位置
+        self.prompt_cache = model_config.get('prompt_cache', 'implicit')
+        self.usage = UsageStats()  # 本会话按条目统计的 token 用量
+        self.history_config = {**DEFAULT_HISTORY_CONFIG, **model_config.get('history', {})}
+        # 进程级调度器：控制全局并发和 TPM，按优先级排队，并负责 429 / 5xx 重试
+        self.scheduler = get_scheduler(model_config.get('scheduler'))
+        self.priority = model_config.get('priority', 'live')
+        self.debug_hook = None  # 可选回调 (item_id, messages)，用于管理员调试频道
+        self.turn_timeout = model_config.get('turn_deadline', 45)  # 每轮问诊（含重试和二次调用）的截止时间（秒）
+        # 对冲请求：首个 token 迟迟未到时向备用目标再发一次，取先返回者
+        self.hedge = {**DEFAULT_HEDGE_CONFIG, **model_config.get('hedge', {})}
+        self.hedge_tracker = get_hedge_tracker(self.hedge)
+        fallback = self.hedge.get('fallback') or {}
+        self.fallback_target = (
+            self.pool.get_client({**model_config, **fallback}) if fallback else self.client,
+            fallback.get('model', self.model)
+        )
+
+    async def _create_completion(self, messages, target=None, **kwargs):
+        """发起一次补全请求（需在共享事件循环中调用），target 为 (客户端, 模型)，默认使用主目标"""
+        client, model = target or (self.client, self.model)
+        params = {**self.parameters, **kwargs}
+        if self.timeout is not None:
+            params.setdefault('timeout', self.timeout)
+        if params.get('stream'):
+            # 流式调用时在最后一个块中返回 usage
+            params.setdefault('stream_options', {'include_usage': True})
+        return await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            **params
+        )
+
+    async def _open_completion(self, messages, target=None, **kwargs):
+        """发起请求并等到首个块（非流式时为完整响应）
+
+        Returns:
+            tuple: (响应或流, 首个块, 首 token 延迟)
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        response = await self._create_completion(messages, target=target, **kwargs)
+        first = None
+        if kwargs.get('stream'):
+            try:
+                first = await response.__anext__()
+            except StopAsyncIteration:
+                pass
+            except BaseException:
+                await response.close()
+                raise
+        return response, first, loop.time() - started
+
+    async def _hedged_completion(self, messages, **kwargs):
+        """开启对冲时，超过等待时间仍未收到首个块则发起对冲请求，落选的请求会被取消"""
+        if not self.hedge['enabled']:
+            return await self._open_completion(messages, **kwargs)
+
+        async def discard(result):
+            if kwargs.get('stream'):
+                await result[0].close()
+
+        result, fired, won = await hedge_race(
+            lambda: self._open_completion(messages, **kwargs),
+            lambda: self._open_completion(messages, target=self.fallback_target, **kwargs),
+            self.hedge_tracker.delay(),
+            discard=discard
+        )
+        self.hedge_tracker.record(result[2], fired, won)
+        if fired:
+            print(f"对冲请求已触发，{'对冲' if won else '主'}请求先返回")
+        return result
+
+    def _tool_params(self):
+        """结构化输出模式下附加的工具参数"""
+        if not self.structured_output:
+            return {}
+        return {'tools': SCORING_TOOLS, 'tool_choice': 'auto'}
+
+    def _record_usage(self, item_id, usage):
+        """记录一次调用的 token 用量（本会话和进程级各记一份），返回总 token 数"""
+        counts = usage_counts(usage)
+        self.usage.record(item_id, counts)
+        global_usage.record(item_id, counts)
+        return counts['prompt_tokens'] + counts['completion_tokens'] if counts else None
+
+    def _increment(self, item_id, field):
+        """累加条目的 retries / reasks 计数（本会话和进程级各记一份）"""
+        self.usage.increment(item_id, field)
+        global_usage.increment(item_id, field)
+
+    async def _scheduled(self, func, messages, item_id=None, tokens_of=None, ttft_of=None):
+        """通过进程级调度器执行请求（排队、限流和重试），并记录耗时和首 token 延迟"""
+        estimated = sum(estimate_tokens(m['content']) for m in messages if isinstance(m.get('content'), str))
+        estimated += self.parameters.get('max_tokens', 500) // 2
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await self.scheduler.call(
+            func,
+            priority=self.priority,
+            estimated_tokens=estimated,
+            tokens_of=tokens_of,
+            on_retry=lambda: self._increment(item_id, 'retries')
+        )
+        wall_time = loop.time() - started
+        ttft = ttft_of(result) if ttft_of else None
+        self.usage.record_timing(item_id, wall_time, ttft)
+        global_usage.record_timing(item_id, wall_time, ttft)
+        return result
+
+    async def _stream_completion(self, messages, reply_filter, item_id=None):
+        """以流式方式调用LLM，边生成边把可以展示的文本交给流过滤器
+
+        Returns:
+            tuple: (完整响应文本, 工具调用列表, 文本中解析出的评分, 总 token 数, 首 token 延迟)
+        """
+        stream, first, ttft = await self._hedged_completion(messages, stream=True, **self._tool_params())
+        extractor = ScoreExtractor()
+        parts = []
+        tool_calls = {}  # index -> [name, arguments]
+        reply_streamed = {}  # index -> 该 reply 工具调用中已经转发的文本长度
+        usage = None
+        async for chunk in chain_stream(first, stream):
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                parts.append(delta.content)
+                extractor.feed(delta.content)
+                reply_filter.feed(delta.content)
+            for call in delta.tool_calls or []:
+                entry = tool_calls.setdefault(call.index, ['', ''])
+                if call.function and call.function.name:
+                    entry[0] += call.function.name
+                if call.function and call.function.arguments:
+                    entry[1] += call.function.arguments
+                # reply 工具的文本参数边生成边转发
+                if entry[0] == 'reply':
+                    text = partial_json_string(entry[1], 'text')
+                    streamed = reply_streamed.get(call.index, 0)
+                    if len(text) > streamed:
+                        reply_filter.feed(text[streamed:])
+                        reply_streamed[call.index] = len(text)
+        reply_filter.flush()
+        tokens = self._record_usage(item_id, usage)
+        calls = [tuple(tool_calls[index]) for index in sorted(tool_calls)]
+        return ''.join(parts), calls, extractor.result(), tokens, ttft
+
+    async def _complete(self, messages, on_delta=None, item_id=None):
+        """调用LLM并整理结果
+
+        Returns:
+            dict: text 为原始响应文本，score 为评分（工具或文本JSON），
+                  reply 为 reply 工具给出的回复（未调用时为 None），
+                  filter 为流过滤器（非流式调用时为 None）
+        """
+        filters = []  # 每次尝试的流过滤器
+
+        async def attempt():
+            # 重试前撤回上一次尝试已经展示的内容
+            if filters:
+                self._reset_stream(filters[-1])
+            if on_delta is None:
+                completion, _, ttft = await self._hedged_completion(messages, **self._tool_params())
+                tokens = self._record_usage(item_id, completion.usage)
+                message = completion.choices[0].message
+                text = message.content or ''
+                calls = [(call.function.name, call.function.arguments) for call in (message.tool_calls or [])]
+                filters.append(None)
+                return text, calls, self._try_parse_score(text), tokens, ttft
+            reply_filter = ReplyStreamFilter(on_delta, self.SCORE_KEYWORDS)
+            filters.append(reply_filter)
+            return await self._stream_completion(messages, reply_filter, item_id)
+
         try:
-            # 构建消息列表
-            messages = [
-                {'role': 'system', 'content': prompt},
-            ]
-            
-            # 添加问题作为第一条 assistant 消息
-            if question:
-                messages.append({'role': 'assistant', 'content': question})
-            
-            # 添加历史对话（不包括当前用户输入）
-            if conversation_history:
-                for entry in conversation_history:
-                    if entry.get('role') == 'patient':
-                        messages.append({'role': 'user', 'content': entry['content']})
-                    elif entry.get('role') == 'assistant':
-                        messages.append({'role': 'assistant', 'content': entry['content']})
-            
-            # 添加当前用户输入
-            messages.append({'role': 'user', 'content': user_response})
-            
-            # 尝试发送消息列表到前端显示（如果socketio可用）
+            text, calls, text_score, _, _ = await self._scheduled(
+                attempt, messages, item_id,
+                tokens_of=lambda result: result[3],
+                ttft_of=lambda result: result[4]
+            )
+        except Exception:
+            # 最终失败时撤回已经展示的半截回复
+            if filters:
+                self._reset_stream(filters[-1])
+            raise
+        reply_filter = filters[-1]
+
+        tool_score, reply = self._parse_tool_calls(calls)
+        return {
+            'text': text,
+            'score': tool_score or text_score,
+            'reply': reply,
+            'filter': reply_filter
+        }
+
+    @staticmethod
+    def _parse_tool_calls(calls):
+        """解析工具调用，返回 (评分, 回复文本)"""
+        scores = {}
+        reply = None
+        for name, arguments in calls:
             try:
-                if socketio:
-                    socketio.emit('message', {
-                        'type': 'llm_messages',
-                        'messages': messages
-                    })
-            except:
-                pass  # 如果socketio不可用，静默忽略
-            
-            # 调用LLM进行评估
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                **self.parameters
+                args = json.loads(arguments or '{}')
+            except ValueError:
+                print(f"工具参数解析错误: {name} {arguments}")
+                continue
+            if name == 'submit_score':
+                score = {args.get('hamd_label'): args.get('score')}
+                if is_valid_score(score):
+                    scores.update(score)
+                else:
+                    print(f"无效的评分格式: {arguments}")
+            elif name == 'reply' and isinstance(args.get('text'), str):
+                reply = (reply + args['text']) if reply else args['text']
+        return scores or None, reply
+
+    async def compact_history(self, conversation_history, state=None, item_id=None):
+        """按 token 预算压缩条目的对话历史
+
+        超出预算时，把较早的对话连同已有摘要交给低成本模型合并为新的摘要，
+        最近 keep_turns 轮始终原样保留。摘要调用在评估调用之前进行，不占用本轮的截止时间，
+        而是使用单独的 summary_timeout 预算，超时或失败时原样发送未压缩的历史。
+
+        Args:
+            conversation_history: 条目的对话历史（只使用带 role 的记录）
+            state: 之前的摘要状态 {'summary': 摘要, 'covered': 已并入摘要的记录数}
+            item_id: 当前条目标签，用于统计摘要调用的 token 用量
+
+        Returns:
+            tuple: (需要原样发送的对话历史, 新的摘要状态或 None)
+        """
+        return await self.pool.run(self._compact_history(conversation_history, state, item_id))
+
+    async def _compact_history(self, conversation_history, state=None, item_id=None):
+        entries = [entry for entry in (conversation_history or []) if entry.get('role') in ('patient', 'assistant')]
+        covered = state['covered'] if state else 0
+        live = entries[covered:]
+
+        budget = self.history_config['token_budget']
+        keep = self.history_config['keep_turns'] * 2
+        if not budget or len(live) <= keep:
+            return live, state
+        if sum(estimate_tokens(entry['content']) for entry in live) <= budget:
+            return live, state
+
+        split = len(live) - keep
+        folded, live = live[:split], live[split:]
+        try:
+            summary = await asyncio.wait_for(
+                self._summarize(state['summary'] if state else None, folded, item_id),
+                self.history_config['summary_timeout']
             )
+        except Exception as e:
+            # 摘要失败或超时时保持原样发送，不影响问诊
+            print(f"对话历史摘要失败: {str(e) or type(e).__name__}")
+            return entries[covered:], state
+
+        new_state = {'summary': summary, 'covered': covered + len(folded)}
+        print(f"条目 {item_id} 的对话历史已压缩，共 {new_state['covered']} 条记录并入摘要")
+        return live, new_state
+
+    async def _summarize(self, previous_summary, entries, item_id=None):
+        """使用低成本模型把对话合并进摘要"""
+        lines = []
+        if previous_summary:
+            lines.append(f"已有摘要：{previous_summary}\n")
+        lines.append("新增对话：")
+        for entry in entries:
+            speaker = '患者' if entry['role'] == 'patient' else '医生'
+            lines.append(f"{speaker}：{entry['content']}")
+
+        messages = [
+            {'role': 'system', 'content': SUMMARY_PROMPT},
+            {'role': 'user', 'content': '\n'.join(lines)}
+        ]
+        completion = await self._scheduled(lambda: self.client.chat.completions.create(
+            model=self.history_config['summary_model'],
+            messages=messages,
+            max_tokens=self.history_config['summary_max_tokens'],
+            temperature=0.2,
+            **({'timeout': self.timeout} if self.timeout is not None else {})
+        ), messages, item_id, tokens_of=completion_tokens)
+        self._record_usage(item_id, completion.usage)
+        return completion.choices[0].message.content.strip()
+
+    def build_messages(self, prompt, user_response, conversation_history=None, question=None, summary=None):
+        """构建一次评估调用的消息列表（批量重评也复用这一逻辑）"""
+        # 构建消息列表：系统提示词和问题组成的静态前缀在所有会话中逐字节相同，
+        # 可以命中服务端的上下文缓存，动态的对话历史只追加在其后
+        explicit_cache = self.prompt_cache == 'explicit'
+        if summary:
+            # 有摘要时问题消息不再固定，只缓存系统提示词
+            messages = list(build_static_prefix(prompt, None, explicit_cache))
+            note = f"（此前对话摘要：{summary}）"
+            messages.append({'role': 'assistant', 'content': f"{question}\n\n{note}" if question else note})
+        else:
+            messages = list(build_static_prefix(prompt, question, explicit_cache))
+        
+        # 添加历史对话（不包括当前用户输入）
+        if conversation_history:
+            for entry in conversation_history:
+                if entry.get('role') == 'patient':
+                    messages.append({'role': 'user', 'content': entry['content']})
+                elif entry.get('role') == 'assistant':
+                    messages.append({'role': 'assistant', 'content': entry['content']})
+        
+        # 添加当前用户输入
+        messages.append({'role': 'user', 'content': user_response})
+        return messages
+
+    async def evaluate_response(self, prompt, user_response, conversation_history=None, question=None,
+                                on_delta=None, item_id=None, summary=None):
+        """评估患者回答
+
+        Args:
+            on_delta: 可选回调 on_delta(text, reset=False)。提供时以流式方式生成回复，
+                      可展示给患者的文本增量会在生成过程中实时传出；评分JSON及
+                      评分相关内容不会被传出，若已传出的内容作废则以 reset=True 通知。
+            item_id: 当前条目标签，用于按条目统计 token 用量和缓存命中率
+            summary: 较早对话的摘要（见 compact_history），附在问题之后
+        """
+        return await self.pool.run(self._evaluate_response(
+            prompt, user_response, conversation_history, question, on_delta, item_id, summary
+        ))
+
+    async def _evaluate_response(self, prompt, user_response, conversation_history=None, question=None,
+                                 on_delta=None, item_id=None, summary=None):
+        # 本轮所有调用（包括重试和二次调用）共享同一个截止时间
+        deadline_token = turn_deadline.set(asyncio.get_running_loop().time() + self.turn_timeout)
+        try:
+            messages = self.build_messages(prompt, user_response, conversation_history, question, summary)
+            
+            # 管理员调试频道（由调用方设置，未设置时不推送）
+            if self.debug_hook:
+                self.debug_hook(item_id, messages)
             
-            # 获取响应文本
-            response = completion.choices[0].message.content
+            # 调用LLM进行评估，同时解析JSON评分
+            outcome = await self._complete(messages, on_delta, item_id)
+            response = outcome['text']
             
-            # 尝试解析JSON评分
-            score = self._try_parse_score(response)
-            if score:
+            if outcome['score']:
+                # 已经流式展示过的内容需要撤回
+                self._reset_stream(outcome['filter'])
                 # 返回评分结果，同时保存原始响应
                 return {
                     'type': 'score', 
-                    'data': score, 
-                    'raw_response': response,  # 添加原始响应
+                    'data': outcome['score'], 
+                    'raw_response': response or json.dumps(outcome['score'], ensure_ascii=False),  # 添加原始响应
                     'show_response': False
                 }
             else:
+                # 结构化输出模式下模型通过 reply 工具追问，追问文本同样要检查是否提到分数
+                if outcome['reply'] is not None:
+                    response = outcome['reply']
+                
                 # 检查响应中是否包含分数相关内容
-                score_keywords = ['0分', '1分', '2分', '3分', '4分','得分', '评分', '评为', '评级']
-                if any(keyword in response for keyword in score_keywords):
+                if any(keyword in response for keyword in self.SCORE_KEYWORDS):
+                    # 第一次的响应不会展示给患者
+                    self._reset_stream(outcome['filter'])
+                    self._increment(item_id, 'reasks')
+                    
                     # 将包含分数的响应加入到历史对话中
                     messages.append({
                         'role': 'assistant',
@@ -81,26 +444,20 @@ class LLMHandler:
                         'content': "画外音：请不要与患者讨论分数等内容，如果根据现有对话能够判断分数，则直接输出json；如果不能，请继续追问。"
                     })
                     
-                    # 再次调用LLM
-                    completion = self.client.chat.completions.create(
-                        model=self.model,
-                        messages=messages,
-                        **self.parameters
-                    )
+                    # 再次调用LLM，同样尝试解析JSON
+                    outcome = await self._complete(messages, on_delta, item_id)
+                    new_response = outcome['text']
                     
-                    # 获取新的响应
-                    new_response = completion.choices[0].message.content
-                    
-                    # 再次尝试解析JSON
-                    score = self._try_parse_score(new_response)
-                    if score:
+                    if outcome['score']:
+                        self._reset_stream(outcome['filter'])
                         return {
                             'type': 'score', 
-                            'data': score, 
-                            'raw_response': new_response,  # 添加原始响应
+                            'data': outcome['score'], 
+                            'raw_response': new_response or json.dumps(outcome['score'], ensure_ascii=False),  # 添加原始响应
                             'show_response': False
                         }
                     else:
+                        new_response = outcome['reply'] if outcome['reply'] is not None else new_response
                         return {
                             'type': 'message', 
                             'data': new_response, 
@@ -119,68 +476,23 @@ class LLMHandler:
         except Exception as e:
             print(f"LLM调用出错: {str(e)}")
             raise
+        finally:
+            turn_deadline.reset(deadline_token)
+
+    @staticmethod
+    def _reset_stream(reply_filter):
+        """通知前端撤回已流式展示的内容"""
+        if reply_filter and reply_filter.emitted:
+            reply_filter.on_delta('', reset=True)
             
     def _try_parse_score(self, response):
         """尝试从响应中解析评分JSON"""
         try:
-            # 找到所有可能的JSON对象
-            json_objects = []
-            current_pos = 0
-            
-            while current_pos < len(response):
-                # 找到下一个左花括号
-                start = response.find('{', current_pos)
-                if start == -1:
-                    break
-                
-                # 从左花括号开始，逐字符解析
-                stack = []
-                end = start
-                
-                for i in range(start, len(response)):
-                    if response[i] == '{':
-                        stack.append('{')
-                    elif response[i] == '}':
-                        stack.pop()
-                        if not stack:  # 找到匹配的右花括号
-                            end = i + 1
-                            break
-                
-                if end > start:
-                    try:
-                        json_str = response[start:end]
-                        score_data = json.loads(json_str)
-                        
-                        # 验证评分数据的格式：允许多个hamd评分
-                        if all(isinstance(k, str) and isinstance(v, (int, float)) and k.startswith('hamd') for k, v in score_data.items()):
-                            json_objects.append(score_data)
-                        else:
-                            print(f"无效的评分格式: {json_str}")
-                            
-                    except json.JSONDecodeError:
-                        print(f"JSON解析错误: {json_str}")
-                    except Exception as e:
-                        print(f"处理评分数据时出错: {str(e)}")
-                
-                current_pos = end + 1
-            
-            # 如果找到有效的JSON对象
-            if json_objects:
-                # 如果只有一个评分对象，直接返回
-                if len(json_objects) == 1:
-                    return json_objects[0]
-                # 如果有多个评分对象，合并它们
-                else:
-                    merged_scores = {}
-                    for score_dict in json_objects:
-                        merged_scores.update(score_dict)
-                    return merged_scores
-            
-            return None
-            
+            return parse_scores(response)
         except Exception as e:
             print(f"评分解析出错: {str(e)}")
             return None
+
     async def generate_chat_response(self, system_prompt, messages):
         """
         生成聊天回复
@@ -192,24 +504,142 @@ class LLMHandler:
         Returns:
             str: 生成的回复
         """
+        return await self.pool.run(self._generate_chat_response(system_prompt, messages))
+
+    async def _generate_chat_response(self, system_prompt, messages):
         try:
             # 构建完整的消息列表
             full_messages = [
                 {"role": "system", "content": system_prompt}
             ] + messages
             
-            response = dashscope.Generation.call(
-                model=self.model,
-                messages=full_messages,
-                result_format='message',
-                **self.parameters
+            completion = await self._scheduled(
+                lambda: self._create_completion(full_messages), full_messages, 'chat', tokens_of=completion_tokens
             )
-            
-            if response.status_code == 200:
-                return response.output.choices[0].message.content
-            else:
-                raise Exception(f"API调用失败: {response.code} - {response.message}")
+            self._record_usage('chat', completion.usage)
+            return completion.choices[0].message.content
                 
         except Exception as e:
             print(f"生成回复时出错: {str(e)}")
             raise
+
+
+class ReplyStreamFilter:
+    """流式回复过滤器
+
+    按顺序转发可以展示给患者的文本；一旦出现评分JSON或评分相关内容，
+    其后的文本全部扣留。末尾保留少量字符，保证跨块出现的标记也能被识别。
+    """
+    MARKERS = ['{', '｛', '```']
+
+    def __init__(self, on_delta, keywords):
+        self.on_delta = on_delta
+        self.markers = self.MARKERS + list(keywords)
+        self.lookahead = max(len(marker) for marker in self.markers) - 1
+        self.pending = ''
+        self.blocked = False
+        self.emitted = False
+
+    def feed(self, text):
+        if self.blocked:
+            return
+        self.pending += text
+
+        positions = [pos for pos in (self.pending.find(m) for m in self.markers) if pos != -1]
+        if positions:
+            safe = self.pending[:min(positions)]
+            self.pending = ''
+            self.blocked = True
+        else:
+            cut = max(len(self.pending) - self.lookahead, 0)
+            safe = self.pending[:cut]
+            self.pending = self.pending[cut:]
+
+        self._emit(safe)
+
+    def flush(self):
+        if not self.blocked:
+            self._emit(self.pending)
+        self.pending = ''
+
+    def _emit(self, text):
+        if text:
+            self.emitted = True
+            self.on_delta(text)
+
+
+def partial_json_string(arguments, key):
+    """从尚未生成完的 JSON 参数中取出字符串字段已经生成的部分"""
+    marker = arguments.find(f'"{key}"')
+    if marker == -1:
+        return ''
+    colon = arguments.find(':', marker + len(key) + 2)
+    if colon == -1:
+        return ''
+    quote = arguments.find('"', colon + 1)
+    if quote == -1:
+        return ''
+
+    # 找到字符串结尾（未转义的引号），没有结尾则取全部已生成内容
+    raw = arguments[quote + 1:]
+    i = 0
+    while i < len(raw):
+        if raw[i] == '\\':
+            i += 2
+            continue
+        if raw[i] == '"':
+            raw = raw[:i]
+            break
+        i += 1
+
+    # 去掉末尾不完整的转义序列
+    escape_at = raw.rfind('\\')
+    while escape_at != -1 and len(raw) - escape_at < 6:
+        try:
+            return json.loads(f'"{raw}"')
+        except ValueError:
+            raw = raw[:escape_at]
+            escape_at = raw.rfind('\\')
+    try:
+        return json.loads(f'"{raw}"')
+    except ValueError:
+        return ''
+
+
+@lru_cache(maxsize=256)
+def build_static_prefix(prompt, question=None, explicit_cache=False):
+    """构建每轮对话都相同的消息前缀（系统提示词 + 问题）
+
+    同一条目的前缀只构建一次并被所有会话复用，保证发送给服务端的内容逐字节一致。
+    explicit_cache 为 True 时在前缀最后一条消息上标记 cache_control，使用显式缓存。
+    """
+    prefix = [{'role': 'system', 'content': prompt.replace('\r\n', '\n').strip()}]
+    # 问题作为第一条 assistant 消息
+    if question:
+        prefix.append({'role': 'assistant', 'content': question.strip()})
+
+    if explicit_cache:
+        last = prefix[-1]
+        prefix[-1] = {
+            'role': last['role'],
+            'content': [{
+                'type': 'text',
+                'text': last['content'],
+                'cache_control': {'type': 'ephemeral'}
+            }]
+        }
+    return tuple(prefix)
+
+
+async def chain_stream(first, stream):
+    """先产出已经取到的首个块，再继续读取流"""
+    if first is not None:
+        yield first
+    async for chunk in stream:
+        yield chunk
+
+
+def estimate_tokens(text):
+    """粗略估计 token 数：中文约每字 1 个 token，其余字符约每 4 个 1 个 token"""
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return (len(text) - ascii_chars) + ascii_chars // 4
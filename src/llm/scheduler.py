@@ -0,0 +1,239 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+
+import openai
+
+# 优先级：数值越小越优先。真实问诊优先于模拟病人和批量重评
+PRIORITIES = {
+    'live': 0,
+    'synthetic': 1,
+    'batch': 2,
+}
+
+# 调度器默认配置，可通过 model_config['scheduler'] 覆盖（以第一个创建调度器的配置为准）
+DEFAULT_SCHEDULER_CONFIG = {
+    'max_concurrency': 16,      # 全局并发请求上限
+    'live_reserved': 4,         # 为真实问诊预留的并发名额，模拟和批量请求不能占用
+    'tokens_per_minute': None,  # 每分钟 token 上限（TPM），None 表示不限制
+    'max_retries': 4,           # 429 / 5xx / 网络错误的最大重试次数
+    'base_delay': 0.5,          # 指数退避的初始等待（秒）
+    'max_delay': 8.0,           # 单次退避的最大等待（秒）
+    'deadline': 45.0,           # 没有单轮截止时间时，单个请求（含排队和重试）的截止时间（秒）
+}
+
+# 当前问诊轮次的截止时间（事件循环时间），同一轮内的所有 LLM 调用共享
+turn_deadline = contextvars.ContextVar('turn_deadline', default=None)
+
+
+class LLMUnavailableError(Exception):
+    """LLM 服务暂时不可用：重试次数耗尽或超过截止时间"""
+
+
+def is_retryable(error):
+    """429、5xx、连接错误和超时可以重试"""
+    if isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    status = getattr(error, 'status_code', None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+def retry_after(error):
+    """读取服务端返回的 Retry-After（秒），没有时返回 None"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMScheduler:
+    """进程级 LLM 请求调度器
+
+    所有请求都在共享客户端池的事件循环中调度：按优先级排队，限制全局并发，
+    按滑动窗口统计每分钟 token 用量，并对 429 / 5xx 做带抖动的指数退避重试。
+    """
+
+    def __init__(self, config=None):
+        self.config = {**DEFAULT_SCHEDULER_CONFIG, **(config or {})}
+        self._queue = []                     # (优先级, 序号, 预估token, Future)
+        self._sequence = itertools.count()
+        self._active = 0
+        self._token_window = deque()         # [时间戳, token数]
+        self._timer = None
+        self.counters = {
+            'requests': 0,
+            'retries': 0,
+            'failures': 0,
+            'rate_limited': 0,
+        }
+
+    async def call(self, func, priority='live', estimated_tokens=0, tokens_of=None, deadline=None, on_retry=None):
+        """按调度策略执行一次 LLM 请求
+
+        Args:
+            func: 无参协程函数，每次尝试都会重新调用，应完成整个请求（包括读取流式响应）
+            priority: 'live' / 'synthetic' / 'batch'
+            estimated_tokens: 预估 token 数，用于 TPM 限流
+            tokens_of: 可选函数，从 func 的返回值中取出实际 token 数
+            deadline: 截止时间（事件循环时间），默认使用当前轮次的截止时间
+            on_retry: 可选回调，每次重试前调用，用于按条目统计重试次数
+
+        Raises:
+            LLMUnavailableError: 重试耗尽或超过截止时间
+        """
+        loop = asyncio.get_running_loop()
+        if deadline is None:
+            deadline = turn_deadline.get() or loop.time() + self.config['deadline']
+        level = PRIORITIES.get(priority, PRIORITIES['live'])
+        self.counters['requests'] += 1
+
+        attempt = 0
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                self.counters['failures'] += 1
+                raise LLMUnavailableError("LLM请求超过截止时间")
+
+            try:
+                entry = await asyncio.wait_for(self._acquire(level, estimated_tokens), remaining)
+            except asyncio.TimeoutError:
+                self.counters['failures'] += 1
+                raise LLMUnavailableError("LLM请求排队超时")
+
+            try:
+                result = await asyncio.wait_for(func(), deadline - loop.time())
+            except asyncio.CancelledError:
+                self._release(entry, None)
+                raise
+            except Exception as e:
+                self._release(entry, None)
+                if not is_retryable(e):
+                    raise
+                reason = str(e) or type(e).__name__
+                if attempt >= self.config['max_retries']:
+                    self.counters['failures'] += 1
+                    raise LLMUnavailableError(f"LLM服务暂时不可用: {reason}") from e
+
+                if getattr(e, 'status_code', None) == 429:
+                    self.counters['rate_limited'] += 1
+                delay = random.uniform(0, min(self.config['max_delay'], self.config['base_delay'] * 2 ** attempt))
+                delay = max(delay, retry_after(e) or 0)
+                if loop.time() + delay >= deadline:
+                    self.counters['failures'] += 1
+                    raise LLMUnavailableError(f"LLM服务暂时不可用: {reason}") from e
+
+                attempt += 1
+                self.counters['retries'] += 1
+                if on_retry:
+                    on_retry()
+                print(f"LLM请求失败（{reason}），{delay:.2f} 秒后第 {attempt} 次重试")
+                await asyncio.sleep(delay)
+                continue
+
+            self._release(entry, tokens_of(result) if tokens_of else None)
+            return result
+
+    async def _acquire(self, level, estimated_tokens):
+        """排队等待并发名额和 TPM 额度，返回本次请求在 token 窗口中的记录"""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (level, next(self._sequence), estimated_tokens, future))
+        self._dispatch()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # 排队时被取消（例如超时），如果名额已经分配则归还
+            if future.done() and not future.cancelled():
+                self._release(future.result(), None)
+            raise
+
+    def _release(self, entry, actual_tokens):
+        self._active -= 1
+        if actual_tokens is not None:
+            entry[1] = actual_tokens
+        self._dispatch()
+
+    def _dispatch(self):
+        """按优先级把空闲名额分配给排队中的请求"""
+        self._prune_window(time.monotonic())
+        while self._queue:
+            level, _, estimated_tokens, future = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+
+            limit = self.config['max_concurrency']
+            if level != PRIORITIES['live']:
+                limit -= self.config['live_reserved']
+            if self._active >= limit:
+                break
+
+            wait = self._tpm_wait(estimated_tokens)
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+                break
+
+            heapq.heappop(self._queue)
+            self._active += 1
+            entry = [time.monotonic(), estimated_tokens]
+            self._token_window.append(entry)
+            future.set_result(entry)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _prune_window(self, now):
+        """丢弃 token 窗口中超过 60 秒的记录（不限 TPM 时也要清理，避免窗口无限增长）"""
+        while self._token_window and now - self._token_window[0][0] >= 60:
+            self._token_window.popleft()
+
+    def _tpm_wait(self, estimated_tokens):
+        """返回满足 TPM 限制还需要等待的秒数"""
+        limit = self.config['tokens_per_minute']
+        if not limit:
+            return 0
+        now = time.monotonic()
+        self._prune_window(now)
+        used = sum(tokens for _, tokens in self._token_window)
+        if not self._token_window or used + estimated_tokens <= limit:
+            return 0
+        return max(self._token_window[0][0] + 60 - now, 0.05)
+
+    def stats(self):
+        """返回当前调度状态和计数"""
+        now = time.monotonic()
+        self._prune_window(now)
+        queued = {name: 0 for name in PRIORITIES}
+        names = {level: name for name, level in PRIORITIES.items()}
+        for level, _, _, future in list(self._queue):
+            if not future.done():
+                queued[names.get(level, 'live')] += 1
+        return {
+            'active': self._active,
+            'queued': queued,
+            'tokens_last_minute': sum(tokens for _, tokens in self._token_window),
+            **self.counters
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(config=None):
+    """获取进程级调度器，第一次调用时按传入的配置创建"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(config)
+        return _scheduler
@@ -0,0 +1,171 @@
+import json
+import re
+
+# 模型输出中常见的全角标点，统一转换为 JSON 标点后再解析
+_PUNCT_TABLE = str.maketrans({
+    '｛': '{',
+    '｝': '}',
+    '：': ':',
+    '，': ',',
+    '“': '"',
+    '”': '"',
+    '＂': '"',
+})
+
+_OPEN_BRACES = ('{', '｛')
+_CLOSE_BRACES = ('}', '｝')
+_QUOTES = ('"', '“', '”', '＂')
+
+# 对象内部只需要关心这几类字符，其余字符整段跳过
+_OBJECT_TOKENS = re.compile(r'[{}｛｝"“”＂\\\n]')
+_STRING_TOKENS = re.compile(r'["“”＂\\\n]')
+# 引号已经不可信时只看花括号（与旧版解析器一致）
+_BRACE_TOKENS = re.compile(r'[{}｛｝]')
+
+
+def is_valid_score(data):
+    """检查是否为 {"hamdN": 数值} 形式的评分对象（允许多个评分）"""
+    return (
+        isinstance(data, dict)
+        and bool(data)
+        and all(
+            isinstance(k, str) and k.startswith('hamd')
+            and isinstance(v, (int, float)) and not isinstance(v, bool)
+            for k, v in data.items()
+        )
+    )
+
+
+class ScoreExtractor:
+    """增量式评分 JSON 提取器
+
+    可以一次性传入完整响应，也可以逐块传入流式输出。文本只扫描一遍：
+    对象外部直接跳到下一个左花括号，对象内部只处理花括号、引号、转义和换行，
+    全角标点与半角标点同等处理，只在解析候选对象时才做转换。
+    评分对象总是不含嵌套的"叶子"对象，因此只在叶子对象闭合时调用一次 json.loads，
+    合法的评分在其右花括号到达时立即返回。
+    字符串中出现换行说明引号不成对，此后直到最外层对象闭合都不再跟踪引号，只按花括号配对，
+    这样被残缺字符串"吞掉"的评分对象仍能找到。
+    """
+
+    def __init__(self):
+        self.scores = {}        # 已找到的全部评分（按出现顺序合并）
+        self._parts = []        # 当前最外层对象已收到的文本片段
+        self._offset = 0        # 当前最外层对象已收到的字符数
+        self._stack = []        # 每层未闭合对象: [起始偏移, 是否包含子对象]
+        self._in_string = False
+        self._escape = False
+        self._ignore_quotes = False  # 当前最外层对象中的引号已不可信
+
+    @property
+    def in_object(self):
+        """当前是否处于未闭合的花括号内"""
+        return bool(self._stack)
+
+    def feed(self, text):
+        """输入一段文本，返回其中新完成的合法评分对象列表"""
+        found = []
+        pos = 0
+        length = len(text)
+        # 当前块中属于未闭合对象的起始位置
+        chunk_start = 0 if self._stack else None
+        # 下一个全角左花括号的位置，缓存起来避免重复扫描
+        next_fullwidth = -2
+
+        while pos < length:
+            if not self._stack:
+                start = text.find('{', pos)
+                if next_fullwidth != -1 and next_fullwidth < pos:
+                    next_fullwidth = text.find('｛', pos)
+                if next_fullwidth != -1 and (start == -1 or next_fullwidth < start):
+                    start = next_fullwidth
+                if start == -1:
+                    break
+                chunk_start = start
+                self._parts = []
+                self._offset = 0
+                self._stack.append([0, False])
+                self._ignore_quotes = False
+                pos = start + 1
+                continue
+
+            if self._escape:
+                self._escape = False
+                pos += 1
+                continue
+
+            if self._ignore_quotes:
+                pattern = _BRACE_TOKENS
+            else:
+                pattern = _STRING_TOKENS if self._in_string else _OBJECT_TOKENS
+            match = pattern.search(text, pos)
+            if match is None:
+                break
+            pos = match.end()
+            char = match.group()
+
+            if char == '\n':
+                if self._in_string:
+                    # JSON 字符串中不允许出现换行，说明引号不成对，放弃字符串状态并不再跟踪引号
+                    self._in_string = False
+                    self._ignore_quotes = True
+            elif self._in_string:
+                if char == '\\':
+                    self._escape = True
+                elif char in _QUOTES:
+                    self._in_string = False
+            elif char in _QUOTES:
+                self._in_string = True
+            elif char in _OPEN_BRACES:
+                self._stack[-1][1] = True
+                self._stack.append([self._offset + (pos - 1 - chunk_start), False])
+            elif char in _CLOSE_BRACES:
+                obj_start, has_child = self._stack.pop()
+                if not has_child:
+                    end = self._offset + (pos - chunk_start)
+                    score = self._parse_candidate(text, chunk_start, obj_start, end)
+                    if score:
+                        self.scores.update(score)
+                        found.append(score)
+                if not self._stack:
+                    self._in_string = False
+                    chunk_start = None
+
+        if self._stack:
+            piece = text[chunk_start:]
+            self._parts.append(piece)
+            self._offset += len(piece)
+        return found
+
+    def _parse_candidate(self, text, chunk_start, obj_start, end):
+        """解析一个叶子对象，合法评分返回字典，否则返回 None"""
+        if obj_start >= self._offset:
+            # 对象完全位于当前块中，直接切片
+            base = chunk_start - self._offset
+            candidate = text[base + obj_start:base + end]
+        else:
+            buffered = ''.join(self._parts)
+            candidate = (buffered + text[chunk_start:chunk_start + end - self._offset])[obj_start:end]
+        if 'hamd' not in candidate:
+            return None
+        candidate = candidate.translate(_PUNCT_TABLE)
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            print(f"JSON解析错误: {candidate}")
+            return None
+        if is_valid_score(data):
+            return data
+        print(f"无效的评分格式: {candidate}")
+        return None
+
+    def result(self):
+        """返回合并后的评分，没有找到时返回 None"""
+        return dict(self.scores) if self.scores else None
+
+
+def parse_scores(response):
+    """从完整响应中解析评分，多个评分对象会被合并"""
+    extractor = ScoreExtractor()
+    extractor.feed(response)
+    return extractor.result()
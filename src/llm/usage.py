@@ -0,0 +1,93 @@
+import threading
+
+
+def usage_counts(usage):
+    """从 completion.usage 中取出提示词、缓存命中和回复的 token 数"""
+    if usage is None:
+        return None
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached_tokens = (getattr(details, 'cached_tokens', 0) or 0) if details else 0
+    return {
+        'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+        'cached_tokens': cached_tokens,
+        'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0
+    }
+
+
+def completion_tokens(completion):
+    """从非流式 completion 中取出实际消耗的总 token 数，供调度器的 TPM 窗口使用"""
+    usage = getattr(completion, 'usage', None)
+    if usage is None:
+        return None
+    return getattr(usage, 'total_tokens', None)
+
+
+class UsageStats:
+    """按评估条目累计 LLM 调用的 token 用量、耗时、重试和追问次数"""
+
+    FIELDS = (
+        'calls', 'prompt_tokens', 'cached_tokens', 'completion_tokens',
+        'wall_time',    # 调用总耗时（秒，含排队和重试）
+        'ttft',         # 首 token 延迟之和（秒）
+        'ttft_calls',   # 有首 token 延迟记录的调用数
+        'retries',      # 调度器重试次数
+        'reasks',       # 因讨论分数而追加"画外音"重新调用的次数
+    )
+
+    def __init__(self):
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def _item(self, item_id):
+        return self.items.setdefault(item_id or 'other', {field: 0 for field in self.FIELDS})
+
+    def record(self, item_id, counts):
+        """记录一次调用的用量，counts 为 usage_counts 的返回值"""
+        if counts is None:
+            return
+        with self._lock:
+            stats = self._item(item_id)
+            stats['calls'] += 1
+            for field in ('prompt_tokens', 'cached_tokens', 'completion_tokens'):
+                stats[field] += counts.get(field, 0)
+
+    def record_timing(self, item_id, wall_time, ttft=None):
+        """记录一次调用的总耗时和首 token 延迟（秒）"""
+        with self._lock:
+            stats = self._item(item_id)
+            stats['wall_time'] += wall_time
+            if ttft is not None:
+                stats['ttft'] += ttft
+                stats['ttft_calls'] += 1
+
+    def increment(self, item_id, field, count=1):
+        """累加 retries / reasks 等计数"""
+        with self._lock:
+            self._item(item_id)[field] += count
+
+    def load(self, summary):
+        """从 summary() 的结果恢复（用于加载进度）"""
+        with self._lock:
+            self.items = {
+                item_id: {field: stats.get(field, 0) for field in self.FIELDS}
+                for item_id, stats in (summary or {}).get('items', {}).items()
+            }
+
+    def summary(self):
+        """返回每个条目及总计的用量、缓存命中率和平均延迟"""
+        with self._lock:
+            items = {item_id: dict(stats) for item_id, stats in self.items.items()}
+
+        total = {field: sum(stats[field] for stats in items.values()) for field in self.FIELDS}
+        for stats in list(items.values()) + [total]:
+            prompt_tokens = stats['prompt_tokens']
+            stats['cache_hit_rate'] = round(stats['cached_tokens'] / prompt_tokens, 4) if prompt_tokens else 0.0
+            stats['wall_time'] = round(stats['wall_time'], 3)
+            stats['ttft'] = round(stats['ttft'], 3)
+            stats['avg_wall_time'] = round(stats['wall_time'] / stats['calls'], 3) if stats['calls'] else 0.0
+            stats['avg_ttft'] = round(stats['ttft'] / stats['ttft_calls'], 3) if stats['ttft_calls'] else 0.0
+        return {'items': items, 'total': total}
+
+
+# 进程级统计，汇总所有会话，用于观察各条目的缓存命中率
+global_usage = UsageStats()
@@ -0,0 +1,76 @@
+import importlib
+import threading
+import time
+
+
+class ASRNotReadyError(RuntimeError):
+    """语音识别模型尚未加载完成"""
+
+
+def load_factory(path):
+    """按 'module:attr' 导入识别器类"""
+    module_name, _, attr = path.partition(':')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def warm_up(recognizer):
+    """识别器提供 warmup 时执行一次预热解码，返回耗时（秒）"""
+    if not hasattr(recognizer, 'warmup'):
+        return 0.0
+    started = time.monotonic()
+    recognizer.warmup()
+    return time.monotonic() - started
+
+
+class BackgroundRecognizer:
+    """在后台线程中导入、加载并预热识别模型（在 Web 进程内加载时使用）
+
+    Web 服务不必等模型加载完成就能响应请求；加载完成前调用识别接口会抛出 ASRNotReadyError。
+    """
+
+    def __init__(self, factory, options=None):
+        self.factory = factory
+        self.options = options or {}
+        self.recognizer = None
+        self.error = None
+        self.load_seconds = None
+        self._ready = threading.Event()
+        threading.Thread(target=self._load, name='asr-loader', daemon=True).start()
+
+    def _load(self):
+        started = time.monotonic()
+        try:
+            recognizer = load_factory(self.factory)(**self.options)
+            warmup_seconds = warm_up(recognizer)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {str(e)}"
+            print(f"语音识别模型加载失败: {self.error}")
+            return
+        self.recognizer = recognizer
+        self.load_seconds = time.monotonic() - started
+        self._ready.set()
+        print(f"语音识别模型已就绪（加载 {self.load_seconds:.1f} 秒，其中预热 {warmup_seconds:.1f} 秒）")
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def _get(self):
+        if not self._ready.is_set():
+            raise ASRNotReadyError(self.error or "语音识别模型尚未加载完成")
+        return self.recognizer
+
+    def transcribe_batch(self, audios, beam_size=None, profile=None):
+        return self._get().transcribe_batch(audios, beam_size=beam_size, profile=profile)
+
+    def transcribe_segments(self, audio_data, beam_size=None, initial_prompt=None):
+        return self._get().transcribe_segments(audio_data, beam_size=beam_size, initial_prompt=initial_prompt)
+
+    def vad_stats(self):
+        return self.recognizer.vad_stats() if self.is_ready() else {}
+
+    def health(self):
+        return {
+            'ready': self.is_ready(),
+            'error': self.error,
+            'load_seconds': round(self.load_seconds, 1) if self.load_seconds else None
+        }
@@ -0,0 +1,63 @@
+# 语音识别模型配置档，按名称选择（asr_config['profile'] 或环境变量 ASR_PROFILE）
+# compute_type 为 'auto' 时沿用原来的行为：GPU 上 float16，CPU 上 float32
+# cpu_threads 为 0 时由 CTranslate2 自行决定线程数
+BELLE_LARGE = "Huan69/Belle-whisper-large-v3-zh-punct-fasterwhisper"
+
+ASR_PROFILES = {
+    'large': {
+        'model': BELLE_LARGE,
+        'compute_type': 'auto',
+        'cpu_threads': 0,
+        'beam_size': 5,
+        'temperature': 0.0,
+    },
+    'large-f32': {
+        'model': BELLE_LARGE,
+        'compute_type': 'float32',
+        'cpu_threads': 0,
+        'beam_size': 5,
+        'temperature': 0.0,
+    },
+    # 权重量化为 int8，CPU 上速度约为 float32 的两倍，精度损失很小
+    'large-int8': {
+        'model': BELLE_LARGE,
+        'compute_type': 'int8',
+        'cpu_threads': 0,
+        'beam_size': 2,
+        'temperature': 0.0,
+    },
+    # 多语言 medium 模型，用于排队时降级
+    'medium-int8': {
+        'model': 'medium',
+        'compute_type': 'int8',
+        'cpu_threads': 0,
+        'beam_size': 2,
+        'temperature': 0.0,
+    },
+    'small-int8': {
+        'model': 'small',
+        'compute_type': 'int8',
+        'cpu_threads': 0,
+        'beam_size': 1,
+        'temperature': 0.0,
+    },
+}
+
+DEFAULT_PROFILE = 'large'
+
+
+def get_profile(name=None):
+    """返回配置档（副本），未知名称抛出 ValueError"""
+    name = name or DEFAULT_PROFILE
+    if name not in ASR_PROFILES:
+        raise ValueError(f"未知的语音识别配置档: {name}，可选: {', '.join(ASR_PROFILES)}")
+    return {'name': name, **ASR_PROFILES[name]}
+
+
+def resolve_compute_type(compute_type, device):
+    """把配置档中的 compute_type 转换为当前设备可用的类型"""
+    if compute_type == 'auto':
+        return "float16" if device == "cuda" else "float32"
+    if compute_type == 'int8' and device == "cuda":
+        return "int8_float16"
+    return compute_type
@@ -0,0 +1,164 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from src.speech.asr_profiles import get_profile
+
+# ASR 队列默认配置，可通过 asr_config['queue'] 覆盖
+DEFAULT_QUEUE_CONFIG = {
+    'workers': 1,            # 批处理线程数（需要 WhisperModel 的 num_workers 不小于该值才能真正并行）
+    'max_batch_size': 8,     # 每批最多合并的语音条数
+    'max_wait': 0.05,        # 收到第一条语音后等待凑批的最长时间（秒）
+    'beam_size': None,       # 为空时使用配置档的 beam
+    'profile': None,         # 正常情况下使用的配置档，为空时使用识别器加载的配置档
+    'fallback_profile': None,  # 排队过长时改用的轻量配置档，为空时不降级
+    'fallback_depth': 6,     # 待识别条数（含当前批）达到该值时切换到轻量配置档
+    'recover_depth': 2,      # 待识别条数降到该值以下时恢复
+}
+
+
+class ASRQueue:
+    """跨会话的批量语音识别队列
+
+    各会话提交整段语音后立即得到 Future，工作线程把短时间内到达的多条语音合并成一批，
+    交给 faster-whisper 一次解码，避免并发的患者在单个解码上串行排队，也不阻塞 eventlet 主循环。
+    """
+
+    def __init__(self, recognizer, config=None):
+        self.recognizer = recognizer
+        self.config = {**DEFAULT_QUEUE_CONFIG, **(config or {})}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.counters = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'batches': 0,
+            'audio_seconds': 0.0,
+            'decode_seconds': 0.0,
+            'wait_seconds': 0.0,
+            'fallback': 0,           # 使用轻量配置档识别的条数
+        }
+        self.degraded = False
+        self.batch_sizes = Counter()
+        self._workers = []
+        for index in range(self.config['workers']):
+            worker = threading.Thread(target=self._run, name=f"asr-queue-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, audio, **options):
+        """提交一段 16 kHz 语音（int16 或 float32），返回识别文本的 concurrent.futures.Future"""
+        future = Future()
+        with self._lock:
+            self.counters['submitted'] += 1
+        self._queue.put((audio, options, future, time.monotonic()))
+        return future
+
+    def _collect(self):
+        """阻塞等待第一条语音，再在 max_wait 内尽量凑满一批"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.config['max_wait']
+        while len(batch) < self.config['max_batch_size']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def set_profile(self, profile=None, fallback_profile=None):
+        """运行时切换配置档（为空表示使用识别器默认的配置档 / 不降级）"""
+        for name in (profile, fallback_profile):
+            if name:
+                get_profile(name)
+        with self._lock:
+            self.config['profile'] = profile
+            self.config['fallback_profile'] = fallback_profile
+            if not fallback_profile:
+                self.degraded = False
+
+    def _choose_profile(self, batch_size):
+        """根据排队长度选择本批使用的配置档，带滞回，避免在两个模型间来回切换"""
+        backlog = self.depth() + batch_size
+        with self._lock:
+            fallback = self.config['fallback_profile']
+            if fallback and not self.degraded and backlog >= self.config['fallback_depth']:
+                self.degraded = True
+                print(f"语音识别排队 {backlog} 条，切换到轻量配置档 {fallback}")
+            elif self.degraded and (not fallback or backlog <= self.config['recover_depth']):
+                self.degraded = False
+                print("语音识别排队已缓解，恢复默认配置档")
+            if self.degraded:
+                self.counters['fallback'] += batch_size
+                return fallback
+            return self.config['profile']
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            profile = self._choose_profile(len(batch))
+            # 选项不同（例如不同的 beam、配置档）的语音分开解码
+            groups = {}
+            for entry in batch:
+                key = tuple(sorted({'profile': profile, **entry[1]}.items()))
+                groups.setdefault(key, []).append(entry)
+
+            for key, entries in groups.items():
+                live = [entry for entry in entries if entry[2].set_running_or_notify_cancel()]
+                if not live:
+                    continue
+                try:
+                    texts = self.recognizer.transcribe_batch(
+                        [entry[0] for entry in live],
+                        **{'beam_size': self.config['beam_size'], **dict(key)}
+                    )
+                except Exception as e:
+                    print(f"批量语音识别出错: {str(e)}")
+                    for _, _, future, _ in live:
+                        future.set_exception(e)
+                    with self._lock:
+                        self.counters['failed'] += len(live)
+                    continue
+                for (_, _, future, _), text in zip(live, texts):
+                    future.set_result(text)
+                with self._lock:
+                    self.counters['completed'] += len(live)
+
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self.counters['batches'] += 1
+                self.counters['decode_seconds'] += elapsed
+                self.counters['audio_seconds'] += sum(len(entry[0]) for entry in batch) / 16000
+                self.counters['wait_seconds'] += sum(started - entry[3] for entry in batch)
+                self.batch_sizes[len(batch)] += 1
+
+    def depth(self):
+        """当前排队中的语音条数"""
+        return self._queue.qsize()
+
+    def stats(self):
+        """返回队列深度、批大小分布和实时率等指标"""
+        with self._lock:
+            counters = dict(self.counters)
+            batch_sizes = dict(sorted(self.batch_sizes.items()))
+        batches = counters['batches']
+        decoded = sum(size * count for size, count in batch_sizes.items())
+        return {
+            **counters,
+            'queue_depth': self.depth(),
+            'profile': self.config['profile'],
+            'fallback_profile': self.config['fallback_profile'],
+            'degraded': self.degraded,
+            'batch_sizes': batch_sizes,
+            'avg_batch_size': round(decoded / batches, 2) if batches else 0.0,
+            'avg_wait': round(counters['wait_seconds'] / decoded, 3) if decoded else 0.0,
+            # 实时率：解码耗时 / 音频时长，小于 1 表示快于实时
+            'real_time_factor': round(counters['decode_seconds'] / counters['audio_seconds'], 3)
+            if counters['audio_seconds'] else 0.0,
+        }
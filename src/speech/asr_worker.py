@@ -0,0 +1,360 @@
+import argparse
+import atexit
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+
+from src.speech.asr_loader import load_factory, warm_up
+
+# 独立识别进程的默认配置，可通过 asr_config['worker'] 覆盖
+DEFAULT_WORKER_CONFIG = {
+    'processes': 1,                 # 识别进程数，每个进程各自加载一份模型
+    'factory': 'speech.speech_recognition:SpeechRecognition',  # 子进程中创建识别器的类
+    'heartbeat_interval': 2.0,      # 子进程发送心跳的间隔（秒）
+    'heartbeat_timeout': 30.0,      # 超过该时间没有收到心跳视为卡死并重启（秒）
+    'request_timeout': 120.0,       # 单次识别请求的最长时间（秒），超时后重启该进程
+    'connect_timeout': 60.0,        # 等待子进程开始监听的最长时间（秒）
+    'check_interval': 1.0,          # 健康检查间隔（秒）
+    'restart_backoff': 2.0,         # 进程在加载完成前就退出时，重启前等待的基础时间（秒），逐次翻倍
+}
+
+AUTHKEY_ENV = 'HAMD_ASR_AUTHKEY'
+
+
+class ASRWorkerError(RuntimeError):
+    """识别进程返回错误或在请求完成前退出"""
+
+
+def _worker_address(index):
+    name = f"hamd-asr-{os.getpid()}-{index}-{uuid.uuid4().hex[:8]}"
+    if sys.platform == 'win32':
+        return '\\\\.\\pipe\\' + name
+    return os.path.join(tempfile.gettempdir(), name + '.sock')
+
+
+class _WorkerHandle:
+    """父进程中对一个识别进程的记录"""
+
+    def __init__(self, index, process, address):
+        self.index = index
+        self.process = process
+        self.address = address
+        self.conn = None
+        self.backlog = []          # 连接建立前提交的请求
+        self.send_lock = threading.Lock()
+        self.pending = {}          # request_id -> (future, 发送时间)
+        self.started = time.monotonic()
+        self.last_heartbeat = self.started
+        self.ready = False         # 模型已加载、可以接收请求
+        self.loaded = False        # 是否曾经加载成功（用于判断是否需要退避）
+        self.failures = 0          # 连续未能加载成功的次数
+        self.restarting = False
+        self.status = {}           # 子进程随心跳上报的状态
+
+
+class ASRWorkerPool:
+    """在独立进程中运行语音识别
+
+    Web 进程只负责收发音频，不导入 torch / faster-whisper；每个子进程加载一份模型，
+    通过本地 Unix socket（Windows 上为命名管道）接收请求。后台线程检查进程存活、心跳和请求超时，
+    异常时重启进程并让未完成的请求以 ASRWorkerError 失败。
+    对外提供与 SpeechRecognition 相同的 transcribe_batch / transcribe_segments 接口，
+    可以直接交给 ASRQueue 和 StreamingASR 使用。
+    """
+
+    def __init__(self, config=None, model_options=None):
+        self.config = {**DEFAULT_WORKER_CONFIG, **(config or {})}
+        self.model_options = model_options or {}
+        self._authkey = os.urandom(16)
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.counters = {'requests': 0, 'failed': 0, 'restarts': 0}
+        self.workers = [self._spawn(index) for index in range(self.config['processes'])]
+        threading.Thread(target=self._monitor, name='asr-worker-monitor', daemon=True).start()
+        # Web 进程退出时一并结束识别进程
+        atexit.register(self.close)
+
+    def _spawn(self, index):
+        address = _worker_address(index)
+        env = dict(os.environ)
+        env[AUTHKEY_ENV] = self._authkey.hex()
+        # 子进程使用与当前进程相同的模块搜索路径
+        env['PYTHONPATH'] = os.pathsep.join(path for path in sys.path if path)
+        process = subprocess.Popen([
+            sys.executable, '-m', __name__,
+            '--address', address,
+            '--factory', self.config['factory'],
+            '--options', json.dumps(self.model_options),
+            '--heartbeat', str(self.config['heartbeat_interval'])
+        ], env=env)
+        handle = _WorkerHandle(index, process, address)
+        threading.Thread(target=self._read, args=(handle,), name=f"asr-worker-{index}-reader", daemon=True).start()
+        print(f"已启动 ASR 识别进程 {index} (pid={process.pid})")
+        return handle
+
+    def _connect(self, handle):
+        """等待子进程开始监听后连接，子进程提前退出时返回 None"""
+        deadline = time.monotonic() + self.config['connect_timeout']
+        while time.monotonic() < deadline and not handle.restarting:
+            if handle.process.poll() is not None:
+                return None
+            try:
+                return Client(handle.address, authkey=self._authkey)
+            except OSError:
+                time.sleep(0.1)
+        return None
+
+    def _read(self, handle):
+        conn = self._connect(handle)
+        if conn is None:
+            return
+        try:
+            with handle.send_lock:
+                for message in handle.backlog:
+                    conn.send(message)
+                handle.backlog = []
+                handle.conn = conn
+        except OSError:
+            return
+
+        while True:
+            try:
+                kind, request_id, payload = conn.recv()
+            except (EOFError, OSError):
+                break
+            handle.last_heartbeat = time.monotonic()
+            if kind == 'heartbeat':
+                handle.status = payload or {}
+            elif kind == 'ready':
+                handle.ready = handle.loaded = True
+                print(f"ASR 识别进程 {handle.index} 已就绪")
+            elif kind == 'fatal':
+                print(f"ASR 识别进程 {handle.index} 加载失败: {payload}")
+            elif kind in ('result', 'error'):
+                with self._lock:
+                    entry = handle.pending.pop(request_id, None)
+                    if entry and kind == 'error':
+                        self.counters['failed'] += 1
+                if entry is None:
+                    continue
+                if kind == 'result':
+                    entry[0].set_result(payload)
+                else:
+                    entry[0].set_exception(ASRWorkerError(payload))
+
+    def submit(self, method, *args, **kwargs):
+        """把一次调用发给负载最低的识别进程，返回 concurrent.futures.Future"""
+        with self._lock:
+            candidates = [worker for worker in self.workers if worker.ready] or self.workers
+            handle = min(candidates, key=lambda worker: len(worker.pending))
+        return self._submit_to(handle, method, args, kwargs)
+
+    def _submit_to(self, handle, method, args, kwargs):
+        future = Future()
+        with self._lock:
+            request_id = next(self._ids)
+            handle.pending[request_id] = (future, time.monotonic())
+            self.counters['requests'] += 1
+        message = (request_id, method, args, kwargs)
+        try:
+            with handle.send_lock:
+                if handle.conn is None:
+                    handle.backlog.append(message)
+                else:
+                    handle.conn.send(message)
+        except OSError as e:
+            with self._lock:
+                entry = handle.pending.pop(request_id, None)
+                if entry:
+                    self.counters['failed'] += 1
+            if entry:
+                future.set_exception(ASRWorkerError(f"识别进程不可用: {str(e)}"))
+        return future
+
+    def call(self, method, *args, **kwargs):
+        """同步调用，在识别线程中使用"""
+        return self.submit(method, *args, **kwargs).result(timeout=self.config['request_timeout'] + 5)
+
+    def transcribe_batch(self, audios, beam_size=None, profile=None):
+        return self.call('transcribe_batch', audios, beam_size=beam_size, profile=profile)
+
+    def transcribe_segments(self, audio_data, beam_size=None, initial_prompt=None):
+        return self.call('transcribe_segments', audio_data, beam_size=beam_size, initial_prompt=initial_prompt)
+
+    def transcribe_audio(self, audio_data):
+        return self.call('transcribe_audio', audio_data)
+
+    def vad_stats(self):
+        """汇总各识别进程随心跳上报的静音裁剪统计"""
+        totals = {}
+        for worker in list(self.workers):
+            for key, value in (worker.status.get('vad') or {}).items():
+                if key != 'skipped_ratio':
+                    totals[key] = totals.get(key, 0) + value
+        if totals.get('input_seconds'):
+            totals['skipped_ratio'] = round(totals['skipped_seconds'] / totals['input_seconds'], 3)
+        return totals
+
+    def _check(self, handle, now):
+        """返回需要重启的原因，健康时返回 None"""
+        code = handle.process.poll()
+        if code is not None:
+            return f"进程退出 (exitcode={code})"
+        if now - handle.last_heartbeat > self.config['heartbeat_timeout']:
+            return "心跳超时"
+        with self._lock:
+            oldest = min((sent for _, sent in handle.pending.values()), default=None)
+        if handle.ready and oldest is not None and now - oldest > self.config['request_timeout']:
+            return "识别请求超时"
+        return None
+
+    def _monitor(self):
+        while not self._closed:
+            time.sleep(self.config['check_interval'])
+            now = time.monotonic()
+            for handle in list(self.workers):
+                if handle.restarting:
+                    continue
+                reason = self._check(handle, now)
+                if reason:
+                    handle.restarting = True
+                    threading.Thread(target=self._restart, args=(handle, reason), daemon=True).start()
+
+    def _fail(self, handle, reason):
+        with self._lock:
+            pending, handle.pending = handle.pending, {}
+            self.counters['failed'] += len(pending)
+        for future, _ in pending.values():
+            future.set_exception(ASRWorkerError(reason))
+
+    def _stop(self, handle):
+        if handle.process.poll() is None:
+            handle.process.terminate()
+            try:
+                handle.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                handle.process.kill()
+        if handle.conn is not None:
+            handle.conn.close()
+
+    def _restart(self, handle, reason):
+        print(f"ASR 识别进程 {handle.index} 异常（{reason}），正在重启")
+        handle.ready = False
+        with self._lock:
+            self.counters['restarts'] += 1
+        self._fail(handle, f"识别进程重启：{reason}")
+        self._stop(handle)
+        if self._closed:
+            return
+
+        # 进程还没加载成功就退出（例如模型缺失）时逐次延长等待，避免频繁重启
+        failures = 0 if handle.loaded else handle.failures + 1
+        if failures:
+            time.sleep(min(self.config['restart_backoff'] * 2 ** (failures - 1), 60))
+        new_handle = self._spawn(handle.index)
+        new_handle.failures = failures
+        with self._lock:
+            self.workers[handle.index] = new_handle
+        # 替换前仍可能有请求落到旧进程上
+        self._fail(handle, f"识别进程重启：{reason}")
+
+    def is_ready(self):
+        return any(worker.ready for worker in self.workers)
+
+    def health(self):
+        """各识别进程的状态"""
+        now = time.monotonic()
+        with self._lock:
+            workers = [{
+                'index': worker.index,
+                'pid': worker.process.pid,
+                'alive': worker.process.poll() is None,
+                'ready': worker.ready,
+                'pending': len(worker.pending),
+                'heartbeat_age': round(now - worker.last_heartbeat, 1),
+                'failures': worker.failures,
+            } for worker in self.workers]
+            counters = dict(self.counters)
+        return {**counters, 'ready': any(worker['ready'] for worker in workers), 'workers': workers}
+
+    def close(self):
+        """停止所有识别进程"""
+        self._closed = True
+        for handle in list(self.workers):
+            handle.restarting = True
+            self._fail(handle, "识别服务已关闭")
+            self._stop(handle)
+
+
+def serve(address, authkey, factory, options, heartbeat_interval):
+    """子进程入口：监听本地地址，加载模型后逐个处理请求"""
+    with Listener(address, authkey=authkey) as listener:
+        conn = listener.accept()
+    send_lock = threading.Lock()
+    loaded = {}
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def heartbeat():
+        # 独立线程发送心跳（附带识别器状态），模型加载和解码期间也能证明进程存活
+        while True:
+            try:
+                recognizer = loaded.get('recognizer')
+                status = {'vad': recognizer.vad_stats()} if hasattr(recognizer, 'vad_stats') else {}
+                send(('heartbeat', None, status))
+            except OSError:
+                return
+            time.sleep(heartbeat_interval)
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    try:
+        recognizer = loaded['recognizer'] = load_factory(factory)(**options)
+        # 预热解码一次，避免第一条真实语音变慢
+        warmup_seconds = warm_up(recognizer)
+    except Exception as e:
+        send(('fatal', None, f"{type(e).__name__}: {str(e)}"))
+        raise
+    print(f"识别进程预热完成，耗时 {warmup_seconds:.1f} 秒")
+    send(('ready', None, None))
+
+    while True:
+        try:
+            request_id, method, args, kwargs = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            send(('result', request_id, getattr(recognizer, method)(*args, **kwargs)))
+        except Exception as e:
+            print(f"识别进程处理请求出错: {str(e)}")
+            send(('error', request_id, f"{type(e).__name__}: {str(e)}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HAMD 语音识别子进程")
+    parser.add_argument('--address', required=True)
+    parser.add_argument('--factory', default=DEFAULT_WORKER_CONFIG['factory'])
+    parser.add_argument('--options', default='{}')
+    parser.add_argument('--heartbeat', type=float, default=DEFAULT_WORKER_CONFIG['heartbeat_interval'])
+    args = parser.parse_args()
+    serve(
+        args.address,
+        bytes.fromhex(os.environ[AUTHKEY_ENV]),
+        args.factory,
+        json.loads(args.options),
+        args.heartbeat
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import base64
+import io
+import wave
+
+import numpy as np
+
+# 识别模型使用的采样率
+TARGET_SAMPLE_RATE = 16000
+
+
+def to_float32(audio):
+    """把 int16 PCM 转为 [-1, 1] 的 float32；已经是 float32 时原样返回，不复制"""
+    if audio.dtype == np.float32:
+        return audio
+    if audio.dtype == np.int16:
+        return audio.astype(np.float32) * (1.0 / 32768.0)
+    return audio.astype(np.float32)
+
+
+def to_mono(audio, channels):
+    """多声道交错采样取平均"""
+    if channels > 1:
+        return audio.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    return audio
+
+
+def resample(audio, sample_rate):
+    """线性插值重采样到 16 kHz（客户端已按 16 kHz 上传时不会调用）"""
+    if sample_rate == TARGET_SAMPLE_RATE or not len(audio):
+        return audio
+    audio = to_float32(audio)
+    count = int(round(len(audio) * TARGET_SAMPLE_RATE / sample_rate))
+    positions = np.arange(count, dtype=np.float64) * (sample_rate / TARGET_SAMPLE_RATE)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def decode_pcm(data, sample_format='pcm16', sample_rate=TARGET_SAMPLE_RATE, channels=1):
+    """解析原始 PCM 字节
+
+    16 kHz 单声道时直接用 np.frombuffer 引用原始缓冲区，不做复制；
+    int16 保持原样返回，由识别进程在解码前转为 float32，进程间传输的数据量也减半。
+    """
+    if sample_format == 'pcm16':
+        audio = np.frombuffer(data, dtype='<i2')
+    elif sample_format == 'f32':
+        audio = np.frombuffer(data, dtype='<f4')
+    else:
+        raise ValueError(f"不支持的音频格式: {sample_format}")
+    if channels > 1:
+        audio = to_mono(to_float32(audio), channels)
+    return resample(audio, sample_rate)
+
+
+def decode_compressed(data):
+    """用 PyAV（faster-whisper 的依赖）解码 webm/opus 等压缩音频为 16 kHz 单声道 int16"""
+    import av
+
+    frames = []
+    with av.open(io.BytesIO(data), mode='r', metadata_errors='ignore') as container:
+        resampler = av.audio.resampler.AudioResampler(format='s16', layout='mono', rate=TARGET_SAMPLE_RATE)
+        for frame in container.decode(audio=0):
+            for resampled in resampler.resample(frame):
+                frames.append(resampled.to_ndarray().reshape(-1))
+        for resampled in resampler.resample(None):
+            frames.append(resampled.to_ndarray().reshape(-1))
+    return np.concatenate(frames) if frames else np.zeros(0, dtype=np.int16)
+
+
+def decode_wav(wav_data):
+    """解析 WAV 字节，按文件头中的采样位宽、声道数和采样率转换"""
+    with io.BytesIO(wav_data) as wav_io:
+        with wave.open(wav_io, 'rb') as wav_file:
+            # 获取音频参数
+            channels = wav_file.getnchannels()
+            sample_width = wav_file.getsampwidth()
+            sample_rate = wav_file.getframerate()
+
+            # 读取音频数据
+            frames = wav_file.readframes(wav_file.getnframes())
+
+    if sample_width == 2:
+        audio = np.frombuffer(frames, dtype='<i2')
+    elif sample_width == 4:
+        # 旧版前端把 float32 采样写进了 PCM 格式的 WAV
+        audio = np.frombuffer(frames, dtype='<f4')
+    elif sample_width == 1:
+        audio = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    else:
+        raise ValueError(f"不支持的采样位宽: {sample_width}")
+    if channels > 1:
+        audio = to_mono(to_float32(audio), channels)
+    return resample(audio, sample_rate)
+
+
+def decode_wav_base64(audio_data):
+    """把 base64 编码的 WAV 解码为 numpy 数组（只依赖 numpy，Web 进程可直接使用）"""
+    return decode_wav(base64.b64decode(audio_data))
+
+
+def decode_audio_payload(payload):
+    """解析 audio_data 事件的数据
+
+    新版前端发送 {'format': 'pcm16' | 'f32' | 'opus', 'sample_rate': ..., 'channels': ..., 'audio': 二进制}，
+    旧版前端发送 base64 编码的 WAV 字符串。返回 16 kHz 单声道的 int16 或 float32 数组。
+    """
+    if isinstance(payload, str):
+        return decode_wav_base64(payload)
+    data = payload['audio']
+    sample_format = payload.get('format', 'pcm16')
+    if sample_format in ('opus', 'webm'):
+        return decode_compressed(data)
+    if sample_format == 'wav':
+        return decode_wav(data)
+    return decode_pcm(
+        data,
+        sample_format,
+        int(payload.get('sample_rate', TARGET_SAMPLE_RATE)),
+        int(payload.get('channels', 1))
+    )
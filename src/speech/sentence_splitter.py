@@ -0,0 +1,50 @@
+# 中文句末标点，遇到即切分
+SENTENCE_ENDINGS = '。！？；'
+# 紧跟在句末标点之后、应归入同一句的字符
+SENTENCE_CLOSERS = '。！？；…”’」』）)"\''
+
+
+class SentenceSplitter:
+    """把流式到达的文本按中文句末标点切分成完整的句子
+
+    feed() 返回本次凑齐的句子，不足 min_chars 个字的短句与后一句合并，
+    减少零碎的合成请求；flush() 返回剩下的半句。
+    """
+
+    def __init__(self, endings=SENTENCE_ENDINGS, min_chars=4):
+        self.endings = endings
+        self.min_chars = min_chars
+        self.pending = ''
+
+    def feed(self, text):
+        self.pending += text
+        sentences = []
+        start = 0
+        index = 0
+        while index < len(self.pending):
+            if self.pending[index] not in self.endings:
+                index += 1
+                continue
+            # 连续的标点和右引号、右括号归入当前句
+            end = index + 1
+            while end < len(self.pending) and self.pending[end] in SENTENCE_CLOSERS:
+                end += 1
+            if end == len(self.pending):
+                # 标点在末尾时，后面可能还会有引号，等下一段文本再切
+                break
+            sentence = self.pending[start:end].strip()
+            if len(sentence) >= self.min_chars:
+                sentences.append(sentence)
+                start = end
+            index = end
+        self.pending = self.pending[start:]
+        return sentences
+
+    def flush(self):
+        """返回剩余的文本（没有标点结尾的最后半句），没有时返回空字符串"""
+        rest = self.pending.strip()
+        self.pending = ''
+        return rest
+
+    def reset(self):
+        self.pending = ''
@@ -1,57 +1,86 @@
-from transformers import pipeline
-import sounddevice as sd
 import numpy as np
-import torch
-import os
-import tempfile
-import soundfile as sf
-import base64
-import io
-import wave
 import threading
-from optimum.bettertransformer import BetterTransformer
-from transformers import WhisperProcessor
+import ctranslate2
 from faster_whisper import WhisperModel
+from faster_whisper.tokenizer import Tokenizer
+try:
+    # faster-whisper 1.1.0 起才有带默认长度的 pad_or_trim，旧版本只能逐条识别
+    from faster_whisper.audio import pad_or_trim
+except ImportError:
+    pad_or_trim = None
+from src.speech.audio_io import decode_wav_base64, to_float32
+from src.speech.vad import SpeechTrimmer
+from src.speech.asr_profiles import get_profile, resolve_compute_type
+
+def cuda_available():
+    """CTranslate2 是否能使用 GPU"""
+    return ctranslate2.get_cuda_device_count() > 0
 
 def check_gpu_status():
     """检查GPU状态"""
+    # 直接询问 faster-whisper 使用的 CTranslate2，不需要导入 torch
     print("\n=== GPU 状态检查 ===")
-    print(f"PyTorch版本: {torch.__version__}")
-    print(f"CUDA是否可用: {torch.cuda.is_available()}")
-    if torch.cuda.is_available():
-        print(f"CUDA版本: {torch.version.cuda}")
-        print(f"当前GPU设备: {torch.cuda.get_device_name(0)}")
-        print(f"GPU数量: {torch.cuda.device_count()}")
+    print(f"CTranslate2版本: {ctranslate2.__version__}")
+    print(f"CUDA是否可用: {cuda_available()}")
+    if cuda_available():
+        print(f"GPU数量: {ctranslate2.get_cuda_device_count()}")
+        print(f"GPU支持的计算类型: {sorted(ctranslate2.get_supported_compute_types('cuda'))}")
     else:
         print("CUDA不可用")
     print("=================\n")
 
+# 批量解码直接调用的 faster-whisper 内部接口（按 faster-whisper 1.1 编写）
+BATCH_DECODE_ATTRIBUTES = ('hf_tokenizer', 'feature_extractor', 'encode', 'get_prompt', 'max_length')
+
+def supports_batch_decode(model):
+    """当前 faster-whisper 版本是否提供批量解码需要的内部接口"""
+    if pad_or_trim is None:
+        return False
+    if not all(hasattr(model, name) for name in BATCH_DECODE_ATTRIBUTES):
+        return False
+    return hasattr(getattr(model, 'model', None), 'generate')
+
 class SpeechRecognition:
-    _instance = None
-    _lock = threading.Lock()
-    _initialized = False
+    # 每个配置档一个实例，确保同一模型只被加载一次
+    _instances = {}
+    _lock = threading.RLock()
 
-    def __new__(cls, *args, **kwargs):
+    def __new__(cls, *args, profile=None, **kwargs):
+        name = get_profile(profile)['name']
         with cls._lock:
-            if cls._instance is None:
-                cls._instance = super(SpeechRecognition, cls).__new__(cls)
-            return cls._instance
+            if name not in cls._instances:
+                instance = super(SpeechRecognition, cls).__new__(cls)
+                instance._initialized = False
+                cls._instances[name] = instance
+            return cls._instances[name]
 
-    def __init__(self, model_name="Huan69/Belle-whisper-large-v3-zh-punct-fasterwhisper", use_auth_token=None):
+    def __init__(self, model_name=None, use_auth_token=None, cpu_threads=None, num_workers=1, vad=None,
+                 profile=None, fallback_profile=None, preload_fallback=False):
         # 使用单例模式，确保模型只被加载一次
         with self.__class__._lock:
-            if self.__class__._initialized:
+            if self._initialized:
                 return
+            
+            # 配置档决定模型、量化方式、CPU 线程数、beam 和 temperature，显式参数优先
+            self.profile = get_profile(profile)
+            model_name = model_name or self.profile['model']
+            if cpu_threads is None:
+                cpu_threads = self.profile['cpu_threads']
+            self.beam_size = self.profile['beam_size']
+            self.temperature = self.profile['temperature']
+            self.num_workers = num_workers
+            self.vad_config = vad
+            self.fallback_profile = fallback_profile
                 
-            print("初始化语音识别模型...")
+            print(f"初始化语音识别模型（配置档 {self.profile['name']}）...")
             # 初始化时检查一次 GPU 状态
             check_gpu_status()
             
             # 判断使用CPU还是GPU
-            compute_type = "float16" if torch.cuda.is_available() else "float32"
-            device = "cuda" if torch.cuda.is_available() else "cpu"
+            device = "cuda" if cuda_available() else "cpu"
+            compute_type = resolve_compute_type(self.profile['compute_type'], device)
             self.device = device
-            print(f"Using device: {device} for FasterWhisper model")
+            print(f"Using device: {device}, compute_type: {compute_type} for FasterWhisper model")
             
             try:
                 # 安装 onnxruntime 以支持 VAD 功能
@@ -68,6 +97,8 @@ class SpeechRecognition:
                     model_name,
                     device=device,
                     compute_type=compute_type,
+                    cpu_threads=cpu_threads,  # CPU 推理线程数，0 表示使用默认值
+                    num_workers=num_workers,  # 允许多个线程同时解码
                     download_root=None  # 使用默认下载路径
                 )
                 
@@ -79,13 +110,31 @@ class SpeechRecognition:
                 print(traceback.format_exc())
                 raise
             
+            # 内部接口不可用时退回逐条 transcribe，而不是在会话中途报错
+            self.batch_decode = supports_batch_decode(self.model)
+            if not self.batch_decode:
+                print("警告: 当前 faster-whisper 版本不支持批量解码，改为逐条识别")
+            
+            # 识别前裁掉首尾静音、拒绝空语音
+            self.trimmer = SpeechTrimmer(vad, silero_available=self.vad_available)
+            
             self.recording = False
             self.sample_rate = 16000
             self.audio_data = []
             self.stream = None
             
             # 标记为已初始化
-            self.__class__._initialized = True
+            self._initialized = True
+            
+            # 预先加载降级使用的轻量模型，避免排队时才开始加载
+            if fallback_profile and preload_fallback:
+                self.for_profile(fallback_profile)
+    
+    def for_profile(self, profile):
+        """返回指定配置档的识别器（同一进程内按需加载），profile 为空时返回自身"""
+        if not profile or profile == self.profile['name']:
+            return self
+        return SpeechRecognition(profile=profile, num_workers=self.num_workers, vad=self.vad_config)
         
     def start_recording(self):
         """开始录音"""
@@ -106,6 +155,9 @@ class SpeechRecognition:
                 if self.recording:
                     self.audio_data.append(indata.copy())
             
+            # 只有本地录音才需要 sounddevice，按需导入
+            import sounddevice as sd
+            
             self.stream = sd.InputStream(
                 channels=1,
                 samplerate=self.sample_rate,
@@ -146,10 +198,6 @@ class SpeechRecognition:
                 
                 print(f"处理后的录音数据形状: {audio_data.shape}")
                 
-                # 清理GPU缓存
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-                
                 # 使用 FasterWhisper 进行识别
                 segments, info = self.model.transcribe(
                     audio_data, 
@@ -178,50 +226,16 @@ class SpeechRecognition:
             print(f"录音处理错误: {str(e)}")
             return ""
     
+    @staticmethod
+    def decode_audio(audio_data):
+        """把 base64 编码的 WAV 解码为 numpy 数组（不做识别，可在识别队列之前调用）"""
+        return decode_wav_base64(audio_data)
+    
     def process_audio(self, audio_data):
         """处理音频数据并返回识别结果"""
         try:
-            # 解码 base64 数据
-            wav_data = base64.b64decode(audio_data)
-            
-            # 使用 wave 模块读取音频数据
-            with io.BytesIO(wav_data) as wav_io:
-                with wave.open(wav_io, 'rb') as wav_file:
-                    # 获取音频参数
-                    channels = wav_file.getnchannels()
-                    sample_width = wav_file.getsampwidth()
-                    sample_rate = wav_file.getframerate()
-                    
-                    # 读取音频数据
-                    audio_data = wav_file.readframes(wav_file.getnframes())
-                    
-                    # 转换为 numpy 数组
-                    audio_np = np.frombuffer(audio_data, dtype=np.float32)
-            
-            # 确保音频是单通道的
-            if len(audio_np.shape) > 1:
-                audio_np = audio_np.mean(axis=1)
-            
-            print(f"音频数据形状: {audio_np.shape}")
-            print(f"音频采样率: {sample_rate}")
-            
-            # 使用 FasterWhisper 进行识别
-            segments, info = self.model.transcribe(
-                audio_np, 
-                language="zh",
-                task="transcribe", 
-                beam_size=5,
-                vad_filter=self.vad_available,  # 根据 onnxruntime 是否可用决定是否启用 VAD
-                vad_parameters={"threshold": 0.5},  # VAD 灵敏度阈值
-                initial_prompt=None,  # 可以提供初始提示来引导转录
-                word_timestamps=False,  # 是否生成单词级时间戳
-                condition_on_previous_text=True,  # 是否基于之前的文本进行条件化生成
-                temperature=0.0  # 使用确定性解码
-            )
-            
-            # 提取文本
-            text = " ".join([segment.text for segment in segments])
-            return text.strip()
+            audio_np = to_float32(self.decode_audio(audio_data))
+            return self.transcribe_audio(audio_np)
             
         except Exception as e:
             print(f"语音识别错误: {str(e)}")
@@ -235,19 +249,30 @@ class SpeechRecognition:
             # 确保音频是单通道的
             if len(audio_data.shape) > 1:
                 audio_data = audio_data.flatten()
+            audio_data = self.trimmer.trim(to_float32(audio_data))
+            if audio_data is None:
+                return ""
+            return self._transcribe_long(audio_data)
             
+        except Exception as e:
+            print(f"音频转写错误: {str(e)}")
+            return ""
+    
+    def _transcribe_long(self, audio_data):
+        """完整的 transcribe 流程，可处理超过 30 秒的音频"""
+        try:
             # 使用 FasterWhisper 进行识别
             segments, info = self.model.transcribe(
                 audio_data, 
                 language="zh",
                 task="transcribe", 
-                beam_size=5,
+                beam_size=self.beam_size,  # 由配置档决定
                 vad_filter=self.vad_available,  # 根据 onnxruntime 是否可用决定是否启用 VAD
                 vad_parameters={"threshold": 0.5},  # VAD 灵敏度阈值
                 initial_prompt=None,  # 可以提供初始提示来引导转录
                 word_timestamps=False,  # 是否生成单词级时间戳
                 condition_on_previous_text=True,  # 是否基于之前的文本进行条件化生成
-                temperature=0.0  # 使用确定性解码
+                temperature=self.temperature  # 由配置档决定，默认使用确定性解码
             )
             
             # 提取文本
@@ -258,6 +283,94 @@ class SpeechRecognition:
             print(f"音频转写错误: {str(e)}")
             return ""
     
+    def transcribe_batch(self, audios, beam_size=None, profile=None):
+        """批量识别多段 16 kHz 语音（int16 或 float32），返回文本列表
+
+        不超过 30 秒的语音合并为一批，一次编码和解码；更长的语音逐条走完整的 transcribe。
+        profile 指定时改用该配置档的模型解码（静音裁剪仍在本实例完成，统计集中在一处）。
+        """
+        decoder = self.for_profile(profile)
+        beam_size = beam_size or decoder.beam_size
+        max_samples = self.sample_rate * 30
+        texts = [None] * len(audios)
+        trimmed = []
+        for audio in audios:
+            audio = self.trimmer.trim(to_float32(audio))
+            # 没有语音的录音不做识别
+            trimmed.append(np.zeros(0, dtype=np.float32) if audio is None else audio)
+        audios = trimmed
+        short = [i for i, audio in enumerate(audios) if 0 < len(audio) <= max_samples]
+        for i, audio in enumerate(audios):
+            if not len(audio):
+                texts[i] = ""
+            elif len(audio) > max_samples:
+                texts[i] = decoder._transcribe_long(audio)
+        if short and not decoder.batch_decode:
+            for i in short:
+                texts[i] = decoder._transcribe_long(audios[i])
+        elif short:
+            for i, text in zip(short, decoder._decode_batch([audios[i] for i in short], beam_size)):
+                texts[i] = text
+        return texts
+    
+    def _decode_batch(self, audios, beam_size):
+        """把多段不超过 30 秒的音频合并为一批，一次编码和解码"""
+        tokenizer = Tokenizer(
+            self.model.hf_tokenizer,
+            self.model.model.is_multilingual,
+            task="transcribe",
+            language="zh"
+        )
+        features = np.stack([pad_or_trim(self.model.feature_extractor(audio)) for audio in audios])
+        encoder_output = self.model.encode(features)
+        prompt = self.model.get_prompt(tokenizer, previous_tokens=[], without_timestamps=True)
+        results = self.model.model.generate(
+            encoder_output,
+            [prompt] * len(audios),
+            beam_size=beam_size,
+            max_length=self.model.max_length,
+            suppress_blank=True,
+            suppress_tokens=[-1]
+        )
+        return [tokenizer.decode(result.sequences_ids[0]).strip() for result in results]
+    
+    def warmup(self):
+        """用一秒静音做一次解码（跳过静音裁剪），让第一条真实语音不再承担初始化开销"""
+        silence = np.zeros(self.sample_rate, dtype=np.float32)
+        self._warm_decode(silence)
+        if self.fallback_profile and self.fallback_profile in self._instances:
+            self.for_profile(self.fallback_profile)._warm_decode(silence)
+    
+    def _warm_decode(self, silence):
+        if not self.batch_decode:
+            self._transcribe_long(silence)
+            return
+        try:
+            self._decode_batch([silence], self.beam_size)
+        except (AttributeError, TypeError) as e:
+            # 接口存在但签名不兼容：启动时发现，退回逐条识别
+            print(f"警告: 批量解码不可用（{str(e)}），改为逐条识别")
+            self.batch_decode = False
+    
+    def transcribe_segments(self, audio_data, beam_size=None, initial_prompt=None):
+        """识别 16 kHz 音频，返回 [(开始秒, 结束秒, 文本)]（流式识别使用）"""
+        segments, info = self.model.transcribe(
+            to_float32(audio_data),
+            language="zh",
+            task="transcribe",
+            beam_size=beam_size or self.beam_size,
+            vad_filter=False,  # 流式识别的缓冲区很短，由客户端控制起止
+            initial_prompt=initial_prompt,  # 已确认的文本作为上下文
+            word_timestamps=False,
+            condition_on_previous_text=True,
+            temperature=self.temperature
+        )
+        return [(segment.start, segment.end, segment.text.strip()) for segment in segments]
+    
+    def vad_stats(self):
+        """静音裁剪的统计（跳过的音频时长、拒绝的空语音条数）"""
+        return self.trimmer.stats()
+    
     def __del__(self):
         """析构函数，确保资源被正确释放"""
         if self.stream is not None:
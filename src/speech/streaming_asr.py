@@ -0,0 +1,197 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.speech.vad import EndpointDetector, SpeechTrimmer, find_speech
+
+# 流式识别默认配置，可通过 asr_config['streaming'] 覆盖
+DEFAULT_STREAMING_CONFIG = {
+    'enabled': True,
+    'sample_rate': 16000,
+    'partial_interval': 0.8,   # 两次中间结果解码之间的最小间隔（秒）
+    'min_new_audio': 0.4,      # 新增音频达到该时长（秒）才做一次中间解码
+    'holdback': 1.5,           # 末尾这段音频的识别结果暂不确认，留给后续解码修正（秒）
+    'max_buffer': 30.0,        # 未确认音频的最大时长（秒），超出时强制确认
+    'partial_beam_size': 1,    # 中间结果使用贪心解码
+    'final_beam_size': None,   # 最终结果的 beam 大小，为空时使用配置档的 beam
+    'workers': 2,              # 解码线程数
+}
+
+
+class StreamingSession:
+    """单个会话的滚动音频缓冲区和已确认的识别文本"""
+
+    def __init__(self, sample_rate, vad_config=None):
+        self.sample_rate = sample_rate
+        self.endpoint = EndpointDetector(vad_config, sample_rate)  # 说话结束检测
+        self.end_of_speech = False
+        self.chunks = []           # 未确认的 int16 音频块
+        self.buffer_start = 0      # 缓冲区第一个采样点的绝对位置
+        self.total_samples = 0     # 已收到的采样点总数
+        self.decoded_until = 0     # 上次解码时的 total_samples
+        self.last_decode = 0.0
+        self.committed = ''        # 已确认的文本
+        self.tentative = ''        # 尚未确认的文本
+        self.lock = threading.Lock()          # 保护缓冲区
+        self.decode_lock = threading.Lock()   # 同一会话同一时间只做一次解码
+        self.decoding = False
+        self.closed = False
+
+    def snapshot(self):
+        """返回 (未确认音频 float32, 缓冲区起点)"""
+        with self.lock:
+            if not self.chunks:
+                return np.zeros(0, dtype=np.float32), self.buffer_start
+            audio = np.concatenate(self.chunks) if len(self.chunks) > 1 else self.chunks[0]
+            self.chunks = [audio]
+            return audio.astype(np.float32) / 32768.0, self.buffer_start
+
+    def trim(self, position):
+        """丢弃绝对位置 position 之前已确认的音频"""
+        with self.lock:
+            drop = position - self.buffer_start
+            if drop <= 0 or not self.chunks:
+                return
+            audio = np.concatenate(self.chunks)
+            self.chunks = [audio[drop:]] if drop < len(audio) else []
+            self.buffer_start = position
+
+
+class StreamingASR:
+    """流式语音识别
+
+    客户端在录音过程中持续发送 16 kHz 单声道 int16 PCM 小块，服务端为每个会话维护滚动缓冲区，
+    定期对未确认的音频做一次快速解码并推送中间结果。距离末尾超过 holdback 的片段视为已确认，
+    对应音频从缓冲区移除，因此说话结束后只需要解码最后一小段音频即可给出最终结果。
+    """
+
+    def __init__(self, recognizer, config=None, vad_config=None):
+        self.recognizer = recognizer
+        self.config = {**DEFAULT_STREAMING_CONFIG, **(config or {})}
+        self.vad_config = vad_config
+        # Web 进程中只做能量检测：中间解码前跳过没有语音的缓冲区，最终解码前裁掉首尾静音
+        self.trimmer = SpeechTrimmer(vad_config, silero_available=False)
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.config['workers'],
+            thread_name_prefix='asr-stream'
+        )
+
+    def start(self, sid, sample_rate=None):
+        """开始一段新的录音，丢弃该会话之前的缓冲区"""
+        with self._lock:
+            old = self.sessions.get(sid)
+            if old:
+                old.closed = True
+            self.sessions[sid] = StreamingSession(sample_rate or self.config['sample_rate'], self.vad_config)
+
+    def feed(self, sid, pcm):
+        """追加一块 int16 PCM，需要推送中间结果时返回解码的 Future，否则返回 None"""
+        session = self.sessions.get(sid)
+        if session is None or session.closed:
+            return None
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        if not len(samples):
+            return None
+        with session.lock:
+            session.chunks.append(samples)
+            session.total_samples += len(samples)
+        if session.endpoint.update(samples):
+            session.end_of_speech = True
+
+        new_audio = (session.total_samples - session.decoded_until) / session.sample_rate
+        now = time.monotonic()
+        if (session.decoding
+                or new_audio < self.config['min_new_audio']
+                or now - session.last_decode < self.config['partial_interval']):
+            return None
+        session.decoding = True
+        session.last_decode = now
+        return self._executor.submit(self._decode_partial, session)
+
+    def end_of_speech(self, sid):
+        """说话结束后第一次调用返回 True，用于通知客户端自动停止录音"""
+        session = self.sessions.get(sid)
+        if session is None or not session.end_of_speech:
+            return False
+        session.end_of_speech = False
+        return True
+
+    def finish(self, sid):
+        """录音结束，返回最终识别结果的 Future"""
+        with self._lock:
+            session = self.sessions.pop(sid, None)
+        if session is None:
+            return None
+        session.closed = True
+        return self._executor.submit(self._decode_final, session)
+
+    def discard(self, sid):
+        """会话断开时丢弃缓冲区"""
+        with self._lock:
+            session = self.sessions.pop(sid, None)
+        if session:
+            session.closed = True
+
+    def _decode_partial(self, session):
+        """解码未确认的音频，确认较早的片段，返回当前的完整中间结果"""
+        try:
+            with session.decode_lock:
+                if session.closed:
+                    return None
+                audio, start = session.snapshot()
+                session.decoded_until = start + len(audio)
+                if not self._has_speech(audio, session.sample_rate):
+                    # 没有语音时不解码，只保留末尾 holdback 的音频，以免刚开口的语音被丢掉
+                    keep = int(self.config['holdback'] * session.sample_rate)
+                    session.trim(start + len(audio) - keep)
+                    return None
+                duration = len(audio) / session.sample_rate
+                segments = self.recognizer.transcribe_segments(
+                    audio,
+                    beam_size=self.config['partial_beam_size'],
+                    initial_prompt=session.committed[-200:] or None
+                )
+
+                # 距离末尾超过 holdback 的片段已经稳定，确认并移出缓冲区；
+                # 未确认的音频过长时全部确认
+                limit = duration if duration > self.config['max_buffer'] else duration - self.config['holdback']
+                stable = 0
+                while stable < len(segments) and segments[stable][1] <= limit:
+                    stable += 1
+                if stable:
+                    session.committed += ''.join(text for _, _, text in segments[:stable])
+                    session.trim(start + int(segments[stable - 1][1] * session.sample_rate))
+                session.tentative = ''.join(text for _, _, text in segments[stable:])
+                return (session.committed + session.tentative).strip()
+        finally:
+            session.decoding = False
+
+    def _decode_final(self, session):
+        """解码剩余的未确认音频，返回最终识别结果"""
+        with session.decode_lock:
+            audio, _ = session.snapshot()
+            tail = ''
+            if len(audio) >= session.sample_rate * 0.1:
+                # 裁掉首尾静音，没有语音时不做识别
+                audio = self.trimmer.trim(audio, session.sample_rate)
+            if audio is not None and len(audio) >= session.sample_rate * 0.1:
+                segments = self.recognizer.transcribe_segments(
+                    audio,
+                    beam_size=self.config['final_beam_size'],
+                    initial_prompt=session.committed[-200:] or None
+                )
+                tail = ''.join(text for _, _, text in segments)
+            return (session.committed + tail).strip()
+
+    def _has_speech(self, audio, sample_rate):
+        if not self.trimmer.config['enabled']:
+            return True
+        return find_speech(audio, self.trimmer.config, sample_rate) is not None
+
+    def stats(self):
+        """最终解码前静音裁剪的统计"""
+        return self.trimmer.stats()
@@ -1,45 +1,183 @@
-import asyncio
-import edge_tts
-import tempfile
 import os
 import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, wait
 from typing import Optional
 
+from src.speech.tts_runtime import TTSRuntime
+
+# edge-tts 默认的输出格式
+DEFAULT_OUTPUT_FORMAT = "audio-24khz-48kbitrate-mono-mp3"
+
+# 支持的输出格式及其 MIME 类型（前端 MediaSource 按 MIME 类型解码）
+# 注意：edge-tts 在协议中固定请求 24kHz/48kbps 的 mp3，目前只能使用这一种格式
+OUTPUT_FORMATS = {
+    DEFAULT_OUTPUT_FORMAT: 'audio/mpeg',
+}
+
+# 语音合成默认配置，可通过 TextToSpeech(config) 覆盖
+DEFAULT_TTS_CONFIG = {
+    'voice': "zh-CN-XiaoxiaoNeural",   # 默认使用中文女声
+    'cache_dir': None,                 # 磁盘缓存目录，None 表示只使用内存缓存
+    'cache_items': 256,                # 内存缓存的最大条数
+    'cache_bytes': 64 * 1024 * 1024,   # 内存缓存的最大字节数
+    'output_format': DEFAULT_OUTPUT_FORMAT,
+    'runtime': {},                     # 合成运行时参数（并发上限、分片大小），见 tts_runtime.DEFAULT_RUNTIME_CONFIG
+}
+
+
+class TTSCache:
+    """按 (音色, 文本哈希, 输出格式) 寻址的语音缓存
+
+    内存中是 LRU，后面是磁盘存储：磁盘命中后放回内存，写入时两边都写。
+    """
+
+    def __init__(self, cache_dir=None, max_items=256, max_bytes=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+
+    @staticmethod
+    def digest(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _path(self, voice, output_format, digest):
+        return os.path.join(self.cache_dir, voice, output_format, digest[:2], digest)
+
+    def get(self, voice, text, output_format=DEFAULT_OUTPUT_FORMAT):
+        """返回缓存的音频字节，没有时返回 None"""
+        key = (voice, self.digest(text), output_format)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return data
+
+        if self.cache_dir:
+            path = self._path(*key)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                self._remember(key, data)
+                with self._lock:
+                    self.counters['disk_hits'] += 1
+                return data
+
+        with self._lock:
+            self.counters['misses'] += 1
+        return None
+
+    def put(self, voice, text, data, output_format=DEFAULT_OUTPUT_FORMAT):
+        key = (voice, self.digest(text), output_format)
+        self._remember(key, data)
+        with self._lock:
+            self.counters['stores'] += 1
+        if self.cache_dir:
+            path = self._path(*key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再替换，避免并发读到不完整的音频
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+
+    def _remember(self, key, data):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._entries and (len(self._entries) > self.max_items or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            counters['entries'] = len(self._entries)
+            counters['bytes'] = self._bytes
+        lookups = counters['hits'] + counters['disk_hits'] + counters['misses']
+        counters['hit_rate'] = round((counters['hits'] + counters['disk_hits']) / lookups, 3) if lookups else 0.0
+        return counters
+
+
 class TextToSpeech:
-    def __init__(self):
-        self.voice = "zh-CN-XiaoxiaoNeural"  # 默认使用中文女声
-        
+    def __init__(self, config=None):
+        self.config = {**DEFAULT_TTS_CONFIG, **(config or {})}
+        self.voice = self.config['voice']
+        self.output_format = self.config['output_format']
+        if self.output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"不支持的语音输出格式: {self.output_format}，可选: {', '.join(OUTPUT_FORMATS)}")
+        self.mime_type = OUTPUT_FORMATS[self.output_format]
+        self.cache = TTSCache(
+            self.config['cache_dir'],
+            self.config['cache_items'],
+            self.config['cache_bytes']
+        )
+        self.runtime = TTSRuntime(self.config['runtime'])
+
     def speak(self, text: str) -> Optional[str]:
         """将文本转换为语音并返回 base64 编码的音频数据"""
         try:
-            # 创建临时文件
-            with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
-                temp_path = temp_file.name
-                
-            print(f"生成语音临时文件: {temp_path}")
-            
-            # 使用 edge-tts 生成语音
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            communicate = edge_tts.Communicate(text, self.voice)
-            loop.run_until_complete(communicate.save(temp_path))
-            loop.close()
-            
-            print(f"语音生成完成，文件大小: {os.path.getsize(temp_path)} 字节")
-            
-            # 读取音频文件并转换为 base64
-            with open(temp_path, 'rb') as audio_file:
-                audio_data = audio_file.read()
-                base64_audio = base64.b64encode(audio_data).decode('utf-8')
-            
-            # 清理临时文件
-            os.unlink(temp_path)
-            
-            return base64_audio
-            
+            audio_data = self.synthesize(text).result()
+            return base64.b64encode(audio_data).decode('utf-8')
+
         except Exception as e:
             print(f"语音合成错误: {str(e)}")
             import traceback
             print(traceback.format_exc())
-            return None 
\ No newline at end of file
+            return None
+
+    def synthesize(self, text: str, voice=None, on_chunk=None) -> Future:
+        """提交合成请求，返回结果为完整音频字节的 Future，优先使用缓存
+
+        提供 on_chunk(bytes) 时边合成边回调音频分片；缓存命中时一次性回调整段音频。
+        """
+        voice = voice or self.voice
+        audio_data = self.cache.get(voice, text, self.output_format)
+        if audio_data is not None:
+            if on_chunk is not None:
+                on_chunk(audio_data)
+            future = Future()
+            future.set_result(audio_data)
+            return future
+        return self._submit(text, voice, on_chunk)
+
+    def _submit(self, text, voice, on_chunk=None):
+        """交给合成运行时，完成后写入缓存"""
+        def store(future):
+            if not future.cancelled() and future.exception() is None:
+                self.cache.put(voice, text, future.result(), self.output_format)
+
+        future = self.runtime.synthesize(text, voice, on_chunk)
+        future.add_done_callback(store)
+        return future
+
+    def presynthesize(self, texts):
+        """预先合成一组固定文本（如各条目的问题）写入缓存，返回 (新合成条数, 已缓存条数)"""
+        synthesized = cached = 0
+        futures = {}
+        for text in dict.fromkeys(text for text in texts if text):
+            if self.cache.get(self.voice, text, self.output_format) is not None:
+                cached += 1
+                continue
+            futures[self._submit(text, self.voice)] = text
+        # 并发数由运行时的信号量限制
+        wait(futures)
+        for future, text in futures.items():
+            if future.exception() is None:
+                synthesized += 1
+            else:
+                print(f"预合成语音失败: {text[:30]}... {str(future.exception())}")
+        return synthesized, cached
+
+    def stats(self):
+        return {'cache': self.cache.stats(), 'runtime': self.runtime.stats()}
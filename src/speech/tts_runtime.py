@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+
+import edge_tts
+
+# 语音合成运行时默认参数，可通过 tts_config['runtime'] 覆盖
+DEFAULT_RUNTIME_CONFIG = {
+    'max_concurrency': 4,       # 同时进行的合成请求数，超出的请求排队等待
+    'chunk_bytes': 4096,        # 流式回调时每个分片至少累积的字节数
+}
+
+
+class TTSRuntime:
+    """常驻的语音合成运行时
+
+    所有合成请求都在同一个后台事件循环线程中执行，不再为每句话新建和关闭事件循环；
+    音频直接在内存中拼接，信号量限制同时进行的合成数。
+    """
+
+    def __init__(self, config=None):
+        self.config = {**DEFAULT_RUNTIME_CONFIG, **(config or {})}
+        self.counters = {
+            'submitted': 0, 'started': 0, 'completed': 0, 'failed': 0, 'cancelled': 0, 'in_flight': 0,
+            'wait_seconds': 0.0, 'max_wait_seconds': 0.0,
+            'synthesis_seconds': 0.0, 'max_synthesis_seconds': 0.0,
+            'first_chunk_seconds': 0.0, 'audio_bytes': 0
+        }
+        self._lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self._semaphore = None
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, args=(ready,), name='tts-runtime', daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self.loop)
+        # 信号量必须在运行时的事件循环中创建
+        self._semaphore = asyncio.Semaphore(self.config['max_concurrency'])
+        self.loop.call_soon(ready.set)
+        self.loop.run_forever()
+
+    def is_running(self):
+        return self._thread.is_alive() and self.loop.is_running()
+
+    def synthesize(self, text, voice, on_chunk=None):
+        """提交一条合成请求，返回 concurrent.futures.Future，结果为完整音频字节
+
+        on_chunk(bytes) 在运行时线程中被调用，回调中只应做入队之类的轻量操作。
+        """
+        with self._lock:
+            self.counters['submitted'] += 1
+        return asyncio.run_coroutine_threadsafe(
+            self._synthesize(text, voice, on_chunk, time.monotonic()), self.loop
+        )
+
+    async def _synthesize(self, text, voice, on_chunk, submitted_at):
+        try:
+            await self._semaphore.acquire()
+        except asyncio.CancelledError:
+            # 排队期间被取消
+            self._record_error('cancelled', running=False)
+            raise
+        try:
+            started = time.monotonic()
+            self._record_wait(started - submitted_at)
+            try:
+                audio_data, first_chunk = await self._stream(text, voice, on_chunk, started)
+            except asyncio.CancelledError:
+                self._record_error('cancelled')
+                raise
+            except Exception:
+                self._record_error('failed')
+                raise
+            self._record_done(time.monotonic() - started, first_chunk, len(audio_data))
+            return audio_data
+        finally:
+            self._semaphore.release()
+
+    async def _stream(self, text, voice, on_chunk, started):
+        chunks = []
+        pending = bytearray()
+        first_chunk = None
+        communicate = edge_tts.Communicate(text, voice)
+        async for chunk in communicate.stream():
+            if chunk['type'] != 'audio':
+                continue
+            if first_chunk is None:
+                first_chunk = time.monotonic() - started
+            chunks.append(chunk['data'])
+            if on_chunk is None:
+                continue
+            # edge-tts 的分片很小，累积到一定大小再回调
+            pending.extend(chunk['data'])
+            if len(pending) >= self.config['chunk_bytes']:
+                on_chunk(bytes(pending))
+                pending.clear()
+        if pending:
+            on_chunk(bytes(pending))
+
+        audio_data = b''.join(chunks)
+        if not audio_data:
+            raise RuntimeError("edge-tts 未返回音频数据")
+        return audio_data, first_chunk
+
+    def _record_wait(self, wait):
+        with self._lock:
+            self.counters['started'] += 1
+            self.counters['in_flight'] += 1
+            self.counters['wait_seconds'] += wait
+            self.counters['max_wait_seconds'] = max(self.counters['max_wait_seconds'], wait)
+
+    def _record_error(self, counter, running=True):
+        with self._lock:
+            if running:
+                self.counters['in_flight'] -= 1
+            self.counters[counter] += 1
+
+    def _record_done(self, elapsed, first_chunk, size):
+        with self._lock:
+            self.counters['in_flight'] -= 1
+            self.counters['completed'] += 1
+            self.counters['synthesis_seconds'] += elapsed
+            self.counters['max_synthesis_seconds'] = max(self.counters['max_synthesis_seconds'], elapsed)
+            self.counters['first_chunk_seconds'] += first_chunk or 0.0
+            self.counters['audio_bytes'] += size
+
+    def stats(self):
+        """返回排队等待、合成耗时和并发等指标"""
+        with self._lock:
+            counters = dict(self.counters)
+        finished = counters['completed'] + counters['failed'] + counters['cancelled']
+        started = counters['started']
+        completed = counters['completed']
+        return {
+            'submitted': counters['submitted'],
+            'completed': completed,
+            'failed': counters['failed'],
+            'cancelled': counters['cancelled'],
+            'in_flight': counters['in_flight'],
+            'queued': counters['submitted'] - finished - counters['in_flight'],
+            'max_concurrency': self.config['max_concurrency'],
+            'avg_wait': round(counters['wait_seconds'] / started, 3) if started else 0.0,
+            'max_wait': round(counters['max_wait_seconds'], 3),
+            'avg_synthesis': round(counters['synthesis_seconds'] / completed, 3) if completed else 0.0,
+            'max_synthesis': round(counters['max_synthesis_seconds'], 3),
+            'avg_first_chunk': round(counters['first_chunk_seconds'] / completed, 3) if completed else 0.0,
+            'audio_bytes': counters['audio_bytes'],
+        }
+
+    def close(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
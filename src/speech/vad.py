@@ -0,0 +1,150 @@
+import threading
+
+import numpy as np
+
+from src.speech.audio_io import TARGET_SAMPLE_RATE, to_float32
+
+# 语音端点检测默认配置，可通过 asr_config['vad'] 覆盖
+DEFAULT_VAD_CONFIG = {
+    'enabled': True,
+    'frame': 0.03,              # 能量计算的帧长（秒）
+    'threshold_db': -45.0,      # 绝对能量阈值（dBFS），低于该值一定视为静音
+    'margin_db': 12.0,          # 比噪声底（帧能量的 10% 分位数）高出该值才视为语音
+    'min_speech': 0.25,         # 语音帧总时长低于该值视为空语音，不做识别（秒）
+    'padding': 0.2,             # 裁剪时在语音前后保留的时长（秒）
+    'silero': True,             # 能量裁剪后再用 Silero VAD 精修边界（需要 onnxruntime）
+    'silero_threshold': 0.5,
+    'end_silence': 1.0,         # 流式录音中，说话后持续静音达到该时长即判定说话结束（秒）
+}
+
+
+def frame_levels(audio, frame_samples):
+    """按帧计算能量（dBFS），整段音频一次向量化计算"""
+    audio = to_float32(audio)
+    count = len(audio) // frame_samples
+    if not count:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:count * frame_samples].reshape(count, frame_samples)
+    power = np.einsum('ij,ij->i', frames, frames) / frame_samples
+    return 10.0 * np.log10(power + 1e-10)
+
+
+def speech_threshold(levels, config):
+    """语音帧的能量阈值
+
+    取噪声底加 margin，但不高于最响帧以下两个 margin，避免整段都是语音时把语音当成噪声底。
+    """
+    noise = float(np.percentile(levels, 10))
+    peak = float(levels.max())
+    return max(config['threshold_db'], min(noise + config['margin_db'], peak - 2 * config['margin_db']))
+
+
+def find_speech(audio, config, sample_rate=TARGET_SAMPLE_RATE):
+    """能量端点检测，返回包含语音的 (起点, 终点) 采样点范围，没有语音时返回 None"""
+    frame = int(config['frame'] * sample_rate)
+    levels = frame_levels(audio, frame)
+    if not len(levels):
+        return None
+    voiced = np.flatnonzero(levels > speech_threshold(levels, config))
+    if len(voiced) * config['frame'] < config['min_speech']:
+        return None
+    pad = int(config['padding'] * sample_rate)
+    return max(0, voiced[0] * frame - pad), min(len(audio), (voiced[-1] + 1) * frame + pad)
+
+
+class EndpointDetector:
+    """流式录音的说话结束检测（只用能量，在 Web 进程中逐块更新）"""
+
+    def __init__(self, config=None, sample_rate=TARGET_SAMPLE_RATE):
+        self.config = {**DEFAULT_VAD_CONFIG, **(config or {})}
+        self.frame = int(self.config['frame'] * sample_rate)
+        self.levels = []            # 最近的帧能量，用于估计噪声底
+        self.remainder = np.zeros(0, dtype=np.float32)
+        self.speech_frames = 0
+        self.silence_frames = 0
+        self.ended = False
+
+    def update(self, samples):
+        """追加一块音频，第一次判定说话结束时返回 True"""
+        if self.ended or not self.config['enabled']:
+            return False
+        audio = np.concatenate([self.remainder, to_float32(samples)])
+        usable = len(audio) // self.frame * self.frame
+        self.remainder = audio[usable:]
+        levels = frame_levels(audio[:usable], self.frame)
+        if not len(levels):
+            return False
+        self.levels = (self.levels + levels.tolist())[-500:]
+        threshold = speech_threshold(np.asarray(self.levels), self.config)
+        for voiced in levels > threshold:
+            if voiced:
+                self.speech_frames += 1
+                self.silence_frames = 0
+            else:
+                self.silence_frames += 1
+
+        spoke = self.speech_frames * self.config['frame'] >= self.config['min_speech']
+        if spoke and self.silence_frames * self.config['frame'] >= self.config['end_silence']:
+            self.ended = True
+        return self.ended
+
+
+class SpeechTrimmer:
+    """识别前裁掉首尾静音并拒绝空语音，记录跳过的音频时长
+
+    先用能量检测粗裁，再在保留的范围内用 faster-whisper 自带的 Silero VAD 精修边界；
+    onnxruntime 不可用时只做能量裁剪。
+    """
+
+    def __init__(self, config=None, silero_available=True):
+        self.config = {**DEFAULT_VAD_CONFIG, **(config or {})}
+        self.silero = self.config['silero'] and silero_available
+        self._lock = threading.Lock()
+        self.counters = {
+            'utterances': 0,
+            'rejected': 0,           # 判定为没有语音、未做识别的条数
+            'input_seconds': 0.0,
+            'skipped_seconds': 0.0,  # 裁掉和拒绝的音频总时长
+        }
+
+    def trim(self, audio, sample_rate=TARGET_SAMPLE_RATE):
+        """返回裁剪后的音频，没有语音时返回 None"""
+        if not self.config['enabled']:
+            return audio
+        span = find_speech(audio, self.config, sample_rate)
+        # Silero VAD 按 16 kHz 工作，其他采样率只做能量裁剪
+        if span is not None and self.silero and sample_rate == TARGET_SAMPLE_RATE:
+            span = self._refine(audio, span)
+        trimmed = None if span is None else audio[span[0]:span[1]]
+
+        kept = 0 if trimmed is None else len(trimmed)
+        with self._lock:
+            self.counters['utterances'] += 1
+            self.counters['rejected'] += trimmed is None
+            self.counters['input_seconds'] += len(audio) / sample_rate
+            self.counters['skipped_seconds'] += (len(audio) - kept) / sample_rate
+        return trimmed
+
+    def _refine(self, audio, span):
+        from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+        start, end = span
+        chunks = get_speech_timestamps(
+            to_float32(audio[start:end]),
+            VadOptions(
+                threshold=self.config['silero_threshold'],
+                min_speech_duration_ms=int(self.config['min_speech'] * 1000),
+                speech_pad_ms=int(self.config['padding'] * 1000)
+            )
+            # 不传 sampling_rate：旧版本的 get_speech_timestamps 没有该参数，默认即为 16 kHz
+        )
+        if not chunks:
+            return None
+        return start + chunks[0]['start'], start + chunks[-1]['end']
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        counters['skipped_ratio'] = round(counters['skipped_seconds'] / counters['input_seconds'], 3) \
+            if counters['input_seconds'] else 0.0
+        return counters
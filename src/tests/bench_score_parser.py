@@ -0,0 +1,125 @@
+import os
+import sys
+import io
+import json
+import time
+import contextlib
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from src.llm.score_parser import ScoreExtractor, parse_scores
+
+
+def legacy_try_parse_score(response):
+    """旧版 LLMHandler._try_parse_score 的实现，仅用于对比"""
+    try:
+        json_objects = []
+        current_pos = 0
+
+        while current_pos < len(response):
+            start = response.find('{', current_pos)
+            if start == -1:
+                break
+
+            stack = []
+            end = start
+
+            for i in range(start, len(response)):
+                if response[i] == '{':
+                    stack.append('{')
+                elif response[i] == '}':
+                    stack.pop()
+                    if not stack:
+                        end = i + 1
+                        break
+
+            if end > start:
+                try:
+                    json_str = response[start:end]
+                    score_data = json.loads(json_str)
+                    if all(isinstance(k, str) and isinstance(v, (int, float)) and k.startswith('hamd') for k, v in score_data.items()):
+                        json_objects.append(score_data)
+                    else:
+                        print(f"无效的评分格式: {json_str}")
+                except json.JSONDecodeError:
+                    print(f"JSON解析错误: {json_str}")
+                except Exception as e:
+                    print(f"处理评分数据时出错: {str(e)}")
+
+            current_pos = end + 1
+
+        if json_objects:
+            merged_scores = {}
+            for score_dict in json_objects:
+                merged_scores.update(score_dict)
+            return merged_scores
+
+        return None
+
+    except Exception as e:
+        print(f"评分解析出错: {str(e)}")
+        return None
+
+
+def build_response(num_objects, filler_len=400):
+    """构造包含多段说明文字、代码块和多个评分对象的长响应"""
+    filler = "患者自述最近两周情绪低落，睡眠较差，早醒明显，对日常活动兴趣下降。" * (filler_len // 30 + 1)
+    parts = []
+    for i in range(num_objects):
+        parts.append(filler[:filler_len])
+        parts.append('（备注：{不是评分}）')
+        parts.append(f'```json\n{{"hamd{i + 1}": {i % 5}}}\n```')
+    return '\n'.join(parts)
+
+
+def bench(func, text, repeat):
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = func(text)
+        elapsed = time.perf_counter() - start
+    return elapsed / repeat, result
+
+
+def bench_streaming(text, chunk_size, repeat):
+    """按流式块逐段输入，测量增量提取器的开销"""
+    chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            extractor = ScoreExtractor()
+            for chunk in chunks:
+                extractor.feed(chunk)
+            result = extractor.result()
+        elapsed = time.perf_counter() - start
+    return elapsed / repeat, result
+
+
+def main():
+    print(f"{'对象数':>6} {'长度':>8} {'旧实现(ms)':>12} {'新实现(ms)':>12} {'流式(ms)':>10} {'加速比':>8}")
+    for num_objects in (1, 5, 20, 50):
+        text = build_response(num_objects)
+        repeat = max(5, 500 // num_objects)
+        legacy_time, legacy_result = bench(legacy_try_parse_score, text, repeat)
+        new_time, new_result = bench(parse_scores, text, repeat)
+        stream_time, stream_result = bench_streaming(text, 8, repeat)
+        assert new_result == stream_result
+        assert legacy_result == new_result, (legacy_result, new_result)
+        print(f"{num_objects:>6} {len(text):>8} {legacy_time * 1000:>12.3f} {new_time * 1000:>12.3f} "
+              f"{stream_time * 1000:>10.3f} {legacy_time / new_time:>8.1f}x")
+
+    # 畸形输入：大量未闭合的左花括号会让旧实现对每个括号都扫描到文本末尾（O(n²)）
+    print(f"\n{'未闭合括号数':>10} {'旧实现(ms)':>12} {'新实现(ms)':>12}")
+    for num_braces in (100, 1000, 3000):
+        malformed = '评分说明 {' * num_braces + ' {"hamd3": 2}'
+        legacy_time, legacy_result = bench(legacy_try_parse_score, malformed, 3)
+        new_time, new_result = bench(parse_scores, malformed, 3)
+        print(f"{num_braces:>10} {legacy_time * 1000:>12.3f} {new_time * 1000:>12.3f}"
+              f"  旧实现 -> {legacy_result}, 新实现 -> {new_result}")
+
+
+if __name__ == "__main__":
+    main()
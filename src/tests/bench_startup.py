@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import urllib.request
+import urllib.error
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+src_dir = os.path.join(project_root, 'src')
+
+BASELINE_PATH = os.path.join(current_dir, 'startup_baseline.json')
+
+# Web 进程不应导入的重量级模块（由识别进程加载）
+HEAVY_MODULES = ['torch', 'transformers', 'optimum', 'faster_whisper', 'ctranslate2', 'onnxruntime', 'soundfile', 'sounddevice']
+
+# 在子进程中导入 app 并报告耗时和已加载的重量级模块
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{'import_seconds': elapsed, 'heavy_modules': heavy}}))
+sys.stdout.flush()
+# 先关闭识别进程：它继承了本进程的 stdout，不关闭时父进程一直等不到 EOF
+if hasattr(app.speech_recognizer, 'close'):
+    app.speech_recognizer.close()
+import os
+os._exit(0)
+"""
+
+# 在子进程中启动服务（不使用调试模式的自动重载）
+SERVE_PROBE = """
+import os, signal
+import app
+
+def stop(signum, frame):
+    # terminate() 时 atexit 不会执行，需要手动关闭识别进程，避免留下孤儿进程
+    if hasattr(app.speech_recognizer, 'close'):
+        app.speech_recognizer.close()
+    os._exit(0)
+
+signal.signal(signal.SIGTERM, stop)
+app.socketio.run(app.app, host='127.0.0.1', port={port}, debug=False, use_reloader=False)
+"""
+
+
+def probe_env():
+    env = dict(os.environ)
+    # 使用本地地址即可，不会发出 LLM 请求
+    env.setdefault('DASHSCOPE_API_KEY', 'bench')
+    env.setdefault('LLM_BASE_URL', 'http://127.0.0.1:9/v1')
+    env['PYTHONPATH'] = os.pathsep.join([src_dir, project_root] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    return env
+
+
+def measure_import():
+    """冷启动一个新解释器导入 app 的耗时"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', IMPORT_PROBE.format(heavy=HEAVY_MODULES)],
+        cwd=src_dir, env=probe_env(), capture_output=True, text=True, timeout=600
+    )
+    total = time.perf_counter() - started
+    lines = [line for line in result.stdout.splitlines() if line.startswith('{')]
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(f"导入 app 失败:\n{result.stderr[-2000:]}")
+    report = json.loads(lines[-1])
+    report['process_seconds'] = total
+    return report
+
+
+def wait_for(url, deadline, expect=200):
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == expect:
+                    return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.05)
+    return False
+
+
+def measure_first_request(port, wait_ready, timeout):
+    """从启动进程到 /healthz（以及可选的 /readyz）首次返回 200 的时间"""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-c', SERVE_PROBE.format(port=port)],
+        cwd=src_dir, env=probe_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = started + timeout
+        report = {}
+        if not wait_for(f"http://127.0.0.1:{port}/healthz", deadline):
+            raise RuntimeError("服务在超时前没有响应 /healthz")
+        report['first_request_seconds'] = time.perf_counter() - started
+        if wait_ready:
+            if not wait_for(f"http://127.0.0.1:{port}/readyz", deadline):
+                raise RuntimeError("服务在超时前没有就绪")
+            report['ready_seconds'] = time.perf_counter() - started
+        return report
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Web 进程启动基准：导入耗时和首个请求的响应时间")
+    parser.add_argument('--repeat', type=int, default=3, help="重复次数，取中位数")
+    parser.add_argument('--port', type=int, default=5123)
+    parser.add_argument('--wait-ready', action='store_true', help="同时测量 /readyz 就绪时间（包含模型加载）")
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--record', action='store_true', help="把本次结果记录为基线")
+    parser.add_argument('--tolerance', type=float, default=1.3, help="超过基线的该倍数视为回退")
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.repeat):
+        run = measure_import()
+        run.update(measure_first_request(args.port, args.wait_ready, args.timeout))
+        runs.append(run)
+        print(json.dumps(run, ensure_ascii=False))
+
+    def median(key):
+        values = sorted(run[key] for run in runs if key in run)
+        return round(values[len(values) // 2], 3) if values else None
+
+    result = {
+        key: median(key)
+        for key in ('import_seconds', 'process_seconds', 'first_request_seconds', 'ready_seconds')
+        if median(key) is not None
+    }
+    result['heavy_modules'] = sorted({name for run in runs for name in run['heavy_modules']})
+    result['python'] = sys.version.split()[0]
+    print(f"\n中位数: {json.dumps(result, ensure_ascii=False)}")
+
+    if args.record:
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"已记录基线: {BASELINE_PATH}")
+        return 0
+
+    failures = []
+    if result['heavy_modules']:
+        failures.append(f"Web 进程导入了重量级模块: {', '.join(result['heavy_modules'])}")
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        for key in ('import_seconds', 'first_request_seconds', 'ready_seconds'):
+            if key in baseline and key in result and result[key] > baseline[key] * args.tolerance:
+                failures.append(f"{key} 从 {baseline[key]} 秒回退到 {result[key]} 秒")
+    else:
+        print("尚未记录基线，使用 --record 记录")
+
+    for failure in failures:
+        print(f"回退: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
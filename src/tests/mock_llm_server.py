@@ -0,0 +1,309 @@
+"""本地 OpenAI 兼容的模拟 LLM 服务
+
+用于离线运行 test_agents.py 和压测 Flask / Socket.IO 全链路，不需要 DashScope 密钥。
+
+用法:
+    python src/tests/mock_llm_server.py --port 8001 --ttft 0.3,0.1 --rate-429 0.05
+    LLM_BASE_URL=http://127.0.0.1:8001/v1 DASHSCOPE_API_KEY=mock python src/app.py
+"""
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import itertools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 模拟服务默认配置
+DEFAULT_MOCK_CONFIG = {
+    'ttft': (0.2, 0.0),        # 首 token 延迟（秒）：(均值, 标准差)，按对数正态分布采样
+    'token_delay': 0.01,       # 每个流式块之间的间隔（秒）
+    'chunk_size': 4,           # 每个流式块的字符数
+    'rate_429': 0.0,           # 返回 429 的概率
+    'rate_500': 0.0,           # 返回 500 的概率
+    'retry_after': 1,          # 429 响应的 Retry-After（秒）
+    'score_after': 2,          # 患者回答几次后给出评分
+    'script': None,            # 脚本化回复列表，按顺序循环使用；None 时使用 HAMD 感知的回复
+    'seed': None,
+}
+
+FOLLOW_UPS = [
+    "能具体说说这种情况大概持续多久了吗？",
+    "这种情况对您的工作和生活有影响吗？",
+    "最近一周和之前相比有什么变化吗？",
+]
+
+PATIENT_REPLIES = [
+    "最近两周心情一直不太好，做什么都提不起劲。",
+    "晚上经常睡不着，早上四五点就醒了。",
+    "还好吧，偶尔会这样，不算特别严重。",
+]
+
+
+def count_tokens(text):
+    """与 LLMHandler 的估算一致：中文每字约 1 个 token，其余字符约每 4 个 1 个 token"""
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return (len(text) - ascii_chars) + ascii_chars // 4
+
+
+class MockLLM:
+    """生成模拟回复、采样延迟、注入错误，并模拟服务端前缀缓存"""
+
+    def __init__(self, config=None):
+        self.config = {**DEFAULT_MOCK_CONFIG, **(config or {})}
+        self.random = random.Random(self.config['seed'])
+        self._script = itertools.cycle(self.config['script']) if self.config['script'] else None
+        self._prefixes = set()      # 已经见过的系统提示词，用于模拟缓存命中
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.counters = {'requests': 0, 'streamed': 0, 'errors_429': 0, 'errors_500': 0}
+
+    def fault(self):
+        """按配置的概率返回需要注入的错误状态码，没有时返回 None"""
+        roll = self.random.random()
+        with self._lock:
+            self.counters['requests'] += 1
+            if roll < self.config['rate_429']:
+                self.counters['errors_429'] += 1
+                return 429
+            if roll < self.config['rate_429'] + self.config['rate_500']:
+                self.counters['errors_500'] += 1
+                return 500
+        return None
+
+    def first_token_delay(self):
+        mean, sigma = self.config['ttft']
+        if mean <= 0:
+            return 0.0
+        if not sigma:
+            return mean
+        # 对数正态分布：均值和标准差与配置一致，且有长尾
+        spread = math.log1p((sigma / mean) ** 2)
+        return self.random.lognormvariate(math.log(mean) - spread / 2, math.sqrt(spread))
+
+    def reply(self, body):
+        """根据请求生成回复，返回 (文本, 工具调用列表)"""
+        messages = body.get('messages', [])
+        system = next((m['content'] for m in messages if m.get('role') == 'system' and isinstance(m.get('content'), str)), '')
+        if self._script is not None:
+            with self._lock:
+                return next(self._script), []
+
+        label = re.search(r'hamd\d+', system)
+        if label is None:
+            # 摘要请求或模拟病人
+            if '摘要' in system:
+                return "患者自述近期情绪低落、睡眠欠佳，尚未给出具体频率。", []
+            return self.random.choice(PATIENT_REPLIES), []
+
+        answers = sum(1 for m in messages if m.get('role') == 'user')  # 患者已经回答的次数
+        wants_tools = bool(body.get('tools'))
+        if answers >= self.config['score_after'] or '画外音' in (messages[-1].get('content') or ''):
+            score = self.random.randint(0, 2)
+            if wants_tools:
+                return '', [('submit_score', {'hamd_label': label.group(), 'score': score})]
+            return f"```json\n{{\"{label.group()}\": {score}}}\n```", []
+        text = self.random.choice(FOLLOW_UPS)
+        if wants_tools:
+            return '', [('reply', {'text': text})]
+        return text, []
+
+    def usage(self, body, completion_text):
+        """估算 token 用量，系统提示词第二次出现时计为缓存命中"""
+        messages = body.get('messages', [])
+        prompt_tokens = sum(count_tokens(m['content']) for m in messages if isinstance(m.get('content'), str))
+        cached = 0
+        system = next((m['content'] for m in messages if m.get('role') == 'system' and isinstance(m.get('content'), str)), None)
+        if system:
+            with self._lock:
+                if system in self._prefixes:
+                    cached = count_tokens(system)
+                self._prefixes.add(system)
+        completion_tokens = count_tokens(completion_text)
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'prompt_tokens_details': {'cached_tokens': cached}
+        }
+
+    def next_id(self):
+        return f"chatcmpl-mock-{next(self._ids)}"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    llm = None  # 由 make_server 设置
+
+    def log_message(self, format, *args):
+        pass  # 压测时不打印每个请求
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'mock', 'object': 'model'}]})
+        elif self.path.rstrip('/').endswith('/stats'):
+            self._send_json(200, self.llm.counters)
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'invalid json'}})
+            return
+
+        status = self.llm.fault()
+        if status == 429:
+            self._send_json(429, {'error': {'message': 'rate limited', 'type': 'rate_limit'}},
+                            {'Retry-After': str(self.llm.config['retry_after'])})
+            return
+        if status == 500:
+            self._send_json(500, {'error': {'message': 'injected server error'}})
+            return
+
+        text, tools = self.llm.reply(body)
+        completion_text = text + ''.join(json.dumps(args, ensure_ascii=False) for _, args in tools)
+        usage = self.llm.usage(body, completion_text)
+        time.sleep(self.llm.first_token_delay())
+
+        if body.get('stream'):
+            self._stream(body, text, tools, usage)
+        else:
+            message = {'role': 'assistant', 'content': text or None}
+            if tools:
+                message['tool_calls'] = [
+                    {'id': f'call_{i}', 'type': 'function',
+                     'function': {'name': name, 'arguments': json.dumps(args, ensure_ascii=False)}}
+                    for i, (name, args) in enumerate(tools)
+                ]
+            self._send_json(200, {
+                'id': self.llm.next_id(),
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model', 'mock'),
+                'choices': [{'index': 0, 'message': message, 'finish_reason': 'tool_calls' if tools else 'stop'}],
+                'usage': usage
+            })
+
+    def _stream(self, body, text, tools, usage):
+        """以 SSE 格式逐块返回"""
+        with self.llm._lock:
+            self.llm.counters['streamed'] += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        completion_id = self.llm.next_id()
+        created = int(time.time())
+        size = self.llm.config['chunk_size']
+
+        def chunk(delta, finish_reason=None):
+            return {
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                'model': body.get('model', 'mock'),
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }
+
+        try:
+            self._event(chunk({'role': 'assistant', 'content': ''}))
+            for i in range(0, len(text), size):
+                self._event(chunk({'content': text[i:i + size]}))
+                time.sleep(self.llm.config['token_delay'])
+            for index, (name, args) in enumerate(tools):
+                arguments = json.dumps(args, ensure_ascii=False)
+                self._event(chunk({'tool_calls': [{'index': index, 'id': f'call_{index}', 'type': 'function',
+                                                   'function': {'name': name, 'arguments': ''}}]}))
+                for i in range(0, len(arguments), size):
+                    self._event(chunk({'tool_calls': [{'index': index, 'function': {'arguments': arguments[i:i + size]}}]}))
+                    time.sleep(self.llm.config['token_delay'])
+            self._event(chunk({}, 'tool_calls' if tools else 'stop'))
+            if (body.get('stream_options') or {}).get('include_usage'):
+                self._event({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                             'model': body.get('model', 'mock'), 'choices': [], 'usage': usage})
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端取消（例如对冲请求落选）
+
+    def _event(self, data):
+        self.wfile.write(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def _send_json(self, status, data, headers=None):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def make_server(host='127.0.0.1', port=0, config=None):
+    """创建模拟服务（port 为 0 时自动分配），返回 (server, MockLLM)"""
+    llm = MockLLM(config)
+    handler = type('BoundMockHandler', (MockHandler,), {'llm': llm})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server, llm
+
+
+def start_in_thread(config=None, host='127.0.0.1', port=0):
+    """在后台线程中启动模拟服务，返回 (server, base_url)，用完后调用 server.shutdown()"""
+    server, _ = make_server(host, port, config)
+    threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容的模拟 LLM 服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--ttft', default='0.2,0', help='首 token 延迟 均值,标准差（秒）')
+    parser.add_argument('--token-delay', type=float, default=DEFAULT_MOCK_CONFIG['token_delay'])
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_MOCK_CONFIG['chunk_size'])
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--rate-500', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=DEFAULT_MOCK_CONFIG['retry_after'])
+    parser.add_argument('--score-after', type=int, default=DEFAULT_MOCK_CONFIG['score_after'])
+    parser.add_argument('--script', help='脚本化回复文件（JSON 字符串列表），按顺序循环使用')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    mean, _, sigma = args.ttft.partition(',')
+    script = None
+    if args.script:
+        with open(args.script, 'r', encoding='utf-8') as f:
+            script = json.load(f)
+    config = {
+        'ttft': (float(mean), float(sigma or 0)),
+        'token_delay': args.token_delay,
+        'chunk_size': args.chunk_size,
+        'rate_429': args.rate_429,
+        'rate_500': args.rate_500,
+        'retry_after': args.retry_after,
+        'score_after': args.score_after,
+        'script': script,
+        'seed': args.seed,
+    }
+    server, _ = make_server(args.host, args.port, config)
+    print(f"模拟 LLM 服务已启动: http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,8 +13,10 @@ from src.agents.diagnosis_agent import DiagnosisAgent
 # 配置模型参数
 model_config = {
     'api_key': os.getenv("DASHSCOPE_API_KEY"),
-    'base_url': "https://dashscope.aliyuncs.com/compatible-mode/v1",
+    # 设置 LLM_BASE_URL 可以切换到本地模拟服务（src/tests/mock_llm_server.py）
+    'base_url': os.getenv("LLM_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
     'model': 'qwen-plus',
+    'priority': 'synthetic',  # 模拟问诊让位于真实问诊
     'parameters': {
         'temperature': 0.7,
         'top_p': 0.6,
@@ -0,0 +1,41 @@
+import os
+import sys
+import threading
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+import pytest
+
+from src.speech.asr_loader import ASRNotReadyError, BackgroundRecognizer
+
+loading = threading.Event()
+
+
+class GatedRecognizer:
+    """加载过程阻塞到测试放行，用于验证加载期间的行为"""
+
+    def __init__(self):
+        loading.wait(5)
+        self.warmed = False
+
+    def warmup(self):
+        self.warmed = True
+
+    def transcribe_batch(self, audios, beam_size=None, profile=None):
+        return ['ok' for _ in audios]
+
+
+def test_requests_fail_fast_until_model_is_loaded_and_warmed():
+    recognizer = BackgroundRecognizer(f"{__name__}:GatedRecognizer")
+    assert not recognizer.is_ready()
+    with pytest.raises(ASRNotReadyError):
+        recognizer.transcribe_batch([[0]])
+
+    loading.set()
+    recognizer._ready.wait(5)
+    assert recognizer.recognizer.warmed
+    assert recognizer.transcribe_batch([[0], [0]]) == ['ok', 'ok']
+    assert recognizer.health()['ready']
@@ -0,0 +1,45 @@
+import os
+import sys
+import threading
+import time
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from src.speech.asr_queue import ASRQueue
+
+
+class SlowRecognizer:
+    """记录每批使用的配置档，第一批阻塞到测试放行，制造排队"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def transcribe_batch(self, audios, beam_size=None, profile=None):
+        self.calls.append((len(audios), profile))
+        self.release.wait(5)
+        return [f"{profile or 'default'}:{len(audio)}" for audio in audios]
+
+
+def test_backlog_switches_to_fallback_profile_and_recovers():
+    recognizer = SlowRecognizer()
+    asr_queue = ASRQueue(recognizer, {
+        'max_wait': 0.0, 'max_batch_size': 2,
+        'fallback_profile': 'small-int8', 'fallback_depth': 4, 'recover_depth': 1
+    })
+    first = asr_queue.submit([0])
+    while not recognizer.calls:
+        time.sleep(0.01)
+    backlog = [asr_queue.submit([0] * n) for n in range(1, 6)]
+    recognizer.release.set()
+
+    assert first.result(5) == 'default:1'
+    # 前两批排队较长，使用轻量配置档；最后一批排队缓解后恢复默认配置档
+    assert [future.result(5) for future in backlog] == [
+        'small-int8:1', 'small-int8:2', 'small-int8:3', 'small-int8:4', 'default:5'
+    ]
+    assert asr_queue.stats()['fallback'] == 4
+    assert asr_queue.stats()['degraded'] is False
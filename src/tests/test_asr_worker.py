@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+import pytest
+
+from src.speech.asr_worker import ASRWorkerPool, ASRWorkerError
+
+
+class FakeRecognizer:
+    """子进程中使用的假识别器，不加载任何模型"""
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+
+    def transcribe_batch(self, audios, beam_size=None, profile=None):
+        return [f"{self.prefix}{len(audio)}/{beam_size or 5}" for audio in audios]
+
+    def transcribe_segments(self, audio_data, beam_size=None, initial_prompt=None):
+        if initial_prompt == 'boom':
+            raise ValueError('bad prompt')
+        return [(0.0, 1.0, f"{self.prefix}{len(audio_data)}")]
+
+
+def wait_until(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def pool():
+    pool = ASRWorkerPool(
+        {'factory': f"{__name__}:FakeRecognizer", 'check_interval': 0.1, 'heartbeat_interval': 0.2},
+        {'prefix': 'n='}
+    )
+    yield pool
+    pool.close()
+
+
+def test_requests_round_trip_through_worker_process(pool):
+    assert pool.transcribe_batch([[0] * 3, [0] * 5], beam_size=1) == ['n=3/1', 'n=5/1']
+    assert pool.transcribe_segments([0] * 4) == [(0.0, 1.0, 'n=4')]
+    assert wait_until(pool.is_ready)
+
+    with pytest.raises(ASRWorkerError, match='bad prompt'):
+        pool.transcribe_segments([0], initial_prompt='boom')
+    assert pool.health()['failed'] == 1
+
+
+def test_dead_worker_is_restarted(pool):
+    assert wait_until(pool.is_ready)
+    old_pid = pool.workers[0].process.pid
+    pool.workers[0].process.kill()
+
+    assert wait_until(lambda: pool.is_ready() and pool.workers[0].process.pid != old_pid)
+    assert pool.health()['restarts'] == 1
+    assert pool.transcribe_batch([[0] * 2]) == ['n=2/5']
@@ -0,0 +1,64 @@
+import os
+import sys
+import asyncio
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+import pytest
+
+pytest.importorskip('openai')
+
+from src.core import assessment_framework as framework_module
+from src.core.assessment_framework import AssessmentFramework
+
+
+@pytest.fixture
+def make_framework(tmp_path, monkeypatch):
+    prompt_file = tmp_path / 'prompt.txt'
+    prompt_file.write_text('#label#hamd01\n抑郁情绪\n#label#hamd02\n有罪感\n', encoding='utf-8')
+    # 不在项目目录下创建结果和进度目录
+    monkeypatch.setattr(framework_module.os, 'makedirs', lambda path: None)
+
+    def make():
+        framework = AssessmentFramework(str(prompt_file), {'api_key': 'test'})
+        framework.progress_dir = str(tmp_path)
+        return framework
+
+    return make
+
+
+def test_history_summaries_survive_load_progress(make_framework):
+    framework = make_framework()
+    framework.set_patient_info({'id': 'P001', 'age': 30})
+    framework.conversation_history['hamd01'] = [
+        {'role': 'assistant', 'content': '最近心情怎么样？'},
+        {'role': 'patient', 'content': '不太好'},
+    ]
+    framework.history_summaries['hamd01'] = {'summary': '患者近两周情绪低落', 'covered': 2}
+    assert framework.save_progress()
+
+    restored = make_framework()
+    assert restored.load_progress('P001')
+    assert restored.history_summaries == {'hamd01': {'summary': '患者近两周情绪低落', 'covered': 2}}
+
+    # 恢复后的摘要状态继续用于下一轮压缩和评估
+    seen = {}
+
+    async def compact_history(history, state=None, item_id=None):
+        seen['state'] = state
+        return history[state['covered']:], state
+
+    async def evaluate_response(prompt, user_response, history=None, question=None,
+                                on_delta=None, item_id=None, summary=None):
+        seen['summary'] = summary
+        return {'type': 'message', 'data': '还有别的不舒服吗？', 'raw_response': '还有别的不舒服吗？'}
+
+    restored.llm_handler.compact_history = compact_history
+    restored.llm_handler.evaluate_response = evaluate_response
+    asyncio.run(restored.process_response('睡不好', restored.conversation_history['hamd01']))
+
+    assert seen['state'] == {'summary': '患者近两周情绪低落', 'covered': 2}
+    assert seen['summary'] == '患者近两周情绪低落'
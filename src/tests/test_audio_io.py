@@ -0,0 +1,44 @@
+import base64
+import io
+import os
+import sys
+import wave
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+import numpy as np
+
+from src.speech.audio_io import decode_audio_payload, to_float32
+
+
+def make_wav(samples, sample_rate=16000, channels=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+def test_pcm16_payload_is_a_zero_copy_view():
+    pcm = np.array([0, 16384, -32768, 32767], dtype='<i2')
+    raw = pcm.tobytes()
+    audio = decode_audio_payload({'format': 'pcm16', 'sample_rate': 16000, 'audio': raw})
+
+    assert audio.dtype == np.int16
+    assert not audio.flags.owndata
+    np.testing.assert_allclose(to_float32(audio), [0.0, 0.5, -1.0, 32767 / 32768])
+
+
+def test_legacy_wav_honours_sample_width_channels_and_rate():
+    # 8 kHz 立体声 int16，左右声道相反，取平均后为 0
+    stereo = np.array([1000, -1000] * 800, dtype='<i2')
+    payload = base64.b64encode(make_wav(stereo, sample_rate=8000, channels=2)).decode()
+    audio = decode_audio_payload(payload)
+
+    assert len(audio) == 1600
+    assert np.allclose(to_float32(audio), 0.0)
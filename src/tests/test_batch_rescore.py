@@ -0,0 +1,30 @@
+import os
+import sys
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+import pytest
+
+pytest.importorskip('openai')
+
+from src.core.batch_rescore import BatchRescorer
+
+
+def test_rescore_always_runs_at_batch_priority(tmp_path):
+    prompt_file = tmp_path / 'prompt.txt'
+    prompt_file.write_text('#label#HAMD1\n抑郁情绪\n', encoding='utf-8')
+
+    # 与 /start_rescore 一样传入问诊使用的配置
+    rescorer = BatchRescorer(
+        str(prompt_file),
+        {'api_key': 'test', 'model': 'qwen-plus', 'priority': 'live', 'turn_deadline': 45, 'stream': True},
+        str(tmp_path),
+        str(tmp_path / 'checkpoint.jsonl')
+    )
+
+    assert rescorer.llm_handler.priority == 'batch'
+    assert rescorer.llm_handler.turn_timeout == 600
+    assert rescorer.model_config['stream'] is False
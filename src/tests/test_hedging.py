@@ -0,0 +1,60 @@
+import os
+import sys
+import asyncio
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from src.llm.hedging import HedgeTracker, hedge_race
+
+
+def make_request(delay, value, log, fail=False):
+    async def request():
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            log.append(f'{value} cancelled')
+            raise
+        if fail:
+            raise RuntimeError(value)
+        return value
+    return request
+
+
+def test_fast_primary_does_not_fire():
+    log = []
+    result = asyncio.run(hedge_race(make_request(0.01, 'primary', log), make_request(0, 'hedge', log), 0.2))
+    assert result == ('primary', False, False)
+    assert log == []
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    log = []
+
+    async def run():
+        result = await hedge_race(make_request(1, 'primary', log), make_request(0.01, 'hedge', log), 0.05)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == ('hedge', True, True)
+    assert log == ['primary cancelled']
+
+
+def test_failed_hedge_waits_for_primary():
+    log = []
+    result = asyncio.run(hedge_race(
+        make_request(0.1, 'primary', log), make_request(0, 'hedge', log, fail=True), 0.02
+    ))
+    assert result == ('primary', True, False)
+
+
+def test_tracker_delay_uses_percentile():
+    tracker = HedgeTracker({'min_samples': 10, 'percentile': 90, 'min_delay': 0, 'max_delay': 10})
+    assert tracker.delay() == tracker.config['initial_delay']
+    for i in range(100):
+        tracker.record(i / 100, fired=i % 10 == 0, won=i % 20 == 0)
+    assert tracker.delay() == 0.9
+    stats = tracker.stats()
+    assert stats['fired'] == 10 and stats['won'] == 5 and stats['win_rate'] == 0.5
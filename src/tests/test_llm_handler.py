@@ -0,0 +1,205 @@
+import os
+import sys
+import asyncio
+from types import SimpleNamespace
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+import pytest
+
+pytest.importorskip('openai')
+
+from src.llm.llm_handler import LLMHandler, ReplyStreamFilter
+
+
+@pytest.fixture
+def handler():
+    return LLMHandler({'api_key': 'test', 'structured_output': True})
+
+
+def tool_chunk(index, name=None, arguments=None):
+    call = SimpleNamespace(index=index, function=SimpleNamespace(name=name, arguments=arguments))
+    delta = SimpleNamespace(content=None, tool_calls=[call])
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=delta)])
+
+
+def test_reply_mentioning_score_is_reasked(handler, monkeypatch):
+    outcomes = [
+        {'text': '', 'score': None, 'reply': '根据您的描述可以评为3分。', 'filter': None},
+        {'text': '', 'score': None, 'reply': '这种情况持续多久了？', 'filter': None},
+    ]
+    calls = []
+
+    async def complete(messages, on_delta=None, item_id=None):
+        calls.append(messages[-1]['content'])
+        return outcomes[len(calls) - 1]
+
+    monkeypatch.setattr(handler, '_complete', complete)
+    result = asyncio.run(handler._evaluate_response('提示词', '睡不好', [], '最近睡眠怎么样？'))
+
+    assert result['data'] == '这种情况持续多久了？'
+    assert len(calls) == 2 and calls[1].startswith('画外音')
+
+
+def test_multiple_reply_calls_are_streamed_separately(handler, monkeypatch):
+    chunks = [
+        tool_chunk(0, 'reply', '{"text": "最近'),
+        tool_chunk(0, None, '睡得好吗"}'),
+        tool_chunk(1, 'reply', '{"text": "'),
+        tool_chunk(1, None, '白天呢？"}'),
+    ]
+
+    async def stream():
+        for chunk in chunks[1:]:
+            yield chunk
+
+    async def hedged_completion(messages, **kwargs):
+        return stream(), chunks[0], 0.0
+
+    monkeypatch.setattr(handler, '_hedged_completion', hedged_completion)
+    deltas = []
+    reply_filter = ReplyStreamFilter(lambda text, reset=False: deltas.append(text), LLMHandler.SCORE_KEYWORDS)
+    _, calls, _, _, _ = asyncio.run(handler._stream_completion([], reply_filter))
+
+    assert ''.join(deltas) == '最近睡得好吗白天呢？'
+    assert handler._parse_tool_calls(calls)[1] == '最近睡得好吗白天呢？'
+
+
+def content_chunk(text):
+    delta = SimpleNamespace(content=text, tool_calls=None)
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=delta)])
+
+
+def run_filter(chunks):
+    deltas = []
+    reply_filter = ReplyStreamFilter(lambda text, reset=False: deltas.append(text), LLMHandler.SCORE_KEYWORDS)
+    for chunk in chunks:
+        reply_filter.feed(chunk)
+    reply_filter.flush()
+    return ''.join(deltas), reply_filter
+
+
+def test_stream_filter_passes_plain_reply_through():
+    chunks = ['您最近', '睡眠怎么样', '？晚上', '大概几点入睡？']
+    text, reply_filter = run_filter(chunks)
+
+    assert text == ''.join(chunks)
+    assert not reply_filter.blocked
+
+
+@pytest.mark.parametrize('chunks', [
+    ['好的，我明白了。', '{"hamd01', '": 2}'],
+    ['好的，我明白了。｛', '"hamd01": 2｝'],
+    ['好的，我明白了。`', '`', '`json\n{"hamd01": 2}\n```'],
+])
+def test_stream_filter_holds_back_markers_split_across_chunks(chunks):
+    text, reply_filter = run_filter(chunks)
+
+    assert text == '好的，我明白了。'
+    assert reply_filter.blocked
+
+
+def test_stream_filter_holds_back_score_keyword_split_across_chunks():
+    text, reply_filter = run_filter(['根据您的描述，', '这一项可以评', '为2分。'])
+
+    assert text == '根据您的描述，这一项可以'
+    assert reply_filter.blocked
+
+
+def test_streamed_text_is_reset_when_response_is_a_score(handler, monkeypatch):
+    chunks = [content_chunk('好的，我明白了。'), content_chunk('{"hamd01": 2}')]
+
+    async def stream():
+        for chunk in chunks[1:]:
+            yield chunk
+
+    async def hedged_completion(messages, **kwargs):
+        return stream(), chunks[0], 0.0
+
+    monkeypatch.setattr(handler, '_hedged_completion', hedged_completion)
+    events = []
+    result = asyncio.run(handler._evaluate_response(
+        '提示词', '睡得不太好', on_delta=lambda text, reset=False: events.append((text, reset))
+    ))
+
+    assert result['type'] == 'score'
+    assert result['data'] == {'hamd01': 2}
+    # 先展示了 JSON 之前的文本，确定是评分后通知前端撤回
+    assert ''.join(text for text, reset in events if not reset) == '好的，我明白了。'
+    assert events[-1] == ('', True)
+
+
+def dialogue(turns):
+    history = []
+    for turn in range(turns):
+        history.append({'role': 'assistant', 'content': f'第{turn}轮：最近的睡眠和情绪怎么样？'})
+        history.append({'role': 'patient', 'content': f'第{turn}轮：晚上总是醒来，白天没精神，心情也很低落。'})
+    return history
+
+
+@pytest.fixture
+def compacting_handler(monkeypatch):
+    handler = LLMHandler({'api_key': 'test', 'history': {'token_budget': 20, 'keep_turns': 1}})
+    calls = []
+
+    async def summarize(previous_summary, entries, item_id=None):
+        calls.append((previous_summary, len(entries)))
+        return f'摘要{len(calls)}'
+
+    monkeypatch.setattr(handler, '_summarize', summarize)
+    handler.summary_calls = calls
+    return handler
+
+
+def test_compact_history_folds_only_new_entries(compacting_handler):
+    history = dialogue(3)
+    live, state = asyncio.run(compacting_handler._compact_history(history, None, 'hamd01'))
+
+    assert live == history[4:]
+    assert state == {'summary': '摘要1', 'covered': 4}
+
+    # 下一轮只把新增的较早对话并入已有摘要
+    history += dialogue(1)
+    live, state = asyncio.run(compacting_handler._compact_history(history, state, 'hamd01'))
+
+    assert live == history[6:]
+    assert state == {'summary': '摘要2', 'covered': 6}
+    assert compacting_handler.summary_calls == [(None, 4), ('摘要1', 2)]
+
+
+def test_compact_history_reuses_summary_within_budget(compacting_handler):
+    history = dialogue(3)
+    state = {'summary': '已有摘要', 'covered': 4}
+    live, new_state = asyncio.run(compacting_handler._compact_history(history, state, 'hamd01'))
+
+    # 未压缩的部分没有超过保留轮数，直接复用已有摘要
+    assert live == history[4:]
+    assert new_state is state
+    assert compacting_handler.summary_calls == []
+
+
+def test_compact_history_falls_back_when_summary_times_out(monkeypatch):
+    handler = LLMHandler({'api_key': 'test', 'history': {'token_budget': 20, 'keep_turns': 1, 'summary_timeout': 0.05}})
+
+    async def slow_summarize(previous_summary, entries, item_id=None):
+        await asyncio.sleep(5)
+
+    monkeypatch.setattr(handler, '_summarize', slow_summarize)
+    history = dialogue(3)
+    state = {'summary': '已有摘要', 'covered': 2}
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        result = await handler._compact_history(history, state, 'hamd01')
+        return result, loop.time() - started
+
+    (live, new_state), elapsed = asyncio.run(run())
+
+    # 超时后原样发送未压缩的历史，摘要状态保持不变
+    assert elapsed < 1
+    assert live == history[2:]
+    assert new_state is state
@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import urllib.request
+import urllib.error
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from src.tests.mock_llm_server import start_in_thread
+from src.llm.score_parser import parse_scores
+
+
+def post(base_url, body):
+    request = urllib.request.Request(
+        f"{base_url}/chat/completions",
+        data=json.dumps(body).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}
+    )
+    return urllib.request.urlopen(request, timeout=5)
+
+
+def interview(answers):
+    messages = [
+        {'role': 'system', 'content': '评估条目 hamd3 ...'},
+        {'role': 'assistant', 'content': '最近心情怎么样？'}
+    ]
+    for answer in answers:
+        messages.append({'role': 'user', 'content': answer})
+    return messages
+
+
+def test_follow_up_then_score():
+    server, base_url = start_in_thread({'ttft': (0, 0), 'token_delay': 0, 'score_after': 2, 'seed': 1})
+    try:
+        with post(base_url, {'model': 'mock', 'messages': interview(['不太好'])}) as response:
+            data = json.load(response)
+        assert parse_scores(data['choices'][0]['message']['content']) is None
+        assert data['usage']['prompt_tokens'] > 0
+
+        with post(base_url, {'model': 'mock', 'messages': interview(['不太好', '两周了'])}) as response:
+            data = json.load(response)
+        assert list(parse_scores(data['choices'][0]['message']['content'])) == ['hamd3']
+        # 同一系统提示词第二次出现时计为缓存命中
+        assert data['usage']['prompt_tokens_details']['cached_tokens'] > 0
+    finally:
+        server.shutdown()
+
+
+def test_streaming_with_usage():
+    server, base_url = start_in_thread({'ttft': (0, 0), 'token_delay': 0, 'score_after': 1})
+    try:
+        body = {'model': 'mock', 'messages': interview(['不太好']), 'stream': True,
+                'stream_options': {'include_usage': True}}
+        with post(base_url, body) as response:
+            lines = [line.decode('utf-8').strip() for line in response if line.strip()]
+        assert lines[-1] == 'data: [DONE]'
+        chunks = [json.loads(line[len('data: '):]) for line in lines[:-1]]
+        text = ''.join(c['choices'][0]['delta'].get('content') or '' for c in chunks if c['choices'])
+        assert parse_scores(text) is not None
+        assert chunks[-1]['usage']['completion_tokens'] > 0
+    finally:
+        server.shutdown()
+
+
+def test_fault_injection():
+    server, base_url = start_in_thread({'ttft': (0, 0), 'rate_429': 1.0, 'retry_after': 2})
+    try:
+        try:
+            post(base_url, {'model': 'mock', 'messages': interview(['不太好'])})
+            assert False, "应当返回 429"
+        except urllib.error.HTTPError as e:
+            assert e.code == 429
+            assert e.headers['Retry-After'] == '2'
+    finally:
+        server.shutdown()
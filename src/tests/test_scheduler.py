@@ -0,0 +1,191 @@
+import os
+import sys
+import asyncio
+import types
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+import pytest
+
+pytest.importorskip('openai')
+
+from src.llm import scheduler as scheduler_module
+from src.llm.scheduler import LLMScheduler, LLMUnavailableError
+
+
+def test_token_window_stays_bounded_without_tpm_limit(monkeypatch):
+    # 假时钟：每次调用前进 1 秒，token 窗口只应保留最近 60 秒的记录
+    clock = {'now': 0.0}
+    monkeypatch.setattr(scheduler_module, 'time', types.SimpleNamespace(monotonic=lambda: clock['now']))
+    scheduler = LLMScheduler({'tokens_per_minute': None})
+
+    async def request():
+        return 10
+
+    async def run():
+        for _ in range(500):
+            clock['now'] += 1
+            await scheduler.call(request, estimated_tokens=10, tokens_of=lambda tokens: tokens, deadline=1e12)
+
+    asyncio.run(run())
+
+    assert len(scheduler._token_window) <= 61
+    assert scheduler.stats()['tokens_last_minute'] <= 610
+    assert scheduler.counters['requests'] == 500
+
+
+async def settle():
+    """让排队中的任务都运行到下一个等待点"""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+class ServerError(Exception):
+    """模拟 openai 的 5xx 错误"""
+    status_code = 503
+
+
+def test_queued_requests_run_in_priority_order():
+    scheduler = LLMScheduler({'max_concurrency': 1, 'live_reserved': 0})
+    order = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def blocker():
+            await release.wait()
+
+        def request(name):
+            async def func():
+                order.append(name)
+            return func
+
+        holding = asyncio.ensure_future(scheduler.call(blocker, deadline=1e12))
+        await settle()
+        # 名额被占用时按 batch、synthetic、live 的顺序排队
+        waiting = [
+            asyncio.ensure_future(scheduler.call(request(name), priority=name, deadline=1e12))
+            for name in ('batch', 'synthetic', 'live')
+        ]
+        await settle()
+        assert scheduler.stats()['queued'] == {'live': 1, 'synthetic': 1, 'batch': 1}
+        release.set()
+        await asyncio.gather(holding, *waiting)
+
+    asyncio.run(run())
+
+    assert order == ['live', 'synthetic', 'batch']
+
+
+def test_live_reserved_slots_are_not_used_by_background_requests():
+    scheduler = LLMScheduler({'max_concurrency': 2, 'live_reserved': 1})
+
+    async def run():
+        release = asyncio.Event()
+
+        async def blocker():
+            await release.wait()
+
+        async def live():
+            return 'live'
+
+        first = asyncio.ensure_future(scheduler.call(blocker, priority='synthetic', deadline=1e12))
+        second = asyncio.ensure_future(scheduler.call(blocker, priority='batch', deadline=1e12))
+        await settle()
+        # 模拟请求占满了非预留名额，批量请求只能排队
+        assert scheduler.stats()['active'] == 1
+        assert scheduler.stats()['queued']['batch'] == 1
+
+        # 预留名额仍可供真实问诊使用
+        result = await asyncio.wait_for(scheduler.call(live, deadline=1e12), 1)
+        release.set()
+        await asyncio.gather(first, second)
+        return result
+
+    assert asyncio.run(run()) == 'live'
+    assert scheduler.stats()['active'] == 0
+
+
+def test_retryable_errors_back_off_and_retry(monkeypatch):
+    delays = []
+    monkeypatch.setattr(scheduler_module, 'random', types.SimpleNamespace(uniform=lambda low, high: high))
+    scheduler = LLMScheduler({'base_delay': 0.01, 'max_delay': 0.02})
+    attempts = []
+    retries = []
+
+    real_sleep = asyncio.sleep
+
+    async def record_sleep(delay):
+        delays.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(scheduler_module.asyncio, 'sleep', record_sleep)
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ServerError('server error')
+        return 'ok'
+
+    async def run():
+        return await scheduler.call(flaky, deadline=asyncio.get_running_loop().time() + 5,
+                                    on_retry=lambda: retries.append(1))
+
+    assert asyncio.run(run()) == 'ok'
+    assert len(attempts) == 3
+    assert len(retries) == 2
+    # 指数退避，且不超过 max_delay
+    assert delays == [0.01, 0.02]
+    assert scheduler.counters['retries'] == 2
+    assert scheduler.counters['failures'] == 0
+
+
+def test_retry_stops_when_backoff_would_pass_deadline(monkeypatch):
+    monkeypatch.setattr(scheduler_module, 'random', types.SimpleNamespace(uniform=lambda low, high: high))
+    scheduler = LLMScheduler({'base_delay': 1.0})
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        raise ServerError('server error')
+
+    async def run():
+        await scheduler.call(failing, deadline=asyncio.get_running_loop().time() + 0.2)
+
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(run())
+
+    # 下一次退避会超过截止时间，不再重试
+    assert len(attempts) == 1
+    assert scheduler.counters['retries'] == 0
+    assert scheduler.counters['failures'] == 1
+    assert scheduler.stats()['active'] == 0
+
+
+def test_queued_request_expires_at_deadline():
+    scheduler = LLMScheduler({'max_concurrency': 1, 'live_reserved': 0})
+
+    async def run():
+        release = asyncio.Event()
+
+        async def blocker():
+            await release.wait()
+
+        async def request():
+            return 'late'
+
+        holding = asyncio.ensure_future(scheduler.call(blocker, deadline=1e12))
+        await settle()
+        with pytest.raises(LLMUnavailableError):
+            await scheduler.call(request, deadline=asyncio.get_running_loop().time() + 0.05)
+        release.set()
+        await holding
+
+    asyncio.run(run())
+
+    assert scheduler.counters['failures'] == 1
+    assert scheduler.stats()['queued']['live'] == 0
+    assert scheduler.stats()['active'] == 0
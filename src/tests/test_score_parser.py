@@ -0,0 +1,67 @@
+import os
+import sys
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from src.llm.score_parser import ScoreExtractor, parse_scores
+
+
+def test_plain_and_fenced_json():
+    assert parse_scores('根据对话 {"hamd1": 2}') == {'hamd1': 2}
+    assert parse_scores('```json\n{"hamd1": 2}\n```') == {'hamd1': 2}
+
+
+def test_chinese_punctuation():
+    assert parse_scores('｛“hamd3”：1｝') == {'hamd3': 1}
+
+
+def test_multiple_objects_are_merged():
+    assert parse_scores('{"hamd1": 2} 以及 {"hamd2": 3}') == {'hamd1': 2, 'hamd2': 3}
+
+
+def test_malformed_input():
+    assert parse_scores('多余的右括号} {"hamd1": 1}') == {'hamd1': 1}
+    assert parse_scores('{ 未闭合 {"hamd1": 1}') == {'hamd1': 1}
+    assert parse_scores('{"hamd1": "2"}') is None
+    assert parse_scores('{"hamd1": true}') is None
+    assert parse_scores('没有评分') is None
+
+
+def test_braces_inside_strings():
+    assert parse_scores('{"hamd1": 1, "备注": "}{"}') is None
+    assert parse_scores('{"hamd1: 1}\n{"hamd2": 1}') == {'hamd2': 1}
+
+
+def test_unterminated_string_does_not_hide_later_scores():
+    # 字符串被换行打断后引号不再可信，与旧版解析器一样按花括号找到评分
+    text = '{"text": "line\nbreak {"} {"hamd12": 3}'
+    assert parse_scores(text) == {'hamd12': 3}
+    for size in (1, 4):
+        extractor = ScoreExtractor()
+        for i in range(0, len(text), size):
+            extractor.feed(text[i:i + size])
+        assert extractor.result() == {'hamd12': 3}
+    # 最外层对象闭合后恢复引号跟踪
+    assert parse_scores('{"a": "x\n"} {"hamd1": 1, "备注": "}{"}') is None
+
+
+def test_streaming_reports_on_closing_brace():
+    extractor = ScoreExtractor()
+    assert extractor.feed('好的，```json\n{"ham') == []
+    assert extractor.in_object
+    assert extractor.feed('d4": 2') == []
+    assert extractor.feed('}\n```') == [{'hamd4': 2}]
+    assert not extractor.in_object
+    assert extractor.result() == {'hamd4': 2}
+
+
+def test_streaming_matches_whole_text():
+    text = '说明{备注}```json\n{"hamd5": 2}\n```，另外｛“hamd6”：1｝'
+    for size in (1, 2, 3, 7):
+        extractor = ScoreExtractor()
+        for i in range(0, len(text), size):
+            extractor.feed(text[i:i + size])
+        assert extractor.result() == parse_scores(text) == {'hamd5': 2, 'hamd6': 1}
@@ -0,0 +1,43 @@
+import os
+import sys
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+from src.speech.sentence_splitter import SentenceSplitter
+
+
+def feed_all(splitter, deltas):
+    sentences = []
+    for delta in deltas:
+        sentences.extend(splitter.feed(delta))
+    return sentences
+
+
+def test_sentences_are_emitted_as_they_complete():
+    splitter = SentenceSplitter()
+
+    assert splitter.feed('最近睡眠怎么样') == []
+    assert splitter.feed('？晚上大概几点') == ['最近睡眠怎么样？']
+    assert feed_all(splitter, ['入睡；', '会早醒吗', '？']) == ['晚上大概几点入睡；']
+    assert splitter.flush() == '会早醒吗？'
+    assert splitter.flush() == ''
+
+
+def test_closing_quotes_and_short_sentences_stay_together():
+    splitter = SentenceSplitter(min_chars=4)
+
+    sentences = feed_all(splitter, ['嗯。', '您说“', '睡不好！”', '那白天呢？', '还有'])
+
+    assert sentences == ['嗯。您说“睡不好！”', '那白天呢？']
+    assert splitter.flush() == '还有'
+
+
+def test_reset_drops_pending_text():
+    splitter = SentenceSplitter()
+    splitter.feed('这句话还没说完')
+    splitter.reset()
+
+    assert splitter.feed('新的一句。好') == ['新的一句。']
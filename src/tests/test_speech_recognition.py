@@ -0,0 +1,35 @@
+import os
+import sys
+from types import SimpleNamespace
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+import pytest
+
+pytest.importorskip('faster_whisper')
+
+from src.speech import speech_recognition
+from src.speech.speech_recognition import supports_batch_decode
+
+
+def make_model(**overrides):
+    attributes = {
+        'hf_tokenizer': object(), 'feature_extractor': object(), 'encode': object(),
+        'get_prompt': object(), 'max_length': 448, 'model': SimpleNamespace(generate=object())
+    }
+    attributes.update(overrides)
+    return SimpleNamespace(**{name: value for name, value in attributes.items() if value is not None})
+
+
+def test_batch_decode_requires_whisper_internals(monkeypatch):
+    monkeypatch.setattr(speech_recognition, 'pad_or_trim', lambda features: features)
+
+    assert supports_batch_decode(make_model())
+    assert not supports_batch_decode(make_model(get_prompt=None))
+    assert not supports_batch_decode(make_model(model=SimpleNamespace()))
+
+    monkeypatch.setattr(speech_recognition, 'pad_or_trim', None)
+    assert not supports_batch_decode(make_model())
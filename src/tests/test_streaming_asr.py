@@ -0,0 +1,75 @@
+import os
+import sys
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+import numpy as np
+
+from src.speech.streaming_asr import StreamingASR
+
+RATE = 16000
+
+
+def tone(seconds, amplitude=0.3):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * 32767 * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+
+
+def silence(seconds):
+    rng = np.random.default_rng(0)
+    return rng.normal(0, 30, int(seconds * RATE)).astype(np.int16)
+
+
+class FakeRecognizer:
+    """记录送入解码的音频长度，每次返回一个固定片段"""
+
+    def __init__(self):
+        self.calls = []
+
+    def transcribe_segments(self, audio, beam_size=None, initial_prompt=None):
+        self.calls.append(len(audio) / RATE)
+        return [(0.0, len(audio) / RATE, '你好')]
+
+
+def make_streaming(recognizer):
+    return StreamingASR(recognizer, {'partial_interval': 0, 'min_new_audio': 0.4}, {'silero': False, 'padding': 0.1})
+
+
+def test_partial_decode_skips_silent_buffer():
+    recognizer = FakeRecognizer()
+    streaming = make_streaming(recognizer)
+    streaming.start('sid')
+
+    future = streaming.feed('sid', silence(3.0).tobytes())
+    assert future.result(timeout=5) is None
+    assert recognizer.calls == []
+    # 静音只保留末尾 holdback 的部分
+    assert len(streaming.sessions['sid'].snapshot()[0]) / RATE <= streaming.config['holdback']
+
+    future = streaming.feed('sid', tone(1.0).tobytes())
+    assert future.result(timeout=5) == '你好'
+    assert len(recognizer.calls) == 1
+
+
+def test_final_decode_trims_silence_and_rejects_empty_audio():
+    recognizer = FakeRecognizer()
+    streaming = make_streaming(recognizer)
+
+    streaming.start('silent')
+    streaming.sessions['silent'].chunks.append(silence(2.0))
+    assert streaming.finish('silent').result(timeout=5) == ''
+    assert recognizer.calls == []
+
+    streaming.start('speech')
+    streaming.sessions['speech'].chunks.append(np.concatenate([silence(1.0), tone(1.0), silence(1.0)]))
+    assert streaming.finish('speech').result(timeout=5) == '你好'
+    # 只解码裁剪后的语音部分
+    assert len(recognizer.calls) == 1
+    assert 1.0 <= recognizer.calls[0] <= 1.3
+
+    stats = streaming.stats()
+    assert stats['utterances'] == 2
+    assert stats['rejected'] == 1
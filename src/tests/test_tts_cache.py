@@ -0,0 +1,37 @@
+import os
+import sys
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+import pytest
+
+pytest.importorskip('edge_tts')
+
+from src.speech.text_to_speech import TTSCache
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = TTSCache(max_items=2)
+    cache.put('v', 'a', b'1')
+    cache.put('v', 'b', b'2')
+    assert cache.get('v', 'a') == b'1'
+    cache.put('v', 'c', b'3')
+
+    assert cache.get('v', 'b') is None
+    assert cache.get('v', 'a') == b'1'
+    assert cache.get('v', 'c') == b'3'
+    assert cache.stats()['entries'] == 2
+
+
+def test_disk_cache_survives_new_instance(tmp_path):
+    TTSCache(str(tmp_path)).put('v', '你好', b'mp3')
+
+    cache = TTSCache(str(tmp_path))
+    assert cache.get('v', '你好') == b'mp3'
+    assert cache.get('other', '你好') is None
+    assert cache.get('v', '你好', 'other-format') is None
+    stats = cache.stats()
+    assert stats['disk_hits'] == 1 and stats['misses'] == 2
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import sys
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+import pytest
+
+edge_tts = pytest.importorskip('edge_tts')
+
+from src.speech import tts_runtime
+from src.speech.tts_runtime import TTSRuntime
+
+
+class FakeCommunicate:
+    """不联网的假 edge-tts，记录同时进行的合成数"""
+    active = 0
+    peak = 0
+
+    def __init__(self, text, voice):
+        self.text = text
+
+    async def stream(self):
+        cls = FakeCommunicate
+        cls.active += 1
+        cls.peak = max(cls.peak, cls.active)
+        try:
+            yield {'type': 'WordBoundary'}
+            for _ in range(3):
+                await asyncio.sleep(0.01)
+                yield {'type': 'audio', 'data': self.text.encode('utf-8')}
+        finally:
+            cls.active -= 1
+
+
+@pytest.fixture
+def runtime(monkeypatch):
+    monkeypatch.setattr(tts_runtime.edge_tts, 'Communicate', FakeCommunicate)
+    FakeCommunicate.peak = 0
+    runtime = TTSRuntime({'max_concurrency': 2, 'chunk_bytes': 2})
+    yield runtime
+    runtime.close()
+
+
+def test_concurrency_is_bounded_and_metrics_recorded(runtime):
+    futures = [runtime.synthesize(f"t{i}", 'voice') for i in range(6)]
+
+    assert [future.result(timeout=5) for future in futures] == [f"t{i}".encode() * 3 for i in range(6)]
+    assert FakeCommunicate.peak == 2
+    stats = runtime.stats()
+    assert stats['completed'] == 6 and stats['in_flight'] == 0 and stats['queued'] == 0
+    assert stats['max_wait'] > 0 and stats['avg_synthesis'] > 0
+
+
+def test_chunks_are_forwarded_in_order(runtime):
+    chunks = []
+    audio = runtime.synthesize('ab', 'voice', on_chunk=chunks.append).result(timeout=5)
+
+    assert chunks == [b'ab', b'ab', b'ab']
+    assert b''.join(chunks) == audio
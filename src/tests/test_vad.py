@@ -0,0 +1,50 @@
+import os
+import sys
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
+
+import numpy as np
+
+from src.speech.vad import EndpointDetector, SpeechTrimmer
+
+RATE = 16000
+
+
+def tone(seconds, amplitude=0.3):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def silence(seconds):
+    rng = np.random.default_rng(0)
+    return (rng.normal(0, 0.001, int(seconds * RATE))).astype(np.float32)
+
+
+def test_trimmer_cuts_leading_and_trailing_silence():
+    trimmer = SpeechTrimmer({'silero': False, 'padding': 0.1})
+    audio = np.concatenate([silence(2.0), tone(1.0), silence(3.0)])
+    trimmed = trimmer.trim(audio)
+
+    assert 1.0 <= len(trimmed) / RATE <= 1.3
+    stats = trimmer.stats()
+    assert stats['rejected'] == 0
+    assert abs(stats['skipped_seconds'] - (6.0 - len(trimmed) / RATE)) < 1e-6
+
+
+def test_trimmer_rejects_silent_recording():
+    trimmer = SpeechTrimmer({'silero': False})
+    assert trimmer.trim(silence(2.0)) is None
+    assert trimmer.stats()['rejected'] == 1
+    assert trimmer.stats()['skipped_ratio'] == 1.0
+
+
+def test_endpoint_detected_after_trailing_silence():
+    detector = EndpointDetector({'end_silence': 0.6})
+    chunks = np.split(np.concatenate([silence(0.5), tone(1.0), silence(1.0)]), 10)
+    ended = [detector.update((chunk * 32767).astype(np.int16)) for chunk in chunks]
+
+    assert ended.count(True) == 1
+    assert ended.index(True) >= 8
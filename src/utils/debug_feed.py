@@ -0,0 +1,93 @@
+import queue
+import threading
+import time
+
+# 管理员调试频道的房间名
+DEBUG_ROOM = 'llm_debug'
+
+# 调试频道默认配置
+DEFAULT_DEBUG_CONFIG = {
+    'min_interval': 1.0,       # 同一会话两次推送之间的最小间隔（秒），间隔内的消息直接丢弃
+    'max_messages': 12,        # 每次最多推送的消息条数（保留系统提示词和最近的对话）
+    'max_chars': 500,          # 每条消息内容的最大字符数
+    'queue_size': 100,         # 待推送队列长度，满了直接丢弃
+}
+
+
+class LLMDebugFeed:
+    """仅管理员可见的 LLM 消息调试频道
+
+    LLM 调用发生在后台事件循环线程中，这里只做节流、截断并放入队列，
+    由 eventlet 协程统一推送到管理员房间。没有管理员订阅时不做任何处理。
+    """
+
+    def __init__(self, socketio, config=None):
+        self.socketio = socketio
+        self.config = {**DEFAULT_DEBUG_CONFIG, **(config or {})}
+        self._queue = queue.Queue(maxsize=self.config['queue_size'])
+        self._subscribers = set()
+        self._last_sent = {}
+        self._lock = threading.Lock()
+        self._drainer_started = False
+        self.counters = {'published': 0, 'throttled': 0, 'dropped': 0}
+
+    def subscribe(self, sid):
+        """记录订阅的管理员会话（加入 DEBUG_ROOM 由调用方完成）"""
+        with self._lock:
+            self._subscribers.add(sid)
+            start = not self._drainer_started
+            self._drainer_started = True
+        if start:
+            self.socketio.start_background_task(self._drain)
+
+    def unsubscribe(self, sid):
+        """取消订阅，会话断开时也调用"""
+        with self._lock:
+            self._subscribers.discard(sid)
+            self._last_sent.pop(sid, None)
+
+    def publish(self, sid, item_id, messages):
+        """记录一次 LLM 调用的消息列表（可在任意线程调用）"""
+        if not self._subscribers:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sent.get(sid, 0) < self.config['min_interval']:
+                self.counters['throttled'] += 1
+                return
+            self._last_sent[sid] = now
+        try:
+            self._queue.put_nowait({
+                'sid': sid,
+                'item_id': item_id,
+                'messages': self._truncate(messages),
+                'timestamp': time.time()
+            })
+            self.counters['published'] += 1
+        except queue.Full:
+            self.counters['dropped'] += 1
+
+    def _truncate(self, messages):
+        limit = self.config['max_messages']
+        if len(messages) > limit:
+            messages = messages[:1] + messages[-(limit - 1):]
+        result = []
+        for message in messages:
+            content = message.get('content')
+            if isinstance(content, list):
+                content = ''.join(part.get('text', '') for part in content if isinstance(part, dict))
+            content = content or ''
+            if len(content) > self.config['max_chars']:
+                content = content[:self.config['max_chars']] + f'…（共 {len(content)} 字）'
+            result.append({'role': message.get('role'), 'content': content})
+        return result
+
+    def _drain(self):
+        """在 eventlet 协程中把队列中的调试消息推送给管理员"""
+        while True:
+            try:
+                while True:
+                    self.socketio.emit('llm_debug', self._queue.get_nowait(), room=DEBUG_ROOM)
+            except queue.Empty:
+                pass
+            self.socketio.sleep(0.2)